@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+UpCloud API Read Cache
+Keeps slow, rarely-changing API answers (account, zones, plans, templates,
+prices) in a local JSON file so warm-start runs can skip those round-trips.
+"""
+
+import json
+import os
+import threading
+import time
+
+CACHE_FILE = '.upcloud_cache.json'
+
+# How long each cached read stays fresh, in seconds
+DEFAULT_TTLS = {
+    'get_account': 3600,
+    'get_zones': 86400,
+    'get_server_plans': 86400,
+    'get_server_sizes': 86400,
+    'get_prices': 86400,
+    'get_templates': 86400,
+}
+
+
+class ApiCache:
+    """TTL cache backed by a JSON file; every entry carries the time it was stored."""
+
+    def __init__(self, path=CACHE_FILE, namespace='default'):
+        self.path = path
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def get(self, key, ttl):
+        """Return the cached value for key if it is younger than ttl, else None."""
+        with self._lock:
+            entry = self._entries.get(self._key(key))
+            if entry is not None and time.time() - entry['stored_at'] < ttl:
+                self.hits += 1
+                return entry['value']
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store value under key and write the cache file."""
+        with self._lock:
+            self._entries[self._key(key)] = {'stored_at': time.time(), 'value': value}
+            self._save()
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key in this namespace when key is None."""
+        with self._lock:
+            if key is None:
+                prefix = f"{self.namespace}:"
+                self._entries = {k: v for k, v in self._entries.items() if not k.startswith(prefix)}
+            else:
+                self._entries.pop(self._key(key), None)
+            self._save()
+
+    def stats(self):
+        """Hit and miss counters for this process."""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable cache file {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        # Write to a temp file first so a crash never leaves a half-written cache
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️  Could not write cache file {self.path}: {e}")
+
+
+class CachedCloudManager:
+    """Wraps a CloudManager so the read calls in DEFAULT_TTLS are served from an ApiCache.
+
+    Every other attribute is passed straight through to the wrapped manager.
+    With refresh=True cached values are ignored (but still rewritten). Wrap
+    it around a Metrics-instrumented manager, not inside one, so that only
+    misses are recorded as API calls.
+    """
+
+    def __init__(self, manager, cache, ttls=None, refresh=False):
+        self.manager = manager
+        self.cache = cache
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.refresh = refresh
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def _cached(self, name, fetch):
+        if not self.refresh:
+            value = self.cache.get(name, self.ttls[name])
+            if value is not None:
+                return value
+        else:
+            self.cache.misses += 1
+        value = fetch()
+        self.cache.put(name, value)
+        return value
+
+    def get_account(self):
+        return self._cached('get_account', self.manager.get_account)
+
+    def get_zones(self):
+        return self._cached('get_zones', self.manager.get_zones)
+
+    def get_server_plans(self):
+        return self._cached('get_server_plans', self.manager.get_server_plans)
+
+    def get_server_sizes(self):
+        return self._cached('get_server_sizes', self.manager.get_server_sizes)
+
+    def get_prices(self):
+        return self._cached('get_prices', self.manager.get_prices)
+
+    def get_templates(self):
+        """Public templates as plain dicts (uuid, title, ...) so they can be cached."""
+        return self._cached(
+            'get_templates',
+            lambda: self.manager.api.get_request('/storage/template')['storages']['storage'],
+        )
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+UpCloud Declarative Apply
+Makes the account match a desired-state file instead of running one-shot
+create and delete commands. The file lists the servers that should exist:
+
+    {
+      "tag": "apply",
+      "page_version": "2024-06-01",
+      "servers": [
+        {"title": "web-1", "zone": "fi-hel1", "plan": "1xCPU-1GB"},
+        {"title": "web", "count": 3, "zone": "de-fra1"}
+      ]
+    }
+
+Servers are identified by title ("count" expands to web-1, web-2, ...).
+zone and plan default to SERVER_ZONE/SERVER_PLAN. page_version labels the
+content of web_page/; it defaults to a hash of web_page/, so editing the
+page is enough to roll it out. Each server's deployed version is kept in
+the inventory.
+
+The current state is read with one server list call and joined with the
+inventory, and a minimal diff is computed:
+
+- create: declared but missing
+- delete: tagged as managed by apply, but no longer declared
+- replace: zone or plan changed (delete, then create, since the title
+  identifies one server)
+- update: page_version changed (content pushed over SSH, see
+  rolling_update.py)
+
+Only servers carrying the tag in the inventory are ever replaced, updated
+or deleted. A server apply didn't create that holds a declared title is
+reported as a conflict and that title is left alone until it's renamed or
+removed by hand.
+
+The actions run concurrently in dependency order: a replacement's create
+waits for its delete, and plain deletes wait for every create so capacity
+is added before it's removed. An apply with nothing to change makes that
+one list call and nothing else.
+
+    python apply.py desired.json --dry-run
+    python apply.py desired.json
+    python apply.py --bench 1000,5000     # time the plan step
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_TAG = 'apply'
+
+
+def load_desired(path):
+    """The desired-state file as (tag, {title: {'title', 'zone', 'plan', 'page_version'}})."""
+    with open(path) as f:
+        document = json.load(f)
+    return parse_desired(document)
+
+
+def parse_desired(document):
+    """(tag, {title: server}) from a desired-state document; see the module docstring for the format."""
+    from deploy_upcloud import SERVER_ZONE, SERVER_PLAN
+    if isinstance(document, list):
+        document = {'servers': document}
+    tag = document.get('tag', DEFAULT_TAG)
+    default_version = document.get('page_version') or page_version()
+    desired = {}
+    for entry in document.get('servers', []):
+        if isinstance(entry, str):
+            entry = {'title': entry}
+        count = entry.get('count')
+        titles = [f"{entry['title']}-{n}" for n in range(1, count + 1)] if count else [entry['title']]
+        for title in titles:
+            if title in desired:
+                raise ValueError(f"{title} is declared twice")
+            desired[title] = {
+                'title': title,
+                'zone': entry.get('zone') or document.get('zone') or SERVER_ZONE,
+                'plan': entry.get('plan') or document.get('plan') or SERVER_PLAN,
+                'page_version': entry.get('page_version') or default_version,
+            }
+    return tag, desired
+
+
+def page_version(renderer=None):
+    """Short hash of web_page/, the default page_version."""
+    from cloud_init import CloudInitRenderer
+    return (renderer or CloudInitRenderer()).fingerprint()[:12]
+
+
+def current_state(manager, inventory, tag):
+    """[{'uuid', 'title', 'zone', 'plan', 'state', 'managed', 'page_version'}] from one list call."""
+    managed = {r['uuid'] for r in inventory.find(tag=tag)}
+    recorded = {r['uuid']: r for r in inventory.find()}
+    current = []
+    for server in manager.get_servers():
+        record = recorded.get(server.uuid)
+        current.append({
+            'uuid': server.uuid,
+            'title': server.title,
+            'zone': server.zone,
+            'plan': server.plan,
+            'state': server.state,
+            'managed': server.uuid in managed,
+            'page_version': record['page_version'] if record else None,
+            'server': server,
+        })
+    return current
+
+
+def plan(desired, current):
+    """The minimal list of actions turning current into desired, and the conflicts.
+
+    Each action is {'id', 'kind', 'title', 'after': [ids], 'reason'} plus
+    'spec' (create), 'uuid' (delete/update) and 'page_version'. Only
+    managed servers are touched; an unmanaged server holding a declared
+    title is returned as a conflict {'title', 'uuid', 'reason'} instead.
+    Returns (actions, conflicts).
+    """
+    by_title = {}
+    unmanaged = {}
+    for server in current:
+        if server['managed']:
+            by_title.setdefault(server['title'], []).append(server)
+        elif server['title'] in desired:
+            unmanaged.setdefault(server['title'], []).append(server)
+
+    actions = []
+    creates = []
+    conflicts = []
+
+    def add(kind, title, reason, after=(), **fields):
+        action = dict(id=f"{kind}:{title}:{len(actions)}", kind=kind, title=title, after=list(after),
+                      reason=reason, **fields)
+        actions.append(action)
+        return action
+
+    for title, want in desired.items():
+        spec = {'title': title, 'zone': want['zone'], 'plan': want['plan']}
+        candidates = by_title.pop(title, [])
+        if title in unmanaged:
+            # Leave the title alone: a create would duplicate it, and the server isn't ours to change
+            for server in unmanaged[title]:
+                conflicts.append({'title': title, 'uuid': server['uuid'],
+                                  'reason': "title is held by a server apply doesn't manage"})
+            continue
+        # Keep the server that already matches, if there's more than one
+        candidates.sort(key=lambda s: (s['zone'] != want['zone'] or s['plan'] != want['plan'],
+                                       s['page_version'] != want['page_version']))
+        for extra in candidates[1:]:
+            add('delete', title, "duplicate title", uuid=extra['uuid'])
+        if not candidates:
+            creates.append(add('create', title, "not deployed", spec=spec, page_version=want['page_version']))
+            continue
+        have = candidates[0]
+        if have['zone'] != want['zone'] or have['plan'] != want['plan']:
+            removal = add('delete', title, f"replacing {have['zone']}/{have['plan']}", uuid=have['uuid'])
+            creates.append(add('create', title, f"moving to {want['zone']}/{want['plan']}",
+                               after=[removal['id']], spec=spec, page_version=want['page_version']))
+        elif have['page_version'] != want['page_version']:
+            add('update', title, f"page {have['page_version'] or 'unknown'} → {want['page_version']}",
+                uuid=have['uuid'], page_version=want['page_version'])
+
+    # Whatever is left is managed but no longer declared; remove it once new capacity is up
+    create_ids = [action['id'] for action in creates]
+    for title, servers in by_title.items():
+        for server in servers:
+            add('delete', title, "no longer declared", after=create_ids, uuid=server['uuid'])
+    return actions, conflicts
+
+
+def execute(actions, handlers, workers=10):
+    """Run actions concurrently, each once everything in its 'after' list has succeeded.
+
+    handlers maps an action kind to a function(action) returning True on
+    success. Actions whose dependencies failed are skipped. Returns
+    {action id: 'done', 'failed' or 'skipped'}.
+    """
+    outcomes = {}
+    by_id = {action['id']: action for action in actions}
+    pending = {action['id']: len(action['after']) for action in actions}
+    dependents = {}
+    for action in actions:
+        for dependency in action['after']:
+            dependents.setdefault(dependency, []).append(action['id'])
+
+    def skip(action_id):
+        for dependent in dependents.get(action_id, []):
+            if dependent not in outcomes:
+                outcomes[dependent] = 'skipped'
+                skip(dependent)
+
+    def run(action):
+        try:
+            return bool(handlers[action['kind']](action))
+        except Exception as e:
+            print(f"   ❌ {action['kind']} {action['title']}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {pool.submit(run, by_id[action_id]): action_id
+                   for action_id, count in pending.items() if count == 0}
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                action_id = running.pop(future)
+                if not future.result():
+                    outcomes[action_id] = 'failed'
+                    skip(action_id)
+                    continue
+                outcomes[action_id] = 'done'
+                for dependent in dependents.get(action_id, []):
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0 and dependent not in outcomes:
+                        running[pool.submit(run, by_id[dependent])] = dependent
+    # Anything left waits on an action that isn't in the plan
+    for action_id in by_id:
+        outcomes.setdefault(action_id, 'skipped')
+    return outcomes
+
+
+class Applier:
+    """Carries out a plan with the deployer: fleet deploy steps, bulk cleanup and SSH content updates."""
+
+    def __init__(self, deployer, tag=DEFAULT_TAG, ssh_pool=None, probe=None, timeout=600):
+        self.deployer = deployer
+        self.manager = deployer.manager
+        self.inventory = deployer.inventory
+        self.tag = tag
+        self.ssh_pool = ssh_pool
+        self.probe = probe
+        self.timeout = timeout
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def handlers(self):
+        return {'create': self.create, 'delete': self.delete, 'update': self.update}
+
+    def remember(self, current):
+        """Keep the listed Server objects, so deletes need no extra lookup."""
+        self._servers = {server['uuid']: server['server'] for server in current}
+
+    def create(self, action):
+        spec = dict(action['spec'], tags=[self.tag])
+        result = self.deployer.deploy_one(spec, self.timeout)
+        if result['state'] != 'ready':
+            print(f"   ❌ create {action['title']} ({result['uuid']}, {result['ip']}): {result['state']}")
+            if result['uuid']:
+                # Don't leave a half-deployed server behind under a managed title
+                self.teardown(result['uuid'])
+            return False
+        self.inventory.update(result['uuid'], page_version=action['page_version'])
+        print(f"   ✅ created {action['title']} ({result['uuid']}, {result['ip']})")
+        return True
+
+    def teardown(self, uuid):
+        from cleanup_server import bulk_cleanup
+        record = self.inventory.get(uuid)
+        self.inventory.retag(uuid, remove=[self.tag])
+        servers, _ = self.inventory.reconcile(self.manager, [record])
+        if servers:
+            bulk_cleanup(self.manager, self.deployer.waiter, servers,
+                         metrics=self.deployer.metrics, inventory=self.inventory)
+
+    def delete(self, action):
+        from cleanup_server import bulk_cleanup
+        server = self._servers.get(action['uuid']) or self.manager.get_server(action['uuid'])
+        summary = bulk_cleanup(self.manager, self.deployer.waiter, [server],
+                               metrics=self.deployer.metrics, inventory=self.inventory)
+        print(f"   🗑️  deleted {action['title']} ({action['uuid']}): {action['reason']}")
+        return summary.get('deleted', 0) == 1
+
+    def update(self, action):
+        from rolling_update import SSHPool, build_bundle, server_files, update_server
+        from readiness import wait_until_ready
+        record = self.inventory.get(action['uuid'])
+        if not record['ip']:
+            record['ip'] = self.deployer.ips.ipv4(action['uuid'])
+        with self._lock:
+            if self.ssh_pool is None:
+                self.ssh_pool = SSHPool()
+        bundle, version = build_bundle(server_files(record, self.deployer.renderer))
+        outcome = update_server(self.ssh_pool, record, bundle, version)
+        probe = self.probe or (lambda ip: wait_until_ready(ip, timeout=60, check_ssh=False)['ready'])
+        if outcome == 'failed' or (outcome == 'updated' and not probe(record['ip'])):
+            return False
+        self.inventory.update(action['uuid'], page_version=action['page_version'])
+        print(f"   🔄 {action['title']}: page {outcome} ({action['page_version']})")
+        return True
+
+
+def apply(deployer, tag, desired, dry_run=False, workers=10, ssh_pool=None, probe=None):
+    """Plan and (unless dry_run) execute; returns (actions, outcomes, conflicts)."""
+    start_time = time.time()
+    current = current_state(deployer.manager, deployer.inventory, tag)
+    actions, conflicts = plan(desired, current)
+    counts = {kind: sum(1 for a in actions if a['kind'] == kind) for kind in ('create', 'update', 'delete')}
+    print(f"📋 {len(desired)} servers declared, {len(current)} in the account: "
+          f"{counts['create']} to create, {counts['update']} to update, {counts['delete']} to delete")
+    for action in actions:
+        print(f"   • {action['kind']} {action['title']} - {action['reason']}")
+    for conflict in conflicts:
+        print(f"   ❌ {conflict['title']} ({conflict['uuid']}): {conflict['reason']}; rename or remove it")
+    if dry_run or not actions:
+        if not actions and not conflicts:
+            print("✅ Nothing to do")
+        return actions, {}, conflicts
+
+    applier = Applier(deployer, tag=tag, ssh_pool=ssh_pool, probe=probe)
+    applier.remember(current)
+    outcomes = execute(actions, applier.handlers(), workers=workers)
+    done = sum(1 for outcome in outcomes.values() if outcome == 'done')
+    failed = sum(1 for outcome in outcomes.values() if outcome == 'failed')
+    skipped = sum(1 for outcome in outcomes.values() if outcome == 'skipped')
+    print(f"\n📊 Apply: {done} done, {failed} failed, {skipped} skipped, {len(conflicts)} conflicts "
+          f"in {time.time() - start_time:.1f}s")
+    return actions, outcomes, conflicts
+
+
+def bench(sizes, repeats=3):
+    """Time current_state() + plan() against the simulated API for each number of declared servers."""
+    import tempfile
+    from fake_upcloud import FakeCloudManager
+    from inventory import Inventory
+
+    print("⏱️  Apply Plan Benchmark (simulated API)")
+    print("=" * 50)
+    print(f"\n servers  no-op plan s  calls  10% changed plan s  actions")
+    for count in sizes:
+        manager = FakeCloudManager(api_latency=0)
+        inventory = Inventory(os.path.join(tempfile.mkdtemp(prefix='upcloud-apply-'), 'inventory.db'))
+        desired = {}
+        for n in range(count):
+            title = f"web-{n}"
+            server = manager.api.handle('POST', '/server', {'server': {
+                'title': title, 'hostname': f"{title}.example.com", 'zone': 'fi-hel1',
+                'plan': '1xCPU-1GB'}})['server']
+            inventory.add(server['uuid'], title, zone='fi-hel1', plan='1xCPU-1GB', tags=[DEFAULT_TAG],
+                          page_version='v1')
+            desired[title] = {'title': title, 'zone': 'fi-hel1', 'plan': '1xCPU-1GB', 'page_version': 'v1'}
+
+        def timed(want):
+            best = None
+            for _ in range(repeats):
+                manager.api.calls.clear()
+                start = time.perf_counter()
+                actions, conflicts = plan(want, current_state(manager, inventory, DEFAULT_TAG))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best, actions + conflicts, sum(manager.api.calls.values())
+
+        noop_seconds, noop_actions, calls = timed(desired)
+        if noop_actions:
+            raise RuntimeError(f"an unchanged desired state planned {len(noop_actions)} actions")
+        changed = dict(desired)
+        for n in range(0, count, 10):
+            title = f"web-{n}"
+            kind = (n // 10) % 3
+            if kind == 0:
+                del changed[title]
+            elif kind == 1:
+                changed[title] = dict(changed[title], page_version='v2')
+            else:
+                changed[title] = dict(changed[title], plan='2xCPU-4GB')
+        changed_seconds, actions, _ = timed(changed)
+        print(f" {count:>7}  {noop_seconds:>12.3f}  {calls:>5}  {changed_seconds:>18.3f}  {len(actions):>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make the account match a desired-state file")
+    parser.add_argument('desired', nargs='?', help="desired-state JSON file")
+    parser.add_argument('--dry-run', action='store_true', help="show the plan without changing anything")
+    parser.add_argument('--workers', type=int, default=10, help="actions run at a time (default 10)")
+    parser.add_argument('--bench', metavar='SIZES',
+                        help="benchmark the plan step for these numbers of declared servers, e.g. 1000,5000")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        bench([int(size) for size in args.bench.split(',')])
+        return
+    if not args.desired:
+        parser.error("give a desired-state file or --bench")
+
+    tag, desired = load_desired(args.desired)
+    from deploy_upcloud import UpCloudDeployer
+    deployer = UpCloudDeployer()
+    apply(deployer, tag, desired, dry_run=args.dry_run, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
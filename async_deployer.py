@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+UpCloud Async Deployer
+An asyncio counterpart to UpCloudDeployer for embedding in async services:
+create, wait, IP lookup, readiness and delete are all awaitable, and
+hundreds of provisioning flows can run on one event loop without a thread
+per server.
+
+Requests go through AsyncAPI (aiohttp): one pooled session, a semaphore
+bounding requests in flight, the same client-side rate limit and retry
+policy as transport.py. State waits share one poller, so any number of
+servers waiting to start costs one GET /server per poll.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+
+from upcloud_api import Server
+from upcloud_api.errors import UpCloudAPIError
+
+from transport import TokenBucket, IDEMPOTENT_METHODS, setting
+from deploy_upcloud import (DeployJournal, build_server_config, SERVER_ZONE, SERVER_PLAN,
+                            UBUNTU_22_04_TEMPLATE, UPCLOUD_USERNAME, UPCLOUD_PASSWORD)
+from cloud_init import CloudInitRenderer, BOOT_STAGES_PATH, boot_stage_seconds
+from servers import ServerInfo
+from readiness import wait_until_ready_async, fetch_text_async
+from metrics import Metrics
+
+API_ROOT = 'https://api.upcloud.com/1.3'
+
+
+class AsyncAPI:
+    """Async UpCloud API client on a pooled aiohttp session.
+
+    At most `concurrency` requests are in flight at once; 429s (and 5xx or
+    dropped connections on idempotent methods) are retried with jittered
+    exponential backoff, as in transport.Transport.
+    """
+
+    def __init__(self, username, password, timeout=60, concurrency=None, rate_limit=None,
+                 burst=None, max_retries=None, backoff=0.5, max_backoff=30.0, api_root=API_ROOT):
+        concurrency = setting('UPCLOUD_POOL_SIZE', concurrency)
+        rate_limit = setting('UPCLOUD_RATE_LIMIT', rate_limit)
+        burst = setting('UPCLOUD_RATE_BURST', burst)
+        max_retries = setting('UPCLOUD_MAX_RETRIES', max_retries)
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.token = f"Basic {credentials}"
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.api_root = api_root
+        self.retries = 0
+        self._session = None
+        self._semaphore = None
+
+    async def request(self, method, endpoint, body=None):
+        """Send one request; return the decoded JSON or raise UpCloudAPIError."""
+        import aiohttp
+
+        if self._session is None:
+            # Created on first use so they belong to the running event loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Authorization': self.token, 'User-Agent': 'upcloud-quickstart-async'})
+
+        attempt = 0
+        while True:
+            if self.limiter:
+                while not self.limiter.try_acquire():
+                    await asyncio.sleep(1 / self.limiter.rate)
+            try:
+                async with self._semaphore:
+                    async with self._session.request(method, f"{self.api_root}{endpoint}",
+                                                     json=body) as res:
+                        status = res.status
+                        retry_after = res.headers.get('Retry-After')
+                        text = await res.text()
+            except aiohttp.ClientConnectionError:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                await self._sleep(attempt)
+                attempt += 1
+                continue
+
+            retryable = status == 429 or (status >= 500 and method in IDEMPOTENT_METHODS)
+            if retryable and attempt < self.max_retries:
+                await self._sleep(attempt, retry_after)
+                attempt += 1
+                continue
+
+            data = json.loads(text) if text else {}
+            if status >= 400:
+                raise api_error(data)
+            return data
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _sleep(self, attempt, retry_after=None):
+        self.retries += 1
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        await asyncio.sleep(delay)
+
+
+def api_error(data):
+    """The UpCloudAPIError for an error response body (same rules as upcloud_api)."""
+    if data.get('type'):
+        return UpCloudAPIError(error_code=data.get('title'), error_message=f"Details: {json.dumps(data)}")
+    error = data.get('error', {})
+    return UpCloudAPIError(error_code=error.get('error_code'), error_message=error.get('error_message'))
+
+
+class AsyncStateWaiter:
+    """Waits for many servers' states with one shared GET /server poll loop."""
+
+    def __init__(self, api, min_interval=2.0, max_interval=15.0, jitter=0.2):
+        self.api = api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.polls = 0
+        self._waiting = {}  # uuid -> [(targets, future)]
+        self._task = None
+        self._wakeup = None
+
+    async def wait(self, uuid, targets, timeout=300):
+        """Wait for one of targets; return 'reached', 'error', 'missing' or 'timeout'."""
+        if isinstance(targets, str):
+            targets = (targets,)
+        future = asyncio.get_running_loop().create_future()
+        entry = (set(targets), future)
+        self._waiting.setdefault(uuid, []).append(entry)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        else:
+            # A new waiter shouldn't sit out a long backed-off interval
+            self._wakeup.set()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return 'timeout'
+        finally:
+            entries = self._waiting.get(uuid, [])
+            if entry in entries:
+                entries.remove(entry)
+            if not entries:
+                self._waiting.pop(uuid, None)
+
+    async def _run(self):
+        interval = self.min_interval
+        while self._waiting:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+                interval = self.min_interval
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                data = await self.api.request('GET', '/server')
+            except Exception as e:
+                print(f"⚠️  Error polling server states: {e}")
+                continue
+            self.polls += 1
+            states = {s['uuid']: s['state'] for s in data.get('servers', {}).get('server', [])}
+
+            changed = False
+            for uuid, entries in list(self._waiting.items()):
+                state = states.get(uuid)
+                for targets, future in list(entries):
+                    if future.done():
+                        continue
+                    if state in targets:
+                        future.set_result('reached')
+                    elif state is None:
+                        future.set_result('missing')
+                    elif state == 'error':
+                        future.set_result('error')
+                    else:
+                        continue
+                    changed = True
+            # Back off while nothing happens; poll promptly again after a change
+            interval = self.min_interval if changed else min(self.max_interval, interval * 1.5)
+
+
+class AsyncUpCloudDeployer(DeployJournal):
+    """Awaitable create / wait / IP lookup / readiness / delete for web servers.
+
+    Results match UpCloudDeployer: servers are upcloud_api Server objects,
+    readiness and fleet results are the same dicts, and with an inventory
+    servers are recorded and deploys go through the same journal, so a
+    deploy interrupted in either deployer is resumed by the next run of
+    either one. `readiness` replaces the network
+    readiness probe (e.g. with a simulator). profile is the cloud-init
+    profile, as for UpCloudDeployer.
+    """
+
+    def __init__(self, api, ssh_public_key='', renderer=None, inventory=None, metrics=None,
+                 readiness=None, min_interval=2.0, max_interval=15.0, profile='full'):
+        self.api = api
+        self.profile = profile
+        self.ssh_public_key = ssh_public_key
+        self.renderer = renderer or CloudInitRenderer()
+        self.inventory = inventory
+        self.metrics = metrics or Metrics('deploy')
+        self.readiness = readiness or wait_until_ready_async
+        self.waiter = AsyncStateWaiter(api, min_interval=min_interval, max_interval=max_interval)
+        self.golden_template = None
+        self.golden_zone = None
+        self._account_servers = None
+        self._account_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, key_file='upcloud_key.pub', **kwargs):
+        """Build a deployer from the .env credentials and the SSH public key file."""
+        if not UPCLOUD_USERNAME or not UPCLOUD_PASSWORD:
+            raise RuntimeError("UpCloud credentials not found; configure your .env file")
+        if not os.path.exists(key_file):
+            raise RuntimeError(f"SSH public key {key_file} not found; run: ssh-keygen -t rsa -b 4096 -f upcloud_key")
+        with open(key_file, 'r') as f:
+            ssh_public_key = f.read().strip()
+        return cls(AsyncAPI(UPCLOUD_USERNAME, UPCLOUD_PASSWORD), ssh_public_key, **kwargs)
+
+    async def close(self):
+        await self.api.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def create_server(self, title="UpCloud-WebServer", zone=None, plan=None, tags=()):
+        """Create a web server; return its Server object or None. tags are recorded in the inventory."""
+        zone = zone or SERVER_ZONE
+        plan = plan or SERVER_PLAN
+        golden_template = self.golden_template if zone == self.golden_zone else None
+        config = build_server_config(title, zone, plan, self.ssh_public_key, self.renderer,
+                                     golden_template, self.profile)
+        with self.metrics.phase('create'):
+            try:
+                data = await self._call('create_server', 'POST', '/server', {'server': config})
+            except UpCloudAPIError as e:
+                print(f"❌ Failed to create server {title}: {e}")
+                return None
+        server = Server._create_server_obj(data['server'], cloud_manager=None)
+        if self.inventory:
+            info = ServerInfo.from_api(server)
+            self.inventory.add(server.uuid, title, zone=zone, plan=plan, tags=tags, state=server.state,
+                               ip=info.ipv4, ipv6=info.ipv6,
+                               template=golden_template or UBUNTU_22_04_TEMPLATE)
+        return server
+
+    async def start_deploy(self, title="UpCloud-WebServer", zone=None, plan=None, tags=()):
+        """Create the server for this title, or take over the one an earlier run left in flight.
+
+        Same journal and resume rules as UpCloudDeployer.start_deploy() (see
+        DeployJournal). Returns (server, resumed_entry); the entry is None for
+        a new server.
+        """
+        entry = self.in_flight_entry(title)
+        if entry:
+            server = await self._resume(entry)
+            if server:
+                return server, entry
+
+        self.journal_requested(title, zone, plan)
+        server = await self.create_server(title, zone=zone, plan=plan, tags=tags)
+        self.journal_created(title, server)
+        return server, None
+
+    async def _resume(self, entry):
+        """The live server behind a journal entry, or None if there's nothing to resume."""
+        server_uuid = entry['uuid'] or self.adopt_orphan(entry, await self._list_account())
+        if not self.resumable(server_uuid):
+            return None
+        try:
+            server = await self.get_server(server_uuid)
+        except UpCloudAPIError as e:
+            if not self.forget_missing(server_uuid, e):
+                raise
+            return None
+        if server.state == 'stopped':
+            await self._call('server.start', 'POST', f'/server/{server_uuid}/start')
+        return server
+
+    async def _list_account(self):
+        """Every server on the account, listed once per run."""
+        async with self._account_lock:
+            if self._account_servers is None:
+                data = await self._call('get_servers', 'GET', '/server')
+                self._account_servers = [Server._create_server_obj(s, cloud_manager=None)
+                                         for s in data.get('servers', {}).get('server', [])]
+        return self._account_servers
+
+    async def get_server(self, uuid):
+        """The populated Server object (with IP addresses) for uuid."""
+        data = await self._call('get_server', 'GET', f'/server/{uuid}')
+        return Server._create_server_obj(data['server'], cloud_manager=None)
+
+    async def wait_for_server(self, uuid, timeout=300, details=True):
+        """Wait until the server is started; return its populated Server object or None.
+
+        With details=False no get_server() is made and True is returned
+        once it has started.
+        """
+        with self.metrics.phase('boot'):
+            outcome = await self.waiter.wait(uuid, 'started', timeout=timeout)
+        if outcome != 'reached':
+            print(f"❌ Server {uuid} didn't start: {outcome}")
+            return None
+        return await self.get_server(uuid) if details else True
+
+    async def get_server_ip(self, server):
+        """Public IPv4 address of a server (fetching it only if the object has no addresses)."""
+        with self.metrics.phase('ip_discovery'):
+            ip = ServerInfo.from_api(server).ipv4
+            if ip is None:
+                ip = ServerInfo.from_api(await self.get_server(server.uuid)).ipv4
+            return ip
+
+    async def wait_until_serving(self, server_ip, start_time, timeout=300):
+        """Wait until the page is served; same result dict as wait_until_ready()."""
+        with self.metrics.phase('readiness'):
+            return await self.readiness(server_ip, timeout=timeout, start_time=start_time)
+
+    async def boot_stage_timings(self, server_ip, start_time):
+        """Per-stage boot timings the 'fast' profile publishes; see UpCloudDeployer.boot_stage_timings()."""
+        return boot_stage_seconds(await fetch_text_async(server_ip, path=BOOT_STAGES_PATH) or '', start_time)
+
+    async def delete_server(self, uuid, timeout=300):
+        """Stop (if needed) and delete a server; True once it's gone."""
+        start_time = time.time()
+        try:
+            server = await self.get_server(uuid)
+            if server.state == 'maintenance':
+                await self.waiter.wait(uuid, ('started', 'stopped'), timeout=timeout)
+                server = await self.get_server(uuid)
+            if server.state == 'started':
+                await self._call('server.stop', 'POST', f'/server/{uuid}/stop',
+                                 {'stop_server': {'stop_type': 'soft', 'timeout': '60'}})
+                outcome = await self.waiter.wait(uuid, 'stopped', timeout=timeout)
+                if outcome == 'missing':
+                    return self._deleted(uuid, start_time)
+            await self._call('delete_server', 'DELETE', f'/server/{uuid}?storages=1')
+        except UpCloudAPIError as e:
+            if 'NOT_FOUND' in str(e.error_code):
+                return self._deleted(uuid, start_time)
+            print(f"❌ Failed to delete server {uuid}: {e}")
+            return False
+        return self._deleted(uuid, start_time)
+
+    async def deploy_one(self, spec, timeout=600):
+        """Create one server and wait for it to serve; same result dict as the sync fleet deploy."""
+        result = {
+            'title': spec['title'],
+            'zone': spec.get('zone') or SERVER_ZONE,
+            'plan': spec.get('plan') or SERVER_PLAN,
+            'uuid': None,
+            'ip': None,
+            'state': 'failed',
+        }
+        start_time = time.time()
+
+        server, resumed = await self.start_deploy(spec['title'], zone=spec.get('zone'), plan=spec.get('plan'),
+                                                  tags=spec.get('tags', ()))
+        result['create_seconds'] = round(time.time() - start_time, 2)
+        result['resumed'] = resumed is not None
+        if not server:
+            return result
+        result['uuid'] = server.uuid
+
+        # The create response already carries the addresses, so no get_server() is needed after the wait
+        if not await self.wait_for_server(server.uuid, timeout=timeout, details=False):
+            result['total_seconds'] = round(time.time() - start_time, 2)
+            return result
+
+        result['state'] = 'started'
+        result['api_started_seconds'] = round(time.time() - start_time, 2)
+        result['ip'] = await self.get_server_ip(server)
+        self.journal(spec['title'], 'ip' if result['ip'] else 'started', ip=result['ip'])
+        if result['ip']:
+            readiness = await self.wait_until_serving(result['ip'], start_time)
+            result.update(readiness)
+            result['total_seconds'] = round(time.time() - start_time, 2)
+            if readiness['ready']:
+                result['state'] = 'ready'
+                self.journal(spec['title'], 'ready')
+                if self.profile == 'fast':
+                    result.update(await self.boot_stage_timings(result['ip'], start_time))
+
+        if self.inventory:
+            # Like UpCloudDeployer.record_deploy(): 'started' only once it has served the page
+            fields = {'state': 'started'} if result['state'] == 'ready' else {}
+            self.inventory.update(server.uuid, ip=result['ip'], checked=time.time(),
+                                  timings={k: v for k, v in result.items() if k.endswith('_seconds')},
+                                  **fields)
+        return result
+
+    async def deploy_fleet(self, specs, timeout=600):
+        """Deploy every spec concurrently on this event loop; return (results, total_seconds)."""
+        start_time = time.time()
+        results = await asyncio.gather(*(self.deploy_one(spec, timeout) for spec in specs),
+                                       return_exceptions=True)
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"❌ Unexpected error deploying {specs[i]['title']}: {result}")
+                results[i] = {'title': specs[i]['title'], 'uuid': None, 'ip': None, 'state': 'failed'}
+        return results, time.time() - start_time
+
+    async def delete_servers(self, uuids, timeout=300):
+        """Delete many servers concurrently; return {uuid: deleted}."""
+        outcomes = await asyncio.gather(*(self.delete_server(uuid, timeout) for uuid in uuids))
+        return dict(zip(uuids, outcomes))
+
+    async def _call(self, name, method, endpoint, body=None):
+        start_time = time.time()
+        ok = False
+        try:
+            result = await self.api.request(method, endpoint, body)
+            ok = True
+            return result
+        finally:
+            self.metrics.record_call(name, time.time() - start_time, ok)
+
+    def _deleted(self, uuid, start_time):
+        self.metrics.record_phase('teardown', time.time() - start_time)
+        if self.inventory:
+            self.inventory.mark_deleted(uuid)
+        return True
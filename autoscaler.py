@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+UpCloud Autoscaler
+Grows and shrinks a fleet of web servers from measured load, reusing the
+fleet deploy to add servers and the bulk cleanup to remove them.
+
+Autoscaler is the decision engine and has no side effects: given the
+current size and a signal (requests per second and/or p95 latency) it
+returns a target size. It scales up when utilisation or latency is above
+the high mark, and down only when both have stayed below the low mark for
+down_stabilization seconds; the gap between the marks is the hysteresis.
+Separate cooldowns after every change keep it from flapping while new
+servers boot.
+
+FleetActuator converges the fleet to the target, one action at a time,
+in the background. The servers it manages carry the 'autoscaled' tag in
+the inventory, so it never touches anything else.
+
+The same engine runs offline against a recorded load trace and the
+simulated API, so it can be tuned without paying for servers:
+
+    python autoscaler.py simulate --trace load.csv
+    python autoscaler.py run --metrics-file health.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import threading
+import time
+
+from cleanup_server import bulk_cleanup
+
+DEFAULT_TAG = 'autoscaled'
+AUTOSCALE_TITLE = 'UpCloud-Auto'
+
+# Requests per second one 1xCPU-1GB server serves comfortably (see upcloud_cli.py loadtest)
+RPS_PER_SERVER = 400
+
+
+class Autoscaler:
+    """Decides the fleet size from a load signal, with hysteresis and cooldowns.
+
+    Utilisation is rps / (size * rps_per_server). Above scale_up_at (or with
+    p95 above p95_high_ms) the fleet grows to reach target_utilisation;
+    below scale_down_at (and p95 below p95_low_ms) it shrinks, but only after
+    that has held for down_stabilization seconds. up_cooldown and
+    down_cooldown are counted from the last change in either direction.
+    Times are whatever clock the caller passes as now.
+    """
+
+    def __init__(self, min_size=1, max_size=10, rps_per_server=RPS_PER_SERVER, target_utilisation=0.6,
+                 scale_up_at=0.8, scale_down_at=0.4, p95_high_ms=250, p95_low_ms=100,
+                 up_cooldown=180, down_cooldown=600, down_stabilization=300,
+                 max_step_up=4, max_step_down=1):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.rps_per_server = rps_per_server
+        self.target_utilisation = target_utilisation
+        self.scale_up_at = scale_up_at
+        self.scale_down_at = scale_down_at
+        self.p95_high_ms = p95_high_ms
+        self.p95_low_ms = p95_low_ms
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        self.down_stabilization = down_stabilization
+        self.max_step_up = max_step_up
+        self.max_step_down = max_step_down
+        self.last_change = None
+        self._low_since = None
+        self._low_targets = []
+
+    def needed(self, rps):
+        """Servers needed to serve rps at the target utilisation."""
+        return math.ceil(rps / (self.rps_per_server * self.target_utilisation))
+
+    def decide(self, now, current, signal):
+        """(target size, reason) for this signal; signal has optional 'rps' and 'p95_ms'."""
+        rps, p95 = signal.get('rps'), signal.get('p95_ms')
+        clamp = lambda size: max(self.min_size, min(self.max_size, size))
+        if current < self.min_size or current > self.max_size:
+            return clamp(current), "outside the size limits"
+
+        utilisation = rps / (current * self.rps_per_server) if rps is not None and current else None
+        hot = ((utilisation is not None and utilisation > self.scale_up_at)
+               or (p95 is not None and p95 > self.p95_high_ms))
+        cold = ((utilisation is None or utilisation < self.scale_down_at)
+                and (p95 is None or p95 < self.p95_low_ms)
+                and (utilisation is not None or p95 is not None))
+
+        if not cold:
+            self._low_since = None
+            self._low_targets = []
+        if hot:
+            target = max(self.needed(rps) if rps is not None else 0, current + 1)
+            target = clamp(min(target, current + self.max_step_up))
+            if target == current:
+                return current, "at max_size"
+            if self._cooling(now, self.up_cooldown):
+                return current, "scale-up cooldown"
+            return self._change(now, target, f"utilisation {_percent(utilisation)}, p95 {_ms(p95)}")
+
+        if cold:
+            target = clamp(self.needed(rps) if rps is not None else current - 1)
+            if self._low_since is None:
+                self._low_since = now
+            # Shrink to the largest size asked for during the stabilization window
+            self._low_targets = [(at, size) for at, size in self._low_targets
+                                 if now - at <= self.down_stabilization] + [(now, target)]
+            target = max(size for _, size in self._low_targets)
+            target = max(target, current - self.max_step_down)
+            if target >= current:
+                return current, "steady"
+            if now - self._low_since < self.down_stabilization:
+                return current, "waiting for load to stay low"
+            if self._cooling(now, self.down_cooldown):
+                return current, "scale-down cooldown"
+            return self._change(now, target, f"utilisation {_percent(utilisation)}, p95 {_ms(p95)}")
+
+        return current, "steady"
+
+    def _cooling(self, now, cooldown):
+        return self.last_change is not None and now - self.last_change < cooldown
+
+    def _change(self, now, target, reason):
+        self.last_change = now
+        self._low_since = None
+        self._low_targets = []
+        return target, reason
+
+
+def _percent(value):
+    return f"{value:.0%}" if value is not None else "n/a"
+
+
+def _ms(value):
+    return f"{value:.0f} ms" if value is not None else "n/a"
+
+
+class FleetActuator:
+    """Converges the tagged fleet to a target size, one action at a time, in the background.
+
+    Servers are added with the fleet deploy (tagged, failures torn down)
+    and removed newest first with the bulk cleanup.
+    """
+
+    def __init__(self, deployer, tag=DEFAULT_TAG, workers=10, title=AUTOSCALE_TITLE):
+        self.deployer = deployer
+        self.manager = deployer.manager
+        self.inventory = deployer.inventory
+        self.tag = tag
+        self.workers = workers
+        self.title = title
+        self.actions = []
+        self._thread = None
+        self._counter = 0
+
+    def members(self):
+        """Inventory records of the fleet, oldest first."""
+        return self.inventory.find(tag=self.tag)
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def converge(self, target):
+        """Start moving the fleet to target in the background; False if it's busy or already there."""
+        if self.busy:
+            return False
+        current = len(self.members())
+        if target == current:
+            return False
+        action = self._scale_up if target > current else self._scale_down
+        self._thread = threading.Thread(target=action, args=(abs(target - current),), daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _scale_up(self, count):
+        self.actions.append(('up', count, time.time()))
+        stamp = int(time.time())
+        specs = []
+        for _ in range(count):
+            self._counter += 1
+            specs.append({'title': f"{self.title}-{stamp}-{self._counter:03d}", 'tags': [self.tag]})
+        results, _ = self.deployer.deploy_fleet(specs, max_workers=self.workers)
+        failed = [self.inventory.get(r['uuid']) for r in results if r['uuid'] and r['state'] != 'ready']
+        if failed:
+            self._remove(failed)
+
+    def _scale_down(self, count):
+        self.actions.append(('down', count, time.time()))
+        self._remove(self.members()[-count:])
+
+    def _remove(self, records):
+        # Untag first so the fleet size drops right away
+        for record in records:
+            self.inventory.retag(record['uuid'], remove=[self.tag])
+        servers, _ = self.inventory.reconcile(self.manager, records, workers=self.workers)
+        if servers:
+            bulk_cleanup(self.manager, self.deployer.waiter, servers, workers=self.workers,
+                         metrics=self.deployer.metrics, inventory=self.inventory)
+
+
+def read_signal(path):
+    """The latest signal from a metrics file, or {} if there isn't one.
+
+    The file is JSON with 'rps' and/or 'p95_ms', or a monitor.py --json
+    report, whose fleet p95 is used.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if 'fleet' in data:
+        return {'rps': data.get('rps'), 'p95_ms': data['fleet'].get('p95_ms')}
+    return {'rps': data.get('rps'), 'p95_ms': data.get('p95_ms')}
+
+
+def run(autoscaler, actuator, signal, interval=30):
+    """The control loop: read the signal, decide, converge, every interval seconds until Ctrl+C."""
+    print(f"📈 Autoscaling '{actuator.tag}' between {autoscaler.min_size} and {autoscaler.max_size} "
+          f"servers (Ctrl+C to stop)")
+    try:
+        while True:
+            current = len(actuator.members())
+            if not actuator.busy:
+                reading = signal()
+                target, reason = autoscaler.decide(time.time(), current, reading)
+                if target != current and actuator.converge(target):
+                    print(f"   {'⬆️' if target > current else '⬇️'}  {current} → {target} servers ({reason})")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        actuator.wait()
+
+
+# Offline simulation
+
+def load_trace(path):
+    """[(seconds, rps)] from a CSV of 'seconds,rps' lines or a JSON list of [seconds, rps] pairs."""
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        trace = [(float(t), float(rps)) for t, rps in json.loads(text)]
+    else:
+        trace = []
+        for line in text.splitlines():
+            fields = line.split(',')
+            try:
+                trace.append((float(fields[0]), float(fields[1])))
+            except (ValueError, IndexError):
+                continue  # header or blank line
+    return sorted(trace)
+
+
+def synthetic_trace(hours=4, step=60, base=150, peak=1800):
+    """A day-shaped load curve compressed into `hours`, with a short spike two thirds of the way in."""
+    trace = []
+    for t in range(0, int(hours * 3600) + 1, step):
+        phase = t / (hours * 3600)
+        rps = base + (peak - base) * math.sin(math.pi * phase) ** 2
+        if 0.65 <= phase <= 0.68:
+            rps *= 1.6
+        trace.append((float(t), round(rps, 1)))
+    return trace
+
+
+def model_p95(rps, serving, rps_per_server, base_ms=20.0):
+    """p95 latency of `serving` servers at rps, from a simple queueing model (base_ms / (1 - utilisation))."""
+    if serving == 0:
+        return None
+    utilisation = rps / (serving * rps_per_server)
+    return base_ms / max(1 - utilisation, 0.02)
+
+
+def simulate(trace, autoscaler, time_scale=0.002, step=30, slo_ms=250, verbose=False):
+    """Replay a load trace against the simulated API; returns a summary and the per-step timeline.
+
+    The decision engine runs on trace time; the fake API runs on the real
+    clock scaled by time_scale, so a 60 s boot takes 0.12 s at the default.
+    The latency signal comes from model_p95 over the servers actually serving.
+    """
+    import tempfile
+    from benchmark import SimulatedDeployer, BOOT_SECONDS, STOP_SECONDS, SERVE_SECONDS
+    from fake_upcloud import FakeCloudManager
+    from inventory import Inventory
+
+    manager = FakeCloudManager(boot_seconds=BOOT_SECONDS * time_scale, stop_seconds=STOP_SECONDS * time_scale,
+                               serve_seconds=SERVE_SECONDS * time_scale, api_latency=0.2 * time_scale)
+    inventory = Inventory(os.path.join(tempfile.mkdtemp(prefix='upcloud-autoscale-'), 'inventory.db'))
+    deployer = SimulatedDeployer(manager, time_scale, inventory=inventory)
+    actuator = FleetActuator(deployer, workers=50)
+
+    output = None if verbose else io.StringIO()
+    with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+        actuator.converge(autoscaler.min_size)
+        actuator.wait()
+
+        timeline = []
+        start = time.time()
+        end = trace[-1][0]
+        index = 0
+        t = 0.0
+        while t <= end:
+            # Keep trace time in step with the simulated API's clock
+            time.sleep(max(0.0, start + t * time_scale - time.time()))
+            while index + 1 < len(trace) and trace[index + 1][0] <= t:
+                index += 1
+            rps = trace[index][1]
+            members = actuator.members()
+            serving = sum(1 for r in members if r['ip'] and manager.api.is_serving(r['ip']))
+            p95 = model_p95(rps, serving, autoscaler.rps_per_server)
+            target, reason = len(members), "busy"
+            if not actuator.busy:
+                target, reason = autoscaler.decide(t, len(members), {'rps': rps, 'p95_ms': p95})
+                actuator.converge(target)
+            timeline.append({'t': t, 'rps': rps, 'servers': len(members), 'serving': serving,
+                             'p95_ms': round(p95, 1) if p95 is not None else None,
+                             'target': target, 'reason': reason})
+            t += step
+        actuator.wait()
+
+    over_slo = [row for row in timeline if row['p95_ms'] is None or row['p95_ms'] > slo_ms]
+    summary = {
+        'steps': len(timeline),
+        'trace_hours': round(end / 3600, 2),
+        'server_hours': round(sum(row['servers'] for row in timeline) * step / 3600, 2),
+        'peak_servers': max(row['servers'] for row in timeline),
+        'scale_ups': sum(1 for a in actuator.actions if a[0] == 'up'),
+        'scale_downs': sum(1 for a in actuator.actions if a[0] == 'down'),
+        'minutes_over_slo': round(len(over_slo) * step / 60, 1),
+        'slo_ms': slo_ms,
+        'api_calls': manager.api.total_calls(),
+    }
+    return summary, timeline
+
+
+def print_simulation(summary, timeline, every=10):
+    print(f"\n{'trace':>8} {'rps':>7} {'servers':>8} {'serving':>8} {'p95 ms':>8} {'target':>7}  reason")
+    for row in timeline[::every]:
+        p95 = f"{row['p95_ms']:.0f}" if row['p95_ms'] is not None else '-'
+        print(f"{row['t'] / 60:>7.0f}m {row['rps']:>7.0f} {row['servers']:>8} {row['serving']:>8} "
+              f"{p95:>8} {row['target']:>7}  {row['reason']}")
+    print(f"\n📊 {summary['trace_hours']}h of trace: {summary['server_hours']} server-hours, "
+          f"peak {summary['peak_servers']} servers")
+    print(f"   {summary['scale_ups']} scale-ups, {summary['scale_downs']} scale-downs, "
+          f"{summary['minutes_over_slo']} min with p95 over {summary['slo_ms']} ms")
+    print(f"   {summary['api_calls']} simulated API calls")
+
+
+def _autoscaler(args):
+    return Autoscaler(min_size=args.min, max_size=args.max, rps_per_server=args.rps_per_server,
+                      p95_high_ms=args.p95_high, p95_low_ms=args.p95_low,
+                      up_cooldown=args.up_cooldown, down_cooldown=args.down_cooldown,
+                      down_stabilization=args.stabilization)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scale a fleet of web servers from measured load")
+    parser.add_argument('action', choices=['run', 'simulate'],
+                        help="scale the real fleet, or replay a load trace against the simulated API")
+    parser.add_argument('--min', type=int, default=1, help="fewest servers (default 1)")
+    parser.add_argument('--max', type=int, default=10, help="most servers (default 10)")
+    parser.add_argument('--rps-per-server', type=float, default=RPS_PER_SERVER,
+                        help=f"requests/second one server handles (default {RPS_PER_SERVER})")
+    parser.add_argument('--p95-high', type=float, default=250, help="scale up above this p95 (ms)")
+    parser.add_argument('--p95-low', type=float, default=100, help="allow scaling down below this p95 (ms)")
+    parser.add_argument('--up-cooldown', type=float, default=180, help="seconds after a change before scaling up")
+    parser.add_argument('--down-cooldown', type=float, default=600,
+                        help="seconds after a change before scaling down")
+    parser.add_argument('--stabilization', type=float, default=300,
+                        help="seconds load must stay low before scaling down")
+    parser.add_argument('--interval', type=float, default=30, help="seconds between decisions (run)")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="read rps/p95_ms (or a monitor.py --json report) from this file (run); "
+                             "without it the fleet is probed directly")
+    parser.add_argument('--tag', default=DEFAULT_TAG, help=f"inventory tag of the fleet (default {DEFAULT_TAG})")
+    parser.add_argument('--trace', metavar='PATH', help="load trace, CSV 'seconds,rps' or JSON (simulate); "
+                                                        "default is a synthetic 4-hour curve")
+    parser.add_argument('--time-scale', type=float, default=0.002,
+                        help="real seconds per trace second (simulate, default 0.002)")
+    parser.add_argument('--verbose', action='store_true', help="show the deploy/cleanup output (simulate)")
+    args = parser.parse_args(argv)
+
+    autoscaler = _autoscaler(args)
+    if args.action == 'simulate':
+        trace = load_trace(args.trace) if args.trace else synthetic_trace()
+        print(f"⏱️  Replaying {len(trace)} load samples ({trace[-1][0] / 3600:.1f}h) against the simulated API...")
+        summary, timeline = simulate(trace, autoscaler, time_scale=args.time_scale, verbose=args.verbose)
+        print_simulation(summary, timeline)
+        return summary
+
+    from deploy_upcloud import UpCloudDeployer
+    actuator = FleetActuator(UpCloudDeployer(), tag=args.tag)
+    if args.metrics_file:
+        signal = lambda: read_signal(args.metrics_file)
+    else:
+        import asyncio
+        from monitor import FleetMonitor
+        # A short window, so the signal follows the last few rounds only
+        monitor = FleetMonitor(actuator.inventory, window=4, find={'tag': args.tag})
+
+        def signal():
+            asyncio.run(monitor.probe_round())
+            return {'p95_ms': monitor.report()['fleet']['p95_ms']}
+    run(autoscaler, actuator, signal, interval=args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+UpCloud CLI Startup Benchmark
+Runs `python -X importtime upcloud_cli.py <command>` in a fresh interpreter
+and reports where the import time goes. Exits non-zero if the fast path
+pulls in a heavy dependency (upcloud_api, requests, dotenv) or goes over
+the --budget-ms import budget, so CI catches a stray top-level import.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upcloud_cli.py')
+
+# Modules that must never load for the fast commands
+HEAVY_MODULES = ('upcloud_api', 'requests', 'dotenv', 'urllib3')
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into a list of (module, self_us, cumulative_us)."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def heavy_modules(modules):
+    """Names of the HEAVY_MODULES (and their submodules) among parsed importtime modules."""
+    return sorted({name for name, _, _ in modules if name.split('.')[0] in HEAVY_MODULES})
+
+
+def measure(command, runs):
+    """Run `python -X importtime <command>` `runs` times; return (best wall ms, its modules)."""
+    best = None
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime'] + command,
+                              capture_output=True, text=True, cwd=os.path.dirname(CLI))
+        wall_ms = (time.perf_counter() - start_time) * 1000
+        if proc.returncode != 0:
+            raise SystemExit(f"❌ `{' '.join(command)}` failed:\n{proc.stdout}{proc.stderr}")
+        if best is None or wall_ms < best[0]:
+            best = (wall_ms, parse_importtime(proc.stderr))
+    return best
+
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Measure and guard the CLI's startup time")
+    parser.add_argument('command', nargs='*', default=['status'],
+                        help="CLI command to time, with its own options (default: status)")
+    parser.add_argument('--runs', type=int, default=5, help="take the fastest of this many runs")
+    parser.add_argument('--budget-ms', type=float, default=30.0,
+                        help="fail if our own imports take longer than this (0 = no budget)")
+    parser.add_argument('--top', type=int, default=10, help="show the slowest N imports")
+    # Options we don't know belong to the CLI command, e.g. `cleanup --dry-run`
+    args, command_options = parser.parse_known_args(argv)
+    args.command = args.command + command_options
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Whatever a bare interpreter imports (site, .pth hooks) isn't ours to optimise
+    baseline_ms, baseline = measure(['-c', 'pass'], args.runs)
+    wall_ms, modules = measure([CLI] + args.command, args.runs)
+    preloaded = {name for name, _, _ in baseline}
+    modules = [m for m in modules if m[0] not in preloaded]
+    total_ms = sum(self_us for _, self_us, _ in modules) / 1000
+
+    print(f"⏱️  Startup: upcloud_cli.py {' '.join(args.command)}")
+    print("=" * 50)
+    print(f"   Wall time (best of {args.runs}): {wall_ms:.1f} ms "
+          f"(bare interpreter: {baseline_ms:.1f} ms)")
+    print(f"   CLI import time: {total_ms:.1f} ms across {len(modules)} modules")
+    print(f"\n   Slowest imports (cumulative):")
+    top_level = [m for m in modules if '.' not in m[0]]
+    for name, _, cumulative_us in sorted(top_level, key=lambda m: -m[2])[:args.top]:
+        print(f"      {cumulative_us / 1000:7.1f} ms  {name}")
+
+    failures = []
+    heavy = heavy_modules(modules)
+    if heavy:
+        failures.append(f"heavy modules imported: {', '.join(heavy)}")
+    if args.budget_ms and total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+
+    if failures:
+        for failure in failures:
+            print(f"\n❌ {failure}")
+        return 1
+    print("\n✅ Fast path is within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
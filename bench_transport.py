@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+UpCloud Transport Benchmark
+Compares the stock upcloud_api HTTP layer (a new connection per request)
+with the pooled, rate-limited, retrying transport in transport.py,
+against a local HTTP stub that stands in for api.upcloud.com.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from upcloud_api.api import API
+from upcloud_api.errors import UpCloudAPIError
+
+from transport import PooledAPI, Transport
+
+SERVERS_RESPONSE = json.dumps({'servers': {'server': [
+    {'uuid': f'00000000-0000-4000-8000-{i:012d}', 'title': f'UpCloud-WebServer-{i:02d}',
+     'state': 'started', 'zone': 'fi-hel1'} for i in range(20)
+]}}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers GET /1.3/server, rejecting a fraction of requests with 429."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            throttled = random.random() < self.server.throttle_rate
+        if throttled:
+            body = json.dumps({'error': {'error_code': 'TOO_MANY_REQUESTS',
+                                         'error_message': 'Slow down'}}).encode()
+            self.send_response(429)
+        else:
+            body = SERVERS_RESPONSE
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency, throttle_rate):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = 0
+    server.latency = latency
+    server.throttle_rate = throttle_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(api, stub, calls, threads):
+    """Make `calls` GET /server requests from `threads` threads; return the measurements."""
+    stub.connections = 0
+    stub.requests = 0
+    failures = [0]
+
+    def one_call(_):
+        try:
+            api.get_request('/server')
+        except UpCloudAPIError:
+            failures[0] += 1
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one_call, range(calls)))
+    seconds = time.time() - start_time
+    return {
+        'seconds': round(seconds, 3),
+        'calls_per_second': round(calls / seconds, 1),
+        'connections_opened': stub.connections,
+        'http_requests': stub.requests,
+        'failed_calls': failures[0],
+    }
+
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Benchmark the pooled API transport")
+    parser.add_argument('--calls', type=int, default=500, help="API calls per run")
+    parser.add_argument('--threads', type=int, default=20, help="concurrent callers")
+    parser.add_argument('--latency', type=float, default=0.005, help="stub response latency, seconds")
+    parser.add_argument('--throttle-rate', type=float, default=0.05,
+                        help="fraction of requests the stub rejects with 429")
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help="client-side requests/second for the pooled run (0 = off)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    stub = start_stub(args.latency, args.throttle_rate)
+    api_root = f'http://127.0.0.1:{stub.server_address[1]}/1.3'
+
+    print("⏱️  UpCloud Transport Benchmark (local HTTP stub)")
+    print("=" * 50)
+    print(f"   {args.calls} calls from {args.threads} threads, "
+          f"{args.throttle_rate:.0%} of requests answered with 429")
+
+    stock = API('Basic c3R1YjpzdHVi', timeout=10)
+    stock.api_root = api_root
+    transport = Transport(pool_size=args.threads, rate_limit=args.rate_limit or None,
+                          burst=max(1, int(args.rate_limit)), backoff=0.05)
+    pooled = PooledAPI('Basic c3R1YjpzdHVi', timeout=10, transport=transport)
+    pooled.api_root = api_root
+
+    for name, api in (('stock', stock), ('pooled', pooled)):
+        result = run(api, stub, args.calls, args.threads)
+        print(f"\n   {name}:")
+        print(f"      Wall time: {result['seconds']:.2f}s ({result['calls_per_second']} calls/s)")
+        print(f"      Connections opened: {result['connections_opened']}")
+        print(f"      HTTP requests sent: {result['http_requests']}")
+        print(f"      Failed calls: {result['failed_calls']}")
+    print(f"\n   Pooled transport retries: {transport.retries}")
+
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
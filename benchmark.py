@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+UpCloud Offline Benchmark
+Runs the fleet deploy and the bulk cleanup against the simulated UpCloud
+API (fake_upcloud.py) at several fleet sizes and reports wall time, API
+calls and peak memory. No real servers are created.
+
+Simulated durations are scaled by --time-scale so a realistic 60 s boot
+takes 0.6 s at the default scale of 0.01.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+
+from fake_upcloud import FakeCloudManager, AsyncFakeAPI
+from async_deployer import AsyncUpCloudDeployer
+from deploy_upcloud import UpCloudDeployer, load_fleet_specs
+from cleanup_server import bulk_cleanup
+from state_waiter import StateWaiter
+from metrics import phase_method
+
+# Realistic (unscaled) timings, in seconds
+BOOT_SECONDS = 60.0
+STOP_SECONDS = 15.0
+SERVE_SECONDS = 45.0
+
+
+class SimulatedDeployer(UpCloudDeployer):
+    """UpCloudDeployer whose readiness probe asks the simulator instead of doing HTTP."""
+
+    def __init__(self, manager, time_scale, inventory=None):
+        super().__init__(manager=manager, ssh_public_key='ssh-rsa AAAA simulated', inventory=inventory)
+        self.time_scale = time_scale
+        self.waiter = scaled_waiter(self.manager, time_scale)
+
+    @phase_method('readiness')
+    def wait_until_serving(self, server_ip, start_time, timeout=300, verbose=True):
+        deadline = time.time() + timeout * self.time_scale
+        while time.time() < deadline:
+            if self.manager.api.is_serving(server_ip):
+                seconds = round(time.time() - start_time, 2)
+                return {'ready': True, 'http_200_seconds': seconds, 'ssh_up_seconds': seconds}
+            time.sleep(2 * self.time_scale)
+        return {'ready': False, 'http_200_seconds': None, 'ssh_up_seconds': None}
+
+
+def simulated_async_deployer(manager, time_scale, concurrency, inventory=None):
+    """AsyncUpCloudDeployer on the same simulated API, with a simulated readiness probe."""
+    async def readiness(server_ip, timeout=300, start_time=None):
+        deadline = time.time() + timeout * time_scale
+        while time.time() < deadline:
+            if manager.api.is_serving(server_ip):
+                seconds = round(time.time() - start_time, 2)
+                return {'ready': True, 'http_200_seconds': seconds, 'ssh_up_seconds': seconds}
+            await asyncio.sleep(2 * time_scale)
+        return {'ready': False, 'http_200_seconds': None, 'ssh_up_seconds': None}
+
+    return AsyncUpCloudDeployer(AsyncFakeAPI(manager.api, concurrency=concurrency), 'ssh-rsa AAAA simulated',
+                                inventory=inventory, readiness=readiness, min_interval=2 * time_scale,
+                                max_interval=15 * time_scale)
+
+
+def scaled_waiter(manager, time_scale):
+    """A StateWaiter whose intervals and initial guesses match the scaled clock."""
+    waiter = StateWaiter(manager, min_interval=2 * time_scale, max_interval=15 * time_scale)
+    for key in waiter.transition_seconds:
+        waiter.transition_seconds[key] *= time_scale
+    return waiter
+
+
+def run_size(count, args):
+    """Deploy and then clean up `count` simulated servers; return the measurements."""
+    scale = args.time_scale
+    manager = FakeCloudManager(
+        boot_seconds=BOOT_SECONDS * scale,
+        stop_seconds=STOP_SECONDS * scale,
+        serve_seconds=SERVE_SECONDS * scale,
+        api_latency=args.latency * scale,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit / scale if args.rate_limit else None,
+        seed=args.seed,
+    )
+    output = None if args.verbose else io.StringIO()
+    result = {'servers': count}
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+        specs = load_fleet_specs(count=count)
+        start_time = time.time()
+        if args.use_async:
+            deployer = simulated_async_deployer(manager, scale, args.workers)
+            results, _ = asyncio.run(deployer.deploy_fleet(specs, timeout=600 * scale))
+        else:
+            deployer = SimulatedDeployer(manager, scale)
+            results, _ = deployer.deploy_fleet(specs, max_workers=args.workers,
+                                               timeout=int(600 * scale) + 1)
+        result['deploy_seconds'] = round(time.time() - start_time, 3)
+        result['deploy_ready'] = sum(1 for r in results if r['state'] == 'ready')
+        result['deploy_api_calls'] = manager.api.total_calls()
+        _, result['deploy_peak_kib'] = (v // 1024 for v in tracemalloc.get_traced_memory())
+
+        tracemalloc.reset_peak()
+        calls_before = manager.api.total_calls()
+        start_time = time.time()
+        summary = bulk_cleanup(manager, scaled_waiter(manager, scale), manager.get_servers(),
+                               workers=args.workers, max_wait=300 * scale)
+        result['cleanup_seconds'] = round(time.time() - start_time, 3)
+        result['cleanup_deleted'] = summary['deleted']
+        result['cleanup_api_calls'] = manager.api.total_calls() - calls_before
+        _, result['cleanup_peak_kib'] = (v // 1024 for v in tracemalloc.get_traced_memory())
+    tracemalloc.stop()
+
+    result['api_calls_by_endpoint'] = dict(manager.api.calls)
+    result['api_rejected'] = dict(manager.api.rejected)
+    return result
+
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Benchmark deploy/cleanup against a simulated UpCloud API")
+    parser.add_argument('--sizes', default='1,10,100,1000', help="comma-separated fleet sizes")
+    parser.add_argument('--workers', type=int, default=50, help="max concurrent deployments/API calls")
+    parser.add_argument('--time-scale', type=float, default=0.01,
+                        help="multiply all simulated durations by this (default 0.01)")
+    parser.add_argument('--latency', type=float, default=0.3, help="simulated API latency, seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API calls that fail")
+    parser.add_argument('--rate-limit', type=float, help="simulated API rate limit, requests/second")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for simulated errors")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="deploy with AsyncUpCloudDeployer on one event loop instead of threads")
+    parser.add_argument('--json', metavar='PATH', help="also save the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="show the deploy/cleanup output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark at every requested size and print a table."""
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print("⏱️  UpCloud Offline Benchmark (simulated API)")
+    print("=" * 50)
+    print(f"   Time scale: {args.time_scale} (60 s boot = {BOOT_SECONDS * args.time_scale:.2f} s)")
+    print(f"   Workers: {args.workers}, API latency: {args.latency}s, error rate: {args.error_rate}")
+    print(f"   Deployer: {'async (one event loop)' if args.use_async else 'threaded'}")
+
+    results = []
+    header = (f"\n{'servers':>8} {'deploy s':>9} {'ready':>6} {'calls':>7} {'peak KiB':>9}"
+              f" {'cleanup s':>10} {'deleted':>8} {'calls':>7} {'peak KiB':>9}")
+    print(header)
+    for count in sizes:
+        r = run_size(count, args)
+        results.append(r)
+        print(f"{r['servers']:>8} {r['deploy_seconds']:>9.2f} {r['deploy_ready']:>6} "
+              f"{r['deploy_api_calls']:>7} {r['deploy_peak_kib']:>9} {r['cleanup_seconds']:>10.2f} "
+              f"{r['cleanup_deleted']:>8} {r['cleanup_api_calls']:>7} {r['cleanup_peak_kib']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\n📈 Results saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
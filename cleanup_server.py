@@ -5,11 +5,15 @@ This script helps you clean up (delete) servers created during testing.
 """
 
 import os
-import json
 import time
+import fnmatch
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from upcloud_api import CloudManager
-from upcloud_api.errors import UpCloudAPIError
+from state_waiter import StateWaiter
+from metrics import Metrics
+from inventory import Inventory, INVENTORY_FILE
 
 # Load environment variables
 load_dotenv()
@@ -17,95 +21,312 @@ load_dotenv()
 UPCLOUD_USERNAME = os.getenv('UPCLOUD_USERNAME')
 UPCLOUD_PASSWORD = os.getenv('UPCLOUD_PASSWORD')
 
-def main():
+# Per-run timing metrics
+METRICS_FILE = 'cleanup_metrics.json'
+
+# Learned state transition times, shared with deploy_upcloud.py
+STATE_TIMINGS_FILE = '.upcloud_state_timings.json'
+
+def stop_and_wait(waiter, server, indent="", max_wait=60):
+    """Stop a server if needed and wait until it can be deleted."""
+    print(f"{indent}📊 Current server state: {server.state}")
+    
+    if server.state == 'started':
+        print(f"{indent}⏹️  Stopping server...")
+        server.stop()
+        
+        # Wait for the server to actually stop
+        print(f"{indent}⏳ Waiting for server to stop...")
+        handle = waiter.watch(server.uuid, 'stopped', timeout=max_wait, from_state='started',
+                              on_poll=lambda h, state: print(f"{indent}   Server state: {state}"))
+        handle.wait()
+        
+        if handle.outcome == 'reached':
+            print(f"{indent}✅ Server has stopped! ({handle.elapsed:.0f}s)")
+        elif handle.outcome == 'error':
+            print(f"{indent}❌ Server is in error state")
+        elif handle.outcome == 'timeout':
+            print(f"{indent}⏰ Timeout waiting for server to stop. Attempting deletion anyway...")
+            
+    elif server.state == 'stopped':
+        print(f"{indent}✅ Server is already stopped!")
+        
+    elif server.state == 'maintenance':
+        print(f"{indent}⚠️  Server is in maintenance mode, waiting...")
+        waiter.wait(server.uuid, ('stopped', 'started'), timeout=max_wait, from_state='maintenance')
+        
+    else:
+        print(f"{indent}ℹ️  Server is in state: {server.state}")
+
+def delete_server(manager, waiter, server, metrics, inventory, indent=""):
+    """Interactively stop and delete one server, recording it in the inventory."""
+    from upcloud_api.errors import UpCloudAPIError
+    try:
+        with metrics.phase('teardown'):
+            stop_and_wait(waiter, server, indent=indent)
+            
+            time.sleep(2)  # Small additional buffer
+            
+            print(f"{indent}🗑️  Deleting server...")
+            manager.delete_server(server.uuid, delete_storages=True)
+        inventory.mark_deleted(server.uuid)
+        print(f"{indent}✅ Server deleted successfully!")
+        
+    except UpCloudAPIError as e:
+        print(f"{indent}❌ Failed to delete server: {e}")
+    except Exception as e:
+        print(f"{indent}❌ Unexpected error: {e}")
+
+def parse_age(text):
+    """Parse an age like '90s', '30m', '12h' or '2d' into seconds."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def select_servers(servers, title=None, zone=None, older_than=None):
+    """Filter servers by title glob, zone and minimum age in seconds."""
+    now = time.time()
+    selected = []
+    for server in servers:
+        if title and not fnmatch.fnmatch(server.title, title):
+            continue
+        if zone and server.zone != zone:
+            continue
+        if older_than is not None:
+            created = getattr(server, 'created', None)
+            # Never delete a server whose age we can't tell
+            if not created or now - float(created) < older_than:
+                continue
+        selected.append(server)
+    return selected
+
+def bulk_cleanup(manager, waiter, servers, workers=10, max_wait=300, metrics=None, inventory=None):
+    """Stop all servers at once and delete each one as soon as it has stopped.
+    
+    Stops are issued concurrently, the stop transitions share one waiter (one
+    get_servers() call per poll for all of them), and deletes are pipelined
+    from the waiter's completion callbacks. Deleted servers are marked as such
+    in the inventory, if one is given. Returns a summary dict.
+    """
+    start_time = time.time()
+    server_start = {}
+    results = {}
+    lock = threading.Lock()
+    all_done = threading.Event()
+    remaining = [len(servers)]
+    
+    if not servers:
+        all_done.set()
+    
+    def finish(server, outcome, error=None):
+        with lock:
+            results[server.uuid] = {
+                'title': server.title,
+                'outcome': outcome,
+                'error': error,
+                'seconds': round(time.time() - start_time, 2),
+            }
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                all_done.set()
+        if outcome == 'deleted' and metrics:
+            metrics.record_phase('teardown', time.time() - server_start[server.uuid])
+        if outcome == 'deleted' and inventory:
+            inventory.mark_deleted(server.uuid)
+        if outcome == 'deleted':
+            print(f"   ✅ Deleted {server.title} ({results[server.uuid]['seconds']:.1f}s)")
+        else:
+            print(f"   ❌ {server.title}: {error}")
+    
+    def delete(server):
+        try:
+            manager.delete_server(server.uuid, delete_storages=True)
+            finish(server, 'deleted')
+        except Exception as e:
+            finish(server, 'failed', f"delete failed: {e}")
+    
+    def on_stopped(server, handle):
+        if handle.outcome == 'reached' and 'started' in handle.targets and handle.server.state == 'started':
+            # Came out of maintenance running; it still needs stopping
+            pool.submit(stop, server)
+        elif handle.outcome in ('reached', 'timeout'):
+            # Like the interactive mode, attempt deletion even after a stop timeout
+            pool.submit(delete, server)
+        elif handle.outcome == 'missing':
+            finish(server, 'deleted')
+        else:
+            finish(server, 'failed', f"server is in {handle.outcome} state")
+    
+    def stop(server):
+        try:
+            server.stop()
+            handle = waiter.watch(server.uuid, 'stopped', timeout=max_wait, from_state='started')
+        except Exception as e:
+            finish(server, 'failed', f"stop failed: {e}")
+            return
+        handle.add_done_callback(lambda h: on_stopped(server, h))
+    
+    def start(server):
+        server_start[server.uuid] = time.time()
+        try:
+            if server.state == 'stopped':
+                delete(server)
+            elif server.state == 'maintenance':
+                handle = waiter.watch(server.uuid, ('stopped', 'started'), timeout=max_wait,
+                                      from_state='maintenance')
+                handle.add_done_callback(lambda h: on_stopped(server, h))
+            else:
+                stop(server)
+        except Exception as e:
+            # Every server must reach finish(), or all_done is never set
+            finish(server, 'failed', f"teardown failed: {e}")
+    
+    print(f"\n🧹 Tearing down {len(servers)} servers ({workers} API calls at a time)...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for server in servers:
+            pool.submit(start, server)
+        all_done.wait()
+    
+    total_seconds = time.time() - start_time
+    if metrics:
+        metrics.record_phase('bulk_teardown', total_seconds)
+    deleted = [r for r in results.values() if r['outcome'] == 'deleted']
+    failed = [r for r in results.values() if r['outcome'] != 'deleted']
+    summary = {
+        'selected': len(servers),
+        'deleted': len(deleted),
+        'failed': len(failed),
+        'total_seconds': round(total_seconds, 2),
+        'servers_per_minute': round(len(deleted) / total_seconds * 60, 1) if total_seconds else 0.0,
+        'state_polls': waiter.polls,
+        'failures': failed,
+    }
+    
+    print(f"\n📊 Cleanup summary:")
+    print(f"   Deleted: {summary['deleted']}/{summary['selected']}")
+    print(f"   Failed: {summary['failed']}")
+    print(f"   Wall-clock: {summary['total_seconds']:.1f}s ({summary['servers_per_minute']} servers/min)")
+    for failure in failed:
+        print(f"   ❌ {failure['title']}: {failure['error']}")
+    return summary
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Clean up UpCloud servers")
+    parser.add_argument('--bulk', action='store_true',
+                        help="non-interactive: delete every server matching the filters")
+    parser.add_argument('--title', default='UpCloud-WebServer*', help="title glob (bulk mode)")
+    parser.add_argument('--tag', help="only servers with this tag (bulk mode)")
+    parser.add_argument('--zone', help="only servers in this zone (bulk mode)")
+    parser.add_argument('--older-than', type=parse_age,
+                        help="only servers older than this, e.g. 30m, 12h, 2d (bulk mode)")
+    parser.add_argument('--workers', type=int, default=10, help="max concurrent API calls (bulk mode)")
+    parser.add_argument('--dry-run', action='store_true', help="show what would be deleted (bulk mode)")
+    parser.add_argument('--scan', action='store_true',
+                        help="search the whole account, not just servers in the local inventory")
+    parser.add_argument('--prometheus', metavar='PATH',
+                        help="also write timing metrics as a Prometheus textfile")
+    return parser.parse_args(argv)
+
+def find_servers(manager, inventory, args):
+    """Servers matching the filters: inventory lookup plus one API call per match.
+    
+    With --scan the whole account is listed and filtered instead, which also
+    finds servers that were never recorded in the inventory.
+    """
+    if not args.scan:
+        records = inventory.find(title=args.title, zone=args.zone, tag=args.tag,
+                                 older_than=args.older_than)
+        servers, _ = inventory.reconcile(manager, records, workers=args.workers)
+        print(f"📄 {len(records)} matches in {INVENTORY_FILE}, {len(servers)} still exist")
+        return servers
+    
+    # Tag filtering is done server-side so fewer servers come back
+    servers = manager.get_servers(tags_has_one=[args.tag]) if args.tag else manager.get_servers()
+    return select_servers(servers, title=args.title, zone=args.zone, older_than=args.older_than)
+
+def main_bulk(manager, waiter, inventory, args, metrics):
+    """Non-interactive bulk cleanup of all servers matching the filters."""
+    try:
+        servers = find_servers(manager, inventory, args)
+    except Exception as e:
+        print(f"❌ Error listing servers: {e}")
+        return
+    
+    print(f"\n🖥️  {len(servers)} servers match the filters:")
+    for server in servers:
+        print(f"   • {server.title} ({server.uuid}) - {server.state} - {server.zone}")
+    
+    if args.dry_run or not servers:
+        return
+    
+    bulk_cleanup(manager, waiter, servers, workers=args.workers, metrics=metrics, inventory=inventory)
+
+def main(argv=None):
     """Main cleanup function."""
     print("🧹 UpCloud Server Cleanup Script")
     print("=" * 40)
     
+    args = parse_args(argv)
+    metrics = Metrics('cleanup')
+    try:
+        cleanup(args, metrics)
+    finally:
+        if metrics.has_data():
+            metrics.save(METRICS_FILE, prometheus_path=args.prometheus)
+
+def cleanup(args, metrics):
+    """Interactive cleanup, or bulk cleanup with --bulk."""
     if not UPCLOUD_USERNAME or not UPCLOUD_PASSWORD:
         print("❌ Error: UpCloud credentials not found!")
         print("Please make sure your .env file is configured.")
         return
     
+    # The API client (upcloud_api, requests) is only loaded once there are credentials to use it with
+    from transport import create_cloud_manager
     try:
-        manager = CloudManager(UPCLOUD_USERNAME, UPCLOUD_PASSWORD)
+        manager = metrics.instrument(create_cloud_manager(UPCLOUD_USERNAME, UPCLOUD_PASSWORD))
+        waiter = StateWaiter(manager, timings_file=STATE_TIMINGS_FILE)
         print("✅ Connected to UpCloud API")
     except Exception as e:
         print(f"❌ Failed to connect to UpCloud API: {e}")
         return
     
-    # Check for deployed server info
-    if os.path.exists('deployed_server.json'):
-        print("\n📄 Found deployed_server.json")
-        with open('deployed_server.json', 'r') as f:
-            server_info = json.load(f)
-        
-        print(f"   Server UUID: {server_info['uuid']}")
-        print(f"   Title: {server_info['title']}")
-        print(f"   IP: {server_info['ip']}")
-        print(f"   Created: {server_info['created']}")
+    inventory = Inventory(INVENTORY_FILE)
+    if args.bulk:
+        main_bulk(manager, waiter, inventory, args, metrics)
+        return
+    
+    # Servers we've deployed, from the local inventory
+    records = inventory.find()
+    if records:
+        print(f"\n📄 Found {len(records)} deployed servers in {INVENTORY_FILE}")
+        try:
+            servers, _ = inventory.reconcile(manager, records)
+        except Exception as e:
+            print(f"❌ Error checking servers: {e}")
+            servers = []
         
-        response = input(f"\n❓ Delete server {server_info['title']} ({server_info['uuid']})? (y/N): ").strip().lower()
-        if response == 'y':
-            try:
-                # Get server object and check its current state
-                server = manager.get_server(server_info['uuid'])
-                print(f"📊 Current server state: {server.state}")
-                
-                if server.state == 'started':
-                    print("⏹️  Stopping server...")
-                    server.stop()
-                    
-                    # Wait for the server to actually stop
-                    print("⏳ Waiting for server to stop...")
-                    max_wait = 60  # Maximum wait time in seconds
-                    wait_time = 0
-                    while wait_time < max_wait:
-                        time.sleep(5)
-                        wait_time += 5
-                        
-                        # Check server state
-                        server = manager.get_server(server_info['uuid'])
-                        print(f"   Server state: {server.state}")
-                        
-                        if server.state == 'stopped':
-                            print("✅ Server has stopped!")
-                            break
-                        elif server.state == 'error':
-                            print("❌ Server is in error state")
-                            break
-                    
-                    if wait_time >= max_wait:
-                        print("⏰ Timeout waiting for server to stop. Attempting deletion anyway...")
-                        
-                elif server.state == 'stopped':
-                    print("✅ Server is already stopped!")
-                    
-                elif server.state == 'maintenance':
-                    print("⚠️  Server is in maintenance mode, waiting...")
-                    time.sleep(10)
-                    
-                else:
-                    print(f"ℹ️  Server is in state: {server.state}")
-                
-                time.sleep(2)  # Small additional buffer
-                
-                # Delete server
-                print("🗑️  Deleting server...")
-                manager.delete_server(server_info['uuid'])
-                
-                print("✅ Server deleted successfully!")
-                
-                # Remove the server info file
-                os.remove('deployed_server.json')
-                print("✅ Cleaned up deployed_server.json")
-                
-            except UpCloudAPIError as e:
-                print(f"❌ Failed to delete server: {e}")
-            except Exception as e:
-                print(f"❌ Unexpected error: {e}")
-        else:
-            print("❌ Server deletion cancelled")
+        for server in servers:
+            record = inventory.get(server.uuid)
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['created']))
+            print(f"\n   Server UUID: {server.uuid}")
+            print(f"   Title: {server.title}")
+            print(f"   IP: {record['ip']}")
+            print(f"   Created: {created}")
+            
+            response = input(f"\n❓ Delete server {server.title} ({server.uuid})? (y/N): ").strip().lower()
+            if response == 'y':
+                delete_server(manager, waiter, server, metrics, inventory)
+            else:
+                print("❌ Server deletion cancelled")
+    
+    if records and not args.scan:
+        print(f"\n💡 Run with --scan to also look for servers that aren't in {INVENTORY_FILE}")
+        print("\n🎉 Cleanup complete!")
+        return
     
     # List all servers for manual cleanup
     print("\n🖥️  Listing all your servers:")
@@ -121,55 +342,7 @@ def main():
                 if 'UpCloud-WebServer' in server.title:
                     response = input(f"     ❓ Delete this server? (y/N): ").strip().lower()
                     if response == 'y':
-                        try:
-                            print(f"     📊 Current server state: {server.state}")
-                            
-                            if server.state == 'started':
-                                print("     ⏹️  Stopping server...")
-                                server.stop()
-                                
-                                # Wait for the server to actually stop
-                                print("     ⏳ Waiting for server to stop...")
-                                max_wait = 60  # Maximum wait time in seconds
-                                wait_time = 0
-                                while wait_time < max_wait:
-                                    time.sleep(5)
-                                    wait_time += 5
-                                    
-                                    # Check server state
-                                    server = manager.get_server(server.uuid)
-                                    print(f"        Server state: {server.state}")
-                                    
-                                    if server.state == 'stopped':
-                                        print("     ✅ Server has stopped!")
-                                        break
-                                    elif server.state == 'error':
-                                        print("     ❌ Server is in error state")
-                                        break
-                                
-                                if wait_time >= max_wait:
-                                    print("     ⏰ Timeout waiting for server to stop. Attempting deletion anyway...")
-                                    
-                            elif server.state == 'stopped':
-                                print("     ✅ Server is already stopped!")
-                                
-                            elif server.state == 'maintenance':
-                                print("     ⚠️  Server is in maintenance mode, waiting...")
-                                time.sleep(10)
-                                
-                            else:
-                                print(f"     ℹ️  Server is in state: {server.state}")
-                            
-                            time.sleep(2)  # Small additional buffer
-                            
-                            print("     🗑️  Deleting server...")
-                            manager.delete_server(server.uuid)
-                            print("     ✅ Server deleted!")
-                            
-                        except UpCloudAPIError as e:
-                            print(f"     ❌ Failed to delete server: {e}")
-                        except Exception as e:
-                            print(f"     ❌ Unexpected error: {e}")
+                        delete_server(manager, waiter, server, metrics, inventory, indent="     ")
                             
     except Exception as e:
         print(f"❌ Error listing servers: {e}")
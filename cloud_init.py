@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+UpCloud Cloud-Init Rendering
+Builds the user_data for new servers from the files in web_page/ and a
+few per-deploy variables ({{zone}}, {{plan}}, {{title}}, {{hostname}}).
+
+Every file is written by cloud-init from a gzip+base64 blob, which keeps
+user_data small and well under the metadata size limit. Rendered files
+and whole documents are cached by content hash, so a fleet renders each
+distinct page once and every server reuses the same bytes.
+
+The 'performance' profile also writes an nginx.conf sized to the plan's
+CPUs and memory (see nginx_tuning()) and pre-compresses the page so
+nginx can serve the .gz files directly.
+
+The 'fast' profile gets nginx serving as early as possible: packages come
+from the zone's local mirror ({{mirror}}), only nginx is installed before
+the page goes live, and the full upgrade runs afterwards in the
+background. Each stage appends a timestamp to BOOT_STAGES_PATH, which the
+deployer reads over HTTP.
+"""
+
+import base64
+import gzip
+import hashlib
+import os
+import re
+import threading
+from string import Template
+
+PAGE_DIR = 'web_page'
+WEB_ROOT = '/var/www/html'
+
+# Files with these suffixes get {{variable}} substitution; everything else is copied as is
+TEXT_SUFFIXES = ('.html', '.htm', '.css', '.js', '.txt', '.json', '.svg', '.xml')
+
+VARIABLE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# Per-stage boot timestamps ("<stage> <epoch seconds>" lines), written by the 'fast' profile
+BOOT_STAGES_PATH = '/boot-stages.txt'
+
+# Ubuntu country mirrors by zone prefix; the archive's name for the UK is gb
+MIRROR = 'http://{country}.archive.ubuntu.com/ubuntu'
+MIRROR_COUNTRIES = {'uk': 'gb'}
+
+# UpCloud plan names carry the size, e.g. '2xCPU-4GB' or 'HIMEM-4xCPU-32GB'
+PLAN_SIZE = re.compile(r'(\d+)xCPU-(\d+)(GB|MB)')
+
+# The cloud-config ahead of write_files, per profile
+PROFILES = {
+    # Stock Ubuntu: install, harden and start nginx
+    'full': """#cloud-config
+packages:
+  - nginx
+  - ufw
+
+runcmd:
+  # Update system
+  - apt-get update
+  - apt-get upgrade -y
+
+  # Configure firewall
+  - ufw allow ssh
+  - ufw allow 'Nginx Full'
+  - ufw --force enable
+
+  # Start and enable nginx
+  - systemctl start nginx
+  - systemctl enable nginx
+
+  # Create our custom web page
+  - rm -f /var/www/html/index.nginx-debian.html
+
+  # Set proper permissions
+  - chown -R www-data:www-data /var/www/html
+  - chmod -R 755 /var/www/html
+
+""",
+    # Golden image clones: nginx, ufw and updates are baked in, only the page is new
+    'golden': """#cloud-config
+runcmd:
+  - rm -f /var/www/html/index.nginx-debian.html
+  - chown -R www-data:www-data /var/www/html
+
+""",
+}
+# Serve first: install only nginx from the zone mirror, firewall in parallel, upgrade later
+PROFILES['fast'] = """#cloud-config
+apt:
+  primary:
+    - arches: [default]
+      uri: {{mirror}}
+
+bootcmd:
+  - mkdir -p /var/www/html
+  - echo "kernel $(( $(date +%s) - $(cut -d. -f1 /proc/uptime) ))" > /var/www/html/boot-stages.txt
+  - echo "cloud_init $(date +%s.%N)" >> /var/www/html/boot-stages.txt
+
+runcmd:
+  - stamp() { echo "$1 $(date +%s.%N)" >> /var/www/html/boot-stages.txt; }
+  - stamp runcmd
+  - (ufw allow ssh && ufw allow 80/tcp && ufw allow 443/tcp && ufw --force enable && stamp firewall) &
+  - apt-get update
+  - stamp apt_update
+  - DEBIAN_FRONTEND=noninteractive apt-get install -y --no-install-recommends nginx
+  - stamp nginx_installed
+  - rm -f /var/www/html/index.nginx-debian.html
+  - systemctl enable --now nginx
+  - stamp serving
+  - wait
+  - systemd-run --unit=upcloud-deferred-upgrade sh -c 'echo "upgrade_started $(date +%s.%N)" >> /var/www/html/boot-stages.txt; DEBIAN_FRONTEND=noninteractive apt-get -y -o Dpkg::Options::=--force-confold upgrade; echo "upgrade_done $(date +%s.%N)" >> /var/www/html/boot-stages.txt'
+
+"""
+
+# Same as 'full', plus a tuned nginx.conf (written after nginx is installed) and pre-compressed assets
+PROFILES['performance'] = PROFILES['full'].rstrip('\n') + """
+  # Pre-compress the page for gzip_static, then load the tuned config
+  - find /var/www/html -type f \\( -name '*.html' -o -name '*.css' -o -name '*.js' -o -name '*.svg' -o -name '*.json' -o -name '*.txt' -o -name '*.xml' \\) -exec gzip -9 -k -f {} \\;
+  - nginx -t && systemctl reload nginx
+
+"""
+
+NGINX_PERFORMANCE_CONF = Template("""\
+# Written by cloud-init for a $plan server ($cpus CPU, $memory_mb MB)
+user www-data;
+worker_processes $worker_processes;
+worker_rlimit_nofile $worker_rlimit_nofile;
+pid /run/nginx.pid;
+include /etc/nginx/modules-enabled/*.conf;
+
+events {
+    worker_connections $worker_connections;
+    multi_accept on;
+}
+
+http {
+    sendfile on;
+    tcp_nopush on;
+    tcp_nodelay on;
+    keepalive_timeout 30;
+    keepalive_requests 1000;
+    server_tokens off;
+    types_hash_max_size 2048;
+
+    include /etc/nginx/mime.types;
+    default_type application/octet-stream;
+
+    open_file_cache max=$open_file_cache inactive=60s;
+    open_file_cache_valid 60s;
+    open_file_cache_min_uses 2;
+    open_file_cache_errors on;
+
+    gzip on;
+    gzip_static on;
+    gzip_vary on;
+    gzip_comp_level 5;
+    gzip_min_length 256;
+    gzip_proxied any;
+    gzip_types text/plain text/css text/xml application/json application/javascript
+               application/xml image/svg+xml;
+
+    # The page changes on redeploys/updates; assets can be cached longer
+    map $$sent_http_content_type $$cache_expires {
+        default         off;
+        text/html       5m;
+        text/css        7d;
+        application/javascript 7d;
+        ~image/         30d;
+        ~font/          30d;
+    }
+    expires $$cache_expires;
+
+    access_log /var/log/nginx/access.log combined buffer=64k flush=5s;
+    error_log /var/log/nginx/error.log warn;
+
+    include /etc/nginx/conf.d/*.conf;
+    include /etc/nginx/sites-enabled/*;
+}
+""")
+
+
+class CloudInitRenderer:
+    """Renders cloud-config user_data, caching by content hash."""
+
+    def __init__(self, page_dir=PAGE_DIR, web_root=WEB_ROOT):
+        self.page_dir = page_dir
+        self.web_root = web_root
+        self.renders = 0
+        self.hits = 0
+        self._files = None
+        self._entries = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def render(self, profile='full', **variables):
+        """The user_data for one server; identical inputs return the cached string."""
+        entries = [self._entry(f, variables) for f in self._page_files()]
+        if profile == 'performance':
+            entries.append(self._nginx_entry(variables.get('plan')))
+        if profile == 'fast':
+            variables.setdefault('mirror', zone_mirror(variables.get('zone')))
+        header = VARIABLE.sub(lambda m: str(variables.get(m.group(1), m.group(0))), PROFILES[profile])
+        key = _hash(header.encode(), *(e.encode() for e in entries))
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self.hits += 1
+                return document
+            self.renders += 1
+        document = header + "write_files:\n" + ''.join(entries)
+        with self._lock:
+            self._documents[key] = document
+        return document
+
+    def fingerprint(self, profile='full'):
+        """Hash of the profile and the page sources, before any variables are filled in."""
+        return _hash(PROFILES[profile].encode(),
+                     *(f['path'].encode() + b'\0' + f['content'] for f in self._page_files()))
+
+    def files(self, **variables):
+        """The page files as [(path, content bytes)] with {{variables}} filled in, for pushing directly."""
+        return [(f['path'], self._content(f, _values(f, variables))) for f in self._page_files()]
+
+    def stats(self):
+        return {'renders': self.renders, 'hits': self.hits, 'files': len(self._page_files())}
+
+    def _page_files(self):
+        """Read web_page/ once: [{'path', 'content', 'variables'}], sorted by path."""
+        if self._files is None:
+            files = []
+            for root, _, names in os.walk(self.page_dir):
+                for name in names:
+                    local_path = os.path.join(root, name)
+                    with open(local_path, 'rb') as f:
+                        content = f.read()
+                    relative = os.path.relpath(local_path, self.page_dir).replace(os.sep, '/')
+                    used = ()
+                    if name.lower().endswith(TEXT_SUFFIXES):
+                        used = tuple(sorted(set(VARIABLE.findall(content.decode('utf-8')))))
+                    files.append({'path': f"{self.web_root}/{relative}", 'content': content,
+                                  'variables': used})
+            self._files = sorted(files, key=lambda f: f['path'])
+        return self._files
+
+    def _entry(self, page_file, variables):
+        """The write_files entry for one file, keyed on its content and the variables it uses."""
+        values = _values(page_file, variables)
+        key = (page_file['path'], _hash(page_file['content']), values)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        content = self._content(page_file, values)
+        # mtime=0 so the same content always compresses to the same bytes
+        blob = base64.b64encode(gzip.compress(content, mtime=0)).decode('ascii')
+        entry = (f"  - path: {page_file['path']}\n"
+                 f"    encoding: gz+b64\n"
+                 f"    content: {blob}\n"
+                 f"    permissions: '0644'\n"
+                 f"    owner: www-data:www-data\n")
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _nginx_entry(self, plan):
+        """write_files entry for the tuned nginx.conf; deferred until after nginx is installed."""
+        conf = NGINX_PERFORMANCE_CONF.substitute(nginx_tuning(plan)).encode('utf-8')
+        entry = self._entry({'path': '/etc/nginx/nginx.conf', 'content': conf, 'variables': ()}, {})
+        return entry.replace("owner: www-data:www-data\n", "owner: root:root\n    defer: true\n")
+
+    @staticmethod
+    def _content(page_file, values):
+        if not page_file['variables']:
+            return page_file['content']
+        lookup = {name: value for name, value in zip(page_file['variables'], values) if value is not None}
+        return VARIABLE.sub(lambda m: lookup.get(m.group(1), m.group(0)),
+                            page_file['content'].decode('utf-8')).encode('utf-8')
+
+
+def _values(page_file, variables):
+    """The file's variables as strings, None for the ones not given.
+
+    Placeholders without a value are left as they are, since {{ name }} is
+    also the syntax of Vue, Handlebars and Angular templates.
+    """
+    return tuple(None if variables.get(name) is None else str(variables[name])
+                 for name in page_file['variables'])
+
+
+def zone_mirror(zone):
+    """The Ubuntu archive mirror in the zone's country, e.g. fi.archive.ubuntu.com for fi-hel1."""
+    country = (zone or '').split('-')[0].lower()
+    if not country.isalpha():
+        return 'http://archive.ubuntu.com/ubuntu'
+    return MIRROR.format(country=MIRROR_COUNTRIES.get(country, country))
+
+
+def parse_boot_stages(text):
+    """{stage: epoch seconds} from a boot-stages.txt written by the 'fast' profile."""
+    stages = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            try:
+                stages[parts[0]] = float(parts[1])
+            except ValueError:
+                continue
+    return stages
+
+
+def boot_stage_seconds(text, start_time):
+    """{'boot_<stage>_seconds': seconds since start_time} from a boot-stages.txt, in stage order."""
+    return {f"boot_{stage}_seconds": round(at - start_time, 2)
+            for stage, at in sorted(parse_boot_stages(text).items(), key=lambda item: item[1])}
+
+
+def nginx_tuning(plan):
+    """nginx sizing for a plan: one worker per CPU, connections and caches scaled with memory."""
+    match = PLAN_SIZE.search(plan or '')
+    cpus, memory_mb = 1, 1024
+    if match:
+        cpus = int(match.group(1))
+        memory_mb = int(match.group(2)) * (1024 if match.group(3) == 'GB' else 1)
+    memory_gb = max(1, memory_mb // 1024)
+    # Roughly 1024 connections per worker per GB, within what one worker handles well
+    worker_connections = min(16384, 1024 * memory_gb)
+    return {
+        'plan': plan or 'unknown',
+        'cpus': cpus,
+        'memory_mb': memory_mb,
+        'worker_processes': cpus,
+        'worker_connections': worker_connections,
+        'worker_rlimit_nofile': 2 * worker_connections,
+        'open_file_cache': min(20000, 1000 * memory_gb),
+    }
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
@@ -8,10 +8,22 @@ import os
 import sys
 import time
 import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import upcloud_api
-from upcloud_api import CloudManager
 from upcloud_api.errors import UpCloudAPIError
+from state_waiter import StateWaiter
+from transport import create_cloud_manager
+from api_cache import ApiCache, CachedCloudManager, CACHE_FILE
+from golden_image import bake_golden_image, load_golden_image, fingerprint
+from readiness import wait_until_ready, fetch_text
+from inventory import Inventory, INVENTORY_FILE, FINAL_STEPS
+from placement import plan_fleet
+from servers import IPResolver, ServerInfo
+from cloud_init import CloudInitRenderer, BOOT_STAGES_PATH, boot_stage_seconds
+from metrics import Metrics, phase_method
 
 # Load environment variables
 load_dotenv()
@@ -22,12 +34,156 @@ UPCLOUD_PASSWORD = os.getenv('UPCLOUD_PASSWORD')
 SERVER_ZONE = os.getenv('SERVER_ZONE', 'fi-hel1')
 SERVER_PLAN = os.getenv('SERVER_PLAN', '1xCPU-1GB')
 
+# Package mirror for the 'fast' profile; defaults to the zone's country mirror
+APT_MIRROR = os.getenv('APT_MIRROR')
+
+# Per-run timing metrics
+METRICS_FILE = 'deploy_metrics.json'
+
+# Learned state transition times, shared between runs
+STATE_TIMINGS_FILE = '.upcloud_state_timings.json'
+
 # Ubuntu 22.04 LTS template UUID
 UBUNTU_22_04_TEMPLATE = '01000000-0000-4000-8000-000030220200'
 
-class UpCloudDeployer:
-    def __init__(self):
-        """Initialize the UpCloud deployer with API credentials."""
+def server_hostname(title):
+    return f"{title.lower()}.example.com"
+
+def deploy_key(title, hostname):
+    """Idempotency key of a deployment: the same title and hostname is the same server."""
+    return f"{title}|{hostname}"
+
+def build_server_config(title, zone, plan, ssh_public_key, renderer, golden_template=None,
+                        profile='full'):
+    """The create_server request body for one web server.
+    
+    profile picks the cloud-init (see cloud_init.PROFILES). Servers cloned
+    from a golden image already have nginx, ufw and all updates, so their
+    cloud-init only writes the page files, whatever the profile.
+    """
+    hostname = server_hostname(title)
+    variables = {'title': title, 'hostname': hostname, 'zone': zone, 'plan': plan}
+    if APT_MIRROR:
+        variables['mirror'] = APT_MIRROR
+    return {
+        'zone': zone,
+        'title': title,
+        'hostname': hostname,
+        'plan': plan,
+        'metadata': True,  # Required for cloud-init
+        'storage_devices': {
+            'storage_device': [{
+                'action': 'clone',
+                'storage': golden_template or UBUNTU_22_04_TEMPLATE,
+                'title': f"{title}-disk",
+                'size': 25,
+                'tier': 'maxiops'
+            }]
+        },
+        'login_user': {
+            'username': 'root',
+            'ssh_keys': {
+                'ssh_key': [ssh_public_key]
+            }
+        },
+        'user_data': renderer.render('golden' if golden_template else profile, **variables)
+    }
+
+class DeployJournal:
+    """Deploy journal bookkeeping shared by UpCloudDeployer and AsyncUpCloudDeployer.
+    
+    The journal is written before the create call and again right after it,
+    so a crash at any point leaves enough behind to find the server on the
+    next run. Only deploys still in flight are resumed; once a title's deploy
+    is 'ready' or 'failed', the next one creates a new server. These methods
+    only read and write the inventory (all no-ops without one); the deployer
+    makes the API calls itself, blocking or awaited.
+    """
+    
+    def journal(self, title, step, **fields):
+        """Record a deploy step in the journal (a no-op without an inventory)."""
+        if self.inventory:
+            self.inventory.journal_write(deploy_key(title, server_hostname(title)), step,
+                                         title=title, **fields)
+    
+    def in_flight_entry(self, title):
+        """The journal entry of this title's unfinished deploy, or None."""
+        if self.inventory is None:
+            return None
+        entry = self.inventory.journal(deploy_key(title, server_hostname(title)))
+        return entry if entry and entry['step'] not in FINAL_STEPS else None
+    
+    def journal_requested(self, title, zone, plan):
+        """Journal a create that is about to be sent."""
+        self.journal(title, 'requested', hostname=server_hostname(title),
+                     zone=zone or SERVER_ZONE, plan=plan or SERVER_PLAN)
+    
+    def journal_created(self, title, server):
+        """Journal the outcome of the create call: the new server, or None if it failed."""
+        if server:
+            self.journal(title, 'created', uuid=server.uuid)
+        else:
+            self.journal(title, 'failed')
+    
+    def adopt_orphan(self, entry, account_servers):
+        """Find a server that was created before its UUID could be journaled; its UUID or None.
+        
+        This only happens when a run dies during the create call itself, so
+        the caller lists the account once per run, however many such entries
+        there are.
+        """
+        for server in account_servers:
+            if server.title == entry['title'] and getattr(server, 'hostname', None) == entry['hostname']:
+                self.inventory.adopt([server])
+                self.inventory.journal_write(entry['key'], 'created', uuid=server.uuid)
+                return server.uuid
+        return None
+    
+    def resumable(self, server_uuid):
+        """Whether a journaled server may still be live (the inventory hasn't seen it deleted)."""
+        if not server_uuid:
+            return False
+        record = self.inventory.get(server_uuid)
+        return not (record and record['deleted'])
+    
+    def forget_missing(self, server_uuid, error):
+        """Mark a server the API reports NOT_FOUND as deleted; False for any other error."""
+        if 'NOT_FOUND' not in str(error.error_code):
+            return False
+        self.inventory.mark_deleted(server_uuid)
+        return True
+
+class UpCloudDeployer(DeployJournal):
+    def __init__(self, manager=None, ssh_public_key=None, refresh=False, metrics=None, inventory=None,
+                 profile='full'):
+        """Initialize the UpCloud deployer with API credentials.
+
+        A pre-built manager (e.g. a local stub CloudManager) and SSH public key
+        can be passed in to skip the .env and key file checks. Account, zone and
+        plan lookups are cached on disk; refresh=True ignores the cached values.
+        API calls and deployment phases are timed into metrics. Every server
+        created is recorded in the inventory (upcloud_inventory.db by default;
+        none with a pre-built manager unless one is passed), along with a
+        journal of each deploy's progress so an interrupted run can be resumed.
+        profile is the cloud-init profile for servers on the stock template.
+        """
+        self.metrics = metrics or Metrics('deploy')
+        self.inventory = inventory
+        self._account_servers = None
+        self._account_lock = threading.Lock()
+        self.renderer = CloudInitRenderer()
+        self.profile = profile
+        self.golden_template = None
+        self.golden_zone = None
+        
+        if manager is not None:
+            self.manager = self.metrics.instrument(manager)
+            self.ssh_public_key = ssh_public_key or ''
+            self.cache = None
+            self.waiter = StateWaiter(self.manager)
+            self.ips = IPResolver(self.manager, self.inventory)
+            return
+        
         if not UPCLOUD_USERNAME or not UPCLOUD_PASSWORD:
             print("❌ Error: UpCloud credentials not found!")
             print("Please make sure you have:")
@@ -43,7 +199,15 @@ class UpCloudDeployer:
             sys.exit(1)
         
         try:
-            self.manager = CloudManager(UPCLOUD_USERNAME, UPCLOUD_PASSWORD)
+            self.cache = ApiCache(CACHE_FILE, namespace=UPCLOUD_USERNAME)
+            # Cache outside the instrumentation, so only misses are recorded as API calls
+            self.manager = CachedCloudManager(
+                self.metrics.instrument(create_cloud_manager(UPCLOUD_USERNAME, UPCLOUD_PASSWORD)),
+                self.cache, refresh=refresh)
+            self.waiter = StateWaiter(self.manager, timings_file=STATE_TIMINGS_FILE)
+            if self.inventory is None:
+                self.inventory = Inventory(INVENTORY_FILE)
+            self.ips = IPResolver(self.manager, self.inventory)
             
             # Read SSH public key
             with open('upcloud_key.pub', 'r') as f:
@@ -55,6 +219,7 @@ class UpCloudDeployer:
             print(f"❌ Failed to initialize UpCloud API: {e}")
             sys.exit(1)
     
+    @phase_method('credential_check')
     def test_credentials(self):
         """Test API credentials by fetching account information."""
         try:
@@ -97,238 +262,204 @@ class UpCloudDeployer:
             print(f"❌ Error fetching zones: {e}")
             return []
     
-    def create_server(self, title="UpCloud-WebServer"):
-        """Create a new server with web server configuration."""
-        print(f"\n🖥️  Creating server: {title}")
-        print(f"   Zone: {SERVER_ZONE}")
-        print(f"   Plan: {SERVER_PLAN}")
+    def use_golden_image(self, zone=None):
+        """Clone new servers from the baked golden image, if one matches the current setup."""
+        zone = zone or SERVER_ZONE
+        image = load_golden_image(self.image_fingerprint(), zone)
+        if not image:
+            print(f"⚠️  No up-to-date golden image for {zone}; run with --bake first. Using stock Ubuntu.")
+            return False
+        
+        self.golden_template = image['template_uuid']
+        self.golden_zone = zone
+        print(f"✅ Using golden image {image['template_uuid']} (baked {image['created']})")
+        return True
+    
+    def image_fingerprint(self):
+        """Hash of everything baked into the golden image: base template, packages and page."""
+        return fingerprint(UBUNTU_22_04_TEMPLATE, self.renderer.fingerprint('full'))
+    
+    @phase_method('create')
+    def create_server(self, title="UpCloud-WebServer", zone=None, plan=None, verbose=True, tags=()):
+        """Create a new server with web server configuration; tags are recorded in the inventory."""
+        zone = zone or SERVER_ZONE
+        plan = plan or SERVER_PLAN
+        # Golden images are zone-local storage; other zones get the stock template
+        golden_template = self.golden_template if zone == self.golden_zone else None
+        if verbose:
+            print(f"\n🖥️  Creating server: {title}")
+            print(f"   Zone: {zone}")
+            print(f"   Plan: {plan}")
         
         try:
-            # Server configuration
-            server_config = {
-                'zone': SERVER_ZONE,
-                'title': title,
-                'hostname': f"{title.lower()}.example.com",
-                'plan': SERVER_PLAN,
-                'metadata': True,  # Required for cloud-init
-                'storage_devices': {
-                    'storage_device': [{
-                        'action': 'clone',
-                        'storage': UBUNTU_22_04_TEMPLATE,
-                        'title': f"{title}-disk",
-                        'size': 25,
-                        'tier': 'maxiops'
-                    }]
-                },
-                'login_user': {
-                    'username': 'root',
-                    'ssh_keys': {
-                        'ssh_key': [self.ssh_public_key]
-                    }
-                },
-                'user_data': self._get_cloud_init_script()
-            }
+            server_config = build_server_config(title, zone, plan, self.ssh_public_key,
+                                                self.renderer, golden_template, self.profile)
             
             # Create the server
             server = self.manager.create_server(server_config)
-            print(f"✅ Server created: {server.uuid}")
-            print(f"   Title: {server.title}")
-            print(f"   State: {server.state}")
+            # The create response already lists the server's addresses
+            info = ServerInfo.from_api(server)
+            self.ips.remember(info)
+            if self.inventory:
+                self.inventory.add(server.uuid, title, zone=zone, plan=plan, tags=tags,
+                                   state=server.state, ip=info.ipv4, ipv6=info.ipv6,
+                                   template=golden_template or UBUNTU_22_04_TEMPLATE)
+            if verbose:
+                print(f"✅ Server created: {server.uuid}")
+                print(f"   Title: {server.title}")
+                print(f"   State: {server.state}")
             
             return server
             
         except UpCloudAPIError as e:
-            print(f"❌ Failed to create server: {e}")
+            print(f"❌ Failed to create server {title}: {e}")
             return None
         except Exception as e:
-            print(f"❌ Unexpected error: {e}")
+            print(f"❌ Unexpected error creating {title}: {e}")
             return None
     
-    def _get_cloud_init_script(self):
-        """Get cloud-init script for automatic web server setup."""
-        return """#cloud-config
-packages:
-  - nginx
-  - ufw
-
-runcmd:
-  # Update system
-  - apt-get update
-  - apt-get upgrade -y
-  
-  # Configure firewall
-  - ufw allow ssh
-  - ufw allow 'Nginx Full'
-  - ufw --force enable
-  
-  # Start and enable nginx
-  - systemctl start nginx
-  - systemctl enable nginx
-  
-  # Create our custom web page
-  - rm -f /var/www/html/index.nginx-debian.html
-  
-  # Set proper permissions
-  - chown -R www-data:www-data /var/www/html
-  - chmod -R 755 /var/www/html
-
-write_files:
-  - path: /var/www/html/index.html
-    content: |
-      <!DOCTYPE html>
-      <html lang="en">
-      <head>
-          <meta charset="UTF-8">
-          <meta name="viewport" content="width=device-width, initial-scale=1.0">
-          <title>Welcome to UpCloud! 🚀</title>
-          <style>
-              * { margin: 0; padding: 0; box-sizing: border-box; }
-              body {
-                  font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                  background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                  color: white; min-height: 100vh; display: flex;
-                  align-items: center; justify-content: center;
-              }
-              .container {
-                  text-align: center; padding: 2rem; max-width: 600px;
-                  background: rgba(255, 255, 255, 0.1); border-radius: 20px;
-                  backdrop-filter: blur(10px); box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-              }
-              h1 { font-size: 3rem; margin-bottom: 1rem; animation: bounce 2s infinite; }
-              .subtitle { font-size: 1.2rem; margin-bottom: 2rem; opacity: 0.9; }
-              .server-info {
-                  background: rgba(255, 255, 255, 0.1); padding: 1rem;
-                  border-radius: 10px; margin: 1rem 0; font-family: 'Courier New', monospace;
-              }
-              .footer { margin-top: 2rem; font-size: 0.9rem; opacity: 0.8; }
-              @keyframes bounce {
-                  0%, 20%, 50%, 80%, 100% { transform: translateY(0); }
-                  40% { transform: translateY(-10px); }
-                  60% { transform: translateY(-5px); }
-              }
-          </style>
-      </head>
-      <body>
-          <div class="container">
-              <h1>🚀 Welcome to UpCloud!</h1>
-              <p class="subtitle">Your server is now live and running!</p>
-              <div class="server-info">
-                  <strong>Server Status:</strong> ✅ Online<br>
-                  <strong>Deployed via:</strong> UpCloud API<br>
-                  <strong>Web Server:</strong> Nginx<br>
-                  <strong>Auto-configured:</strong> Cloud-init
-              </div>
-              <div class="footer">
-                  <p>🎉 Congratulations! You've successfully deployed your first UpCloud server using their API.</p>
-                  <p>Time to build something amazing! 💪</p>
-              </div>
-          </div>
-          <script>
-              document.addEventListener('DOMContentLoaded', function() {
-                  const footer = document.querySelector('.footer');
-                  const timestamp = new Date().toLocaleString();
-                  footer.innerHTML += `<br><small>Deployed on: ${timestamp}</small>`;
-              });
-          </script>
-      </body>
-      </html>
-    permissions: '0644'
-    owner: www-data:www-data
-"""
+    def start_deploy(self, title="UpCloud-WebServer", zone=None, plan=None, verbose=True, tags=()):
+        """Create the server for this title, or take over the one an earlier run left in flight.
+        
+        See DeployJournal for the journal and resume rules. Returns (server,
+        resumed_entry); the entry is None when a new server was created.
+        """
+        entry = self.in_flight_entry(title)
+        if entry:
+            server = self._resume(entry)
+            if server:
+                if verbose:
+                    print(f"\n♻️  Resuming {title} ({server.uuid}) from step "
+                          f"'{entry['step']}' of an earlier run")
+                return server, entry
+        
+        self.journal_requested(title, zone, plan)
+        server = self.create_server(title, zone=zone, plan=plan, verbose=verbose, tags=tags)
+        self.journal_created(title, server)
+        return server, None
+    
+    def _resume(self, entry):
+        """The live server behind a journal entry, or None if there's nothing to resume."""
+        server_uuid = entry['uuid'] or self.adopt_orphan(entry, self._list_account())
+        if not self.resumable(server_uuid):
+            return None
+        try:
+            server = self.manager.get_server(server_uuid)
+        except UpCloudAPIError as e:
+            if not self.forget_missing(server_uuid, e):
+                raise
+            return None
+        self.ips.remember(ServerInfo.from_api(server))
+        if server.state == 'stopped':
+            server.start()
+        return server
     
-    def wait_for_server(self, server_uuid, timeout=300):
-        """Wait for server to be in started state."""
-        print(f"🚀 Deploying your new UpCloud server...")
-        print(f"💡 This typically takes 2-3 minutes - please be patient!")
-        print(f"📋 We'll monitor the deployment progress for you...\n")
+    def _list_account(self):
+        """Every server on the account, listed once per run."""
+        with self._account_lock:
+            if self._account_servers is None:
+                self._account_servers = self.manager.get_servers()
+        return self._account_servers
+    
+    @phase_method('boot')
+    def wait_for_server(self, server_uuid, timeout=300, verbose=True, details=True):
+        """Wait for server to be in started state.
         
-        start_time = time.time()
-        last_state = None
-        state_start_time = time.time()
+        Returns the populated Server object, or with details=False the
+        unpopulated one from the polling list call (saving a get_server()
+        when the addresses are already known).
+        """
+        if verbose:
+            print(f"🚀 Deploying your new UpCloud server...")
+            print(f"💡 This typically takes 2-3 minutes - please be patient!")
+            print(f"📋 We'll monitor the deployment progress for you...\n")
+        
+        progress = {'last_state': None, 'printed_at': time.time()}
+        
+        def report(handle, current_state):
+            # Only print status update if state changed or every 30 seconds
+            if not verbose or current_state == 'started':
+                return
+            if current_state != progress['last_state'] or (time.time() - progress['printed_at']) > 30:
+                elapsed_minutes = handle.elapsed / 60
+                if current_state == 'maintenance':
+                    print(f"🔧 Server is being configured and installed... ({elapsed_minutes:.1f} min)")
+                    print(f"   📦 Installing Ubuntu 22.04 LTS and setting up Nginx web server")
+                elif current_state != 'error':
+                    print(f"📊 Server state: {current_state} ({elapsed_minutes:.1f} min)")
+                progress['last_state'] = current_state
+                progress['printed_at'] = time.time()
         
-        while time.time() - start_time < timeout:
+        # Polling is shared with every other server this deployer is waiting on
+        handle = self.waiter.watch(server_uuid, 'started', timeout=timeout,
+                                   from_state='maintenance', on_poll=report)
+        handle.wait()
+        elapsed_minutes = handle.elapsed / 60
+        
+        if handle.outcome == 'reached':
+            if verbose:
+                print(f"✅ Server is now running! ({elapsed_minutes:.1f} min)")
+                print(f"🌐 Web server setup is completing in the background...")
+            if not details:
+                return handle.server
             try:
-                server = self.manager.get_server(server_uuid)
-                current_state = server.state
-                elapsed_minutes = (time.time() - start_time) / 60
-                
-                # Only print status update if state changed or every 30 seconds
-                if current_state != last_state or (time.time() - state_start_time) > 30:
-                    if current_state == 'maintenance':
-                        print(f"🔧 Server is being configured and installed... ({elapsed_minutes:.1f} min)")
-                        print(f"   📦 Installing Ubuntu 22.04 LTS and setting up Nginx web server")
-                    elif current_state == 'started':
-                        print(f"✅ Server is now running! ({elapsed_minutes:.1f} min)")
-                        print(f"🌐 Web server setup is completing in the background...")
-                        return server
-                    elif current_state == 'error':
-                        print(f"❌ Server deployment failed after {elapsed_minutes:.1f} minutes")
-                        return None
-                    else:
-                        print(f"📊 Server state: {current_state} ({elapsed_minutes:.1f} min)")
-                    
-                    last_state = current_state
-                    state_start_time = time.time()
-                    
-                time.sleep(10)
-                
+                # The list call used for polling doesn't include networking details
+                return self.manager.get_server(server_uuid)
             except Exception as e:
-                print(f"❌ Error checking server status: {e}")
-                time.sleep(10)
-        
-        elapsed_minutes = timeout / 60
-        print(f"⏰ Timeout: Server didn't start within {elapsed_minutes:.0f} minutes")
+                print(f"⚠️  Could not fetch details for {server_uuid}: {e}")
+                return handle.server
+        elif handle.outcome == 'error':
+            print(f"❌ Server {server_uuid} deployment failed after {elapsed_minutes:.1f} minutes")
+        elif handle.outcome == 'missing':
+            print(f"❌ Server {server_uuid} disappeared while waiting for it to start")
+        else:
+            elapsed_minutes = timeout / 60
+            print(f"⏰ Timeout: Server {server_uuid} didn't start within {elapsed_minutes:.0f} minutes")
         return None
     
+    @phase_method('ip_discovery')
     def get_server_ip(self, server):
-        """Get the public IP address of the server."""
+        """Get the public IPv4 address of the server.
+        
+        Taken from the server object when it carries its addresses,
+        otherwise from the IP resolver, which covers every server in the
+        account with one GET /ip_address.
+        """
         try:
-            # Try the direct method first (UpCloud API has helper methods)
-            if hasattr(server, 'get_public_ip'):
-                try:
-                    public_ip = server.get_public_ip()
-                    if public_ip:
-                        return public_ip
-                except:
-                    pass
-            
-            # Check ip_addresses directly on server object
-            if hasattr(server, 'ip_addresses'):
-                for ip in server.ip_addresses:
-                    if hasattr(ip, 'access') and hasattr(ip, 'address'):
-                        if ip.access == 'public' and '.' in ip.address:  # IPv4 check
-                            return ip.address
-                    elif isinstance(ip, dict):
-                        if ip.get('access') == 'public' and '.' in str(ip.get('address', '')):
-                            return ip.get('address')
-            
-            # Handle object format with networking.interfaces
-            if hasattr(server, 'networking') and hasattr(server.networking, 'interfaces'):
-                for interface in server.networking.interfaces:
-                    for ip in interface.ip_addresses:
-                        if ip.access == 'public' and ip.family == 'IPv4':
-                            return ip.address
-            
-            # Handle dictionary format
-            elif isinstance(server, dict):
-                networking = server.get('networking', {})
-                interfaces = networking.get('interfaces', [])
-                for interface in interfaces:
-                    ip_addresses = interface.get('ip_addresses', [])
-                    for ip in ip_addresses:
-                        if isinstance(ip, dict):
-                            if ip.get('access') == 'public' and ip.get('family') == 'IPv4':
-                                return ip.get('address')
-                        elif hasattr(ip, 'access') and hasattr(ip, 'family'):
-                            if ip.access == 'public' and ip.family == 'IPv4':
-                                return ip.address
-                
+            ip = ServerInfo.from_api(server).ipv4 or self.ips.ipv4(server.uuid)
+            if ip:
+                return ip
         except Exception as e:
             print(f"⚠️  Error getting server IP: {e}")
         
         print("ℹ️  Could not automatically retrieve IP address from API response")
         return None
     
+    @phase_method('readiness')
+    def wait_until_serving(self, server_ip, start_time, timeout=300, verbose=True):
+        """Wait until the server actually serves the page over HTTP (SSH is timed too)."""
+        if verbose:
+            print(f"\n⏳ Waiting for the web server to answer at http://{server_ip} ...")
+        readiness = wait_until_ready(server_ip, timeout=timeout, start_time=start_time)
+        
+        if verbose:
+            if readiness['ssh_up_seconds'] is not None:
+                print(f"   🔑 SSH up after {readiness['ssh_up_seconds'] / 60:.1f} min")
+            if readiness['ready']:
+                print(f"   ✅ HTTP 200 after {readiness['http_200_seconds'] / 60:.1f} min")
+            else:
+                print(f"   ⏰ No HTTP 200 within {timeout / 60:.0f} minutes")
+        return readiness
+    
+    def boot_stage_timings(self, server_ip, start_time):
+        """Per-stage boot timings the 'fast' profile publishes, in seconds since start_time.
+        
+        The stamps come from the server's clock, so they're only as accurate
+        as the two clocks agree (both normally NTP-synced). Returns {} if the
+        server doesn't publish them.
+        """
+        return boot_stage_seconds(fetch_text(f"http://{server_ip}{BOOT_STAGES_PATH}") or '', start_time)
+    
     def deploy_web_page(self, server_ip):
         """Deploy the web page to the server (already done via cloud-init)."""
         print(f"\n🌐 Web server deployment summary:")
@@ -339,14 +470,189 @@ write_files:
         print(f"   🌍 Your website: http://{server_ip}")
         
         return True
+    
+    def deploy_one(self, spec, timeout=600):
+        """Create one server and wait for it to serve the page, timing each step.
+        
+        spec is a dict with a 'title' and optional 'zone'/'plan'/'tags'. The
+        result is recorded in the inventory unless the create failed outright;
+        its 'state' is 'ready', 'started' (up but not serving) or 'failed'.
+        """
+        result = self._deploy_one(spec, timeout)
+        if result['uuid'] and result['state'] != 'failed':
+            self.record_deploy(result['uuid'], result['ip'],
+                               {k: v for k, v in result.items() if k.endswith('_seconds')},
+                               ready=result['state'] == 'ready')
+        return result
+    
+    def _deploy_one(self, spec, timeout):
+        result = {
+            'title': spec['title'],
+            'zone': spec.get('zone') or SERVER_ZONE,
+            'plan': spec.get('plan') or SERVER_PLAN,
+            'uuid': None,
+            'ip': None,
+            'state': 'failed',
+        }
+        start_time = time.time()
+        
+        server, resumed = self.start_deploy(spec['title'], zone=spec.get('zone'), plan=spec.get('plan'),
+                                            verbose=False, tags=spec.get('tags', ()))
+        result['create_seconds'] = round(time.time() - start_time, 2)
+        result['resumed'] = resumed is not None
+        if not server:
+            return result
+        result['uuid'] = server.uuid
+        
+        # The addresses are known from the create call, so skip the per-server get_server()
+        started = self.wait_for_server(server.uuid, timeout=timeout, verbose=False, details=False)
+        result['total_seconds'] = round(time.time() - start_time, 2)
+        if not started:
+            return result
+        
+        result['state'] = 'started'
+        result['api_started_seconds'] = result.pop('total_seconds')
+        result['ip'] = self.get_server_ip(server)
+        self.journal(spec['title'], 'ip' if result['ip'] else 'started', ip=result['ip'])
+        if not result['ip']:
+            return result
+        
+        readiness = self.wait_until_serving(result['ip'], start_time, verbose=False)
+        result.update(readiness)
+        result['total_seconds'] = round(time.time() - start_time, 2)
+        if readiness['ready']:
+            result['state'] = 'ready'
+            self.journal(spec['title'], 'ready')
+            if self.profile == 'fast':
+                result.update(self.boot_stage_timings(result['ip'], start_time))
+        return result
+    
+    def record_deploy(self, uuid, ip=None, timings=None, ready=False):
+        """Save a deployed server's IP and timings in the inventory.
+        
+        It's only recorded as 'started' once it has served the page; until
+        then the state from the create call (or the last reconcile) stands.
+        """
+        if self.inventory:
+            fields = {'state': 'started'} if ready else {}
+            self.inventory.update(uuid, ip=ip, timings=timings, checked=time.time(), **fields)
+    
+    def deploy_fleet(self, specs, max_workers=10, timeout=600):
+        """Create many servers concurrently and track them all until they serve the page.
+        
+        specs is a list of dicts with a 'title' and optional 'zone'/'plan'/'tags'.
+        Returns (results, total_seconds), results in the same order as specs.
+        """
+        print(f"\n🚀 Deploying fleet of {len(specs)} servers ({max_workers} at a time)...")
+        start_time = time.time()
+        results = [None] * len(specs)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(self.deploy_one, spec, timeout): i
+                       for i, spec in enumerate(specs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Unexpected error deploying {specs[i]['title']}: {e}")
+                    result = {'title': specs[i]['title'], 'uuid': None, 'ip': None, 'state': 'failed'}
+                results[i] = result
+                
+                resumed = " (resumed)" if result.get('resumed') else ""
+                if result['state'] == 'ready':
+                    print(f"   ✅ {result['title']}{resumed} serving in {result['http_200_seconds']:.1f}s "
+                          f"(started {result['api_started_seconds']:.1f}s, {result['ip']})")
+                elif result['state'] == 'started':
+                    print(f"   ⚠️  {result['title']}{resumed} started but isn't serving ({result['ip']})")
+                else:
+                    print(f"   ❌ {result['title']} failed")
+        
+        total_seconds = time.time() - start_time
+        ready = sum(1 for r in results if r['state'] == 'ready')
+        print(f"\n📊 Fleet summary: {ready}/{len(specs)} servers serving in {total_seconds:.1f}s wall-clock")
+        return results, total_seconds
 
-def main():
-    """Main deployment function."""
-    print("🚀 UpCloud Web Server Deployment Script")
-    print("=" * 50)
+
+def load_fleet_specs(count=None, manifest=None, title="UpCloud-WebServer"):
+    """Build the list of fleet server specs from a count or a JSON manifest.
+    
+    The manifest is a JSON list of titles or of {"title", "zone", "plan"} objects.
+    """
+    if manifest:
+        with open(manifest, 'r') as f:
+            entries = json.load(f)
+        return [{'title': e} if isinstance(e, str) else dict(e) for e in entries]
     
+    return [{'title': f"{title}-{i:02d}"} for i in range(1, count + 1)]
+
+
+def resume_specs(inventory):
+    """Fleet specs for every deploy the journal says is still in flight."""
+    return [{'title': e['title'], 'zone': e['zone'], 'plan': e['plan']} for e in inventory.in_flight()]
+
+
+def main_fleet(args, metrics):
+    """Fleet deployment: create many servers in parallel."""
+    deployer = UpCloudDeployer(refresh=args.refresh, metrics=metrics, profile=args.profile)
+    
+    if not deployer.test_credentials():
+        return
+    if args.golden:
+        deployer.use_golden_image()
+    
+    if args.resume:
+        specs = resume_specs(deployer.inventory)
+        if not specs:
+            print("✅ No interrupted deployments to resume")
+            return
+        print(f"♻️  Resuming {len(specs)} interrupted deployments")
+    else:
+        specs = load_fleet_specs(count=args.count, manifest=args.manifest)
+    if args.zones and plan_fleet(specs, args.zones.split(','), inventory=deployer.inventory,
+                                 max_share=args.max_share) is None:
+        return
+    
+    print(f"\n📋 Fleet Configuration:")
+    print(f"   Servers: {len(specs)}")
+    print(f"   Parallel workers: {args.workers}")
+    print(f"   Default zone: {args.zones or SERVER_ZONE}")
+    print(f"   Default plan: {SERVER_PLAN}")
+    
+    response = input(f"\n❓ Proceed with deploying {len(specs)} servers? (y/N): ").strip().lower()
+    if response != 'y':
+        print("❌ Deployment cancelled")
+        return
+    
+    deployer.deploy_fleet(specs, max_workers=args.workers)
+    print(f"   Fleet recorded in: {INVENTORY_FILE} (see: python upcloud_cli.py status)")
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Deploy a web server on UpCloud")
+    parser.add_argument('--count', type=int, help="deploy a fleet of N servers in parallel")
+    parser.add_argument('--manifest', help="JSON file listing the fleet servers to deploy")
+    parser.add_argument('--workers', type=int, default=10, help="max concurrent fleet deployments")
+    parser.add_argument('--zones', help="comma-separated zones to spread the fleet across")
+    parser.add_argument('--max-share', type=float, default=0.5,
+                        help="most of the fleet any one zone may take with --zones (default 0.5)")
+    parser.add_argument('--resume', action='store_true',
+                        help="finish every deployment an earlier run left in flight")
+    parser.add_argument('--refresh', action='store_true', help="ignore cached account/zone lookups")
+    parser.add_argument('--bake', action='store_true',
+                        help="build a golden image (nginx preinstalled) to clone future servers from")
+    parser.add_argument('--golden', action='store_true', help="clone from the baked golden image")
+    parser.add_argument('--profile', choices=['full', 'performance', 'fast'], default='full',
+                        help="cloud-init profile: stock nginx; nginx tuned to the plan with "
+                             "pre-compressed assets; or fast, which serves before upgrading")
+    parser.add_argument('--prometheus', metavar='PATH',
+                        help="also write timing metrics as a Prometheus textfile")
+    return parser.parse_args(argv)
+
+def main_single(args, metrics):
+    """Deploy a single server."""
     # Initialize deployer
-    deployer = UpCloudDeployer()
+    deployer = UpCloudDeployer(refresh=args.refresh, metrics=metrics, profile=args.profile)
     
     # Test credentials
     if not deployer.test_credentials():
@@ -354,12 +660,18 @@ def main():
     
     # List available zones
     deployer.list_zones()
+    stats = deployer.cache.stats()
+    print(f"📦 API cache: {stats['hits']} hits, {stats['misses']} misses (use --refresh to re-fetch)")
+    
+    if args.golden:
+        deployer.use_golden_image()
     
     print(f"\n📋 Deployment Configuration:")
     print(f"   Zone: {SERVER_ZONE}")
     print(f"   Plan: {SERVER_PLAN}")
-    print(f"   OS: Ubuntu 22.04 LTS")
-    print(f"   ⏰ Expected deployment time: 2-3 minutes")
+    print(f"   OS: Ubuntu 22.04 LTS{' (golden image)' if deployer.golden_template else ''}")
+    print(f"   Profile: {'golden' if deployer.golden_template else deployer.profile}")
+    print(f"   ⏰ Expected deployment time: {'about 1 minute' if deployer.golden_template else '2-3 minutes'}")
     
     # Confirm deployment
     response = input("\n❓ Proceed with deployment? (y/N): ").strip().lower()
@@ -367,15 +679,19 @@ def main():
         print("❌ Deployment cancelled")
         return
     
-    # Create server
-    server = deployer.create_server()
+    # Create server (or pick up the one an interrupted run left behind)
+    start_time = time.time()
+    server, _ = deployer.start_deploy()
     if not server:
         return
+    title = server.title
     
     # Wait for server to start
     server = deployer.wait_for_server(server.uuid)
     if not server:
         return
+    timings = {'api_started_seconds': round(time.time() - start_time, 2)}
+    deployer.journal(title, 'started')
     
     # Get server IP
     server_ip = deployer.get_server_ip(server)
@@ -394,14 +710,33 @@ def main():
     print(f"   Plan: {server.plan}")
     
     # Deploy web page (already done via cloud-init)
+    readiness = None
     if server_ip != "[CHECK_UPCLOUD_PANEL]":
+        deployer.journal(title, 'ip', ip=server_ip)
+        readiness = deployer.wait_until_serving(server_ip, start_time)
+        timings['ssh_up_seconds'] = readiness['ssh_up_seconds']
+        timings['http_200_seconds'] = readiness['http_200_seconds']
+    
+    if readiness and readiness['ready']:
+        deployer.journal(title, 'ready')
+        if deployer.profile == 'fast':
+            stages = deployer.boot_stage_timings(server_ip, start_time)
+            timings.update(stages)
+            if stages:
+                print(f"\n⏱️  Boot stages (seconds since the deploy started):")
+                for name, seconds in stages.items():
+                    print(f"   {name[5:-8]:<16} {seconds:>7.1f}s")
         deployer.deploy_web_page(server_ip)
         
         print(f"\n🎉 Deployment Complete!")
         print(f"   Website URL: http://{server_ip}")
         print(f"   SSH Access: ssh -i upcloud_key root@{server_ip}")
-        print(f"\n⏰ Note: The web server might take an additional 1-2 minutes to fully initialize")
-        print(f"   If the website isn't immediately available, please wait a moment and refresh")
+        print(f"   ⏱️  Time to serve: {readiness['http_200_seconds'] / 60:.1f} min")
+    elif readiness:
+        print(f"\n⚠️  The server is running but the website isn't answering yet")
+        print(f"   Website URL: http://{server_ip}")
+        print(f"   SSH Access: ssh -i upcloud_key root@{server_ip}")
+        print(f"   💡 cloud-init may still be working; check /var/log/cloud-init-output.log over SSH")
     else:
         print(f"\n🎉 Deployment Complete!")
         print(f"   Website URL: http://[YOUR_SERVER_IP]")
@@ -412,21 +747,32 @@ def main():
     
     print(f"   Server UUID: {server.uuid}")
     print(f"\n💡 Remember to delete the server when you're done to avoid charges:")
-    print(f"   You can do this via UpCloud control panel or API")
+    print(f"   python cleanup_server.py (or via the UpCloud control panel)")
     
     # Save server info
-    server_info = {
-        'uuid': server.uuid,
-        'title': server.title,
-        'ip': server_ip,
-        'zone': server.zone,
-        'plan': server.plan,
-        'created': time.strftime('%Y-%m-%d %H:%M:%S')
-    }
+    deployer.record_deploy(server.uuid, None if server_ip == "[CHECK_UPCLOUD_PANEL]" else server_ip, timings,
+                           ready=bool(readiness and readiness['ready']))
+    print(f"   Server details saved to: {INVENTORY_FILE}")
+
+def main(argv=None):
+    """Main deployment function."""
+    print("🚀 UpCloud Web Server Deployment Script")
+    print("=" * 50)
     
-    with open('deployed_server.json', 'w') as f:
-        json.dump(server_info, f, indent=2)
-    print(f"   Server details saved to: deployed_server.json")
+    args = parse_args(argv)
+    metrics = Metrics('deploy')
+    try:
+        if args.bake:
+            deployer = UpCloudDeployer(refresh=args.refresh, metrics=metrics)
+            if deployer.test_credentials():
+                bake_golden_image(deployer, SERVER_ZONE)
+        elif args.count or args.manifest or args.resume:
+            main_fleet(args, metrics)
+        else:
+            main_single(args, metrics)
+    finally:
+        if metrics.has_data():
+            metrics.save(METRICS_FILE, prometheus_path=args.prometheus)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Simulated UpCloud API
+An in-memory stand-in for the UpCloud REST API, so the deploy and cleanup
+code can be exercised (and benchmarked) without paying for real servers.
+
+FakeCloudManager is a real upcloud_api CloudManager whose HTTP layer is
+replaced by FakeUpCloudAPI, so the library's own request building and
+response parsing still run. State transitions, API latency, error rate
+and rate limiting are all configurable.
+"""
+
+import asyncio
+import os
+import random
+import subprocess
+import threading
+import time
+import uuid as uuid_module
+from collections import Counter
+
+from upcloud_api import CloudManager
+from upcloud_api.errors import UpCloudAPIError
+
+from transport import TokenBucket
+
+FAKE_ZONES = [
+    {'id': 'fi-hel1', 'description': 'Helsinki #1', 'public': 'yes'},
+    {'id': 'fi-hel2', 'description': 'Helsinki #2', 'public': 'yes'},
+    {'id': 'de-fra1', 'description': 'Frankfurt #1', 'public': 'yes'},
+    {'id': 'nl-ams1', 'description': 'Amsterdam #1', 'public': 'yes'},
+    {'id': 'uk-lon1', 'description': 'London #1', 'public': 'yes'},
+    {'id': 'us-nyc1', 'description': 'New York #1', 'public': 'yes'},
+]
+
+FAKE_PLANS = [
+    {'name': '1xCPU-1GB', 'core_number': 1, 'memory_amount': 1024, 'storage_size': 25},
+    {'name': '1xCPU-2GB', 'core_number': 1, 'memory_amount': 2048, 'storage_size': 50},
+    {'name': '2xCPU-4GB', 'core_number': 2, 'memory_amount': 4096, 'storage_size': 80},
+    {'name': '4xCPU-8GB', 'core_number': 4, 'memory_amount': 8192, 'storage_size': 160},
+]
+
+# Simulated hourly prices in euro cents, in the shape of GET /price
+FAKE_PLAN_PRICES = {'1xCPU-1GB': 1.0, '1xCPU-2GB': 1.5, '2xCPU-4GB': 3.0, '4xCPU-8GB': 6.0}
+
+
+# Round-trip times (seconds) and typical time-to-ready per zone, for FakeZoneModel
+FAKE_ZONE_LATENCY = {
+    'fi-hel1': 0.004, 'fi-hel2': 0.005, 'de-fra1': 0.022,
+    'nl-ams1': 0.027, 'uk-lon1': 0.034, 'us-nyc1': 0.105,
+}
+FAKE_ZONE_READY_SECONDS = {
+    'fi-hel1': 150.0, 'fi-hel2': 120.0, 'de-fra1': 95.0,
+    'nl-ams1': 110.0, 'uk-lon1': 140.0, 'us-nyc1': 100.0,
+}
+
+
+class FakeZoneModel:
+    """Simulated per-zone network latency and provisioning times for placement.
+
+    probe(zone) stands in for placement.probe_zone_latency and history()
+    for the deploy timings stored in the inventory. Zones missing from
+    latency are unreachable.
+    """
+
+    def __init__(self, latency=None, ready_seconds=None, jitter=0.1, seed=None):
+        self.latency = dict(FAKE_ZONE_LATENCY if latency is None else latency)
+        self.ready_seconds = dict(FAKE_ZONE_READY_SECONDS if ready_seconds is None else ready_seconds)
+        self.jitter = jitter
+        self.probes = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def probe(self, zone):
+        with self._lock:
+            self.probes[zone] += 1
+            if zone not in self.latency:
+                return None
+            return self.latency[zone] * self._noise()
+
+    def history(self, samples=5):
+        with self._lock:
+            return {zone: [seconds * self._noise() for _ in range(samples)]
+                    for zone, seconds in self.ready_seconds.items()}
+
+    def _noise(self):
+        return 1 + self._random.uniform(-self.jitter, self.jitter)
+
+
+def _call_segment(parts, i):
+    """Path segment for call counting, with UUIDs/IPs/tags collapsed."""
+    if i > 0 and parts[i - 1] == 'tag':
+        return '{tags}'
+    if any(c.isdigit() for c in parts[i]):
+        return '{id}'
+    return parts[i]
+
+
+class FakeUpCloudAPI:
+    """Drop-in replacement for upcloud_api.api.API backed by in-memory state.
+
+    Server states follow a timeline: a new server is 'maintenance' for
+    boot_seconds and then 'started'; it serves HTTP serve_seconds after that.
+    A stop puts it in 'maintenance' for stop_seconds and then 'stopped'.
+    Every request sleeps api_latency, fails with probability error_rate and,
+    if rate_limit (requests/second) is set, is rejected once the token
+    bucket is empty.
+    """
+
+    def __init__(self, boot_seconds=60.0, stop_seconds=15.0, serve_seconds=30.0,
+                 api_latency=0.0, error_rate=0.0, rate_limit=None, burst=None, seed=None):
+        self.boot_seconds = boot_seconds
+        self.stop_seconds = stop_seconds
+        self.serve_seconds = serve_seconds
+        self.api_latency = api_latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.limiter = TokenBucket(rate_limit, burst or rate_limit * 2) if rate_limit else None
+        self.calls = Counter()
+        self.rejected = Counter()
+        # Disks of servers deleted without ?storages=1, which would keep being billed
+        self.orphaned_storages = []
+        self._random = random.Random(seed)
+        self._servers = {}
+        self._storages = {}
+        self._ip_counter = 0
+        self._tags = set()
+        self._lock = threading.Lock()
+
+    def api_request(self, method, endpoint, body=None, params=None, timeout=-1):
+        if self.api_latency:
+            time.sleep(self.api_latency)
+        return self.handle(method, endpoint, body)
+
+    def handle(self, method, endpoint, body=None):
+        """Answer one request immediately (no simulated latency)."""
+        path, _, query = endpoint.partition('?')
+        parts = path.strip('/').split('/')
+        call = f"{method} /" + '/'.join(_call_segment(parts, i) for i in range(len(parts)))
+
+        with self._lock:
+            self.calls[call] += 1
+            if self.limiter and not self.limiter.try_acquire():
+                self.rejected['rate_limited'] += 1
+                raise UpCloudAPIError('TOO_MANY_REQUESTS', 'Simulated rate limit exceeded')
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.rejected['error'] += 1
+                raise UpCloudAPIError('INTERNAL_ERROR', 'Simulated API failure')
+            return self._route(method, parts, body, query)
+
+    def get_request(self, endpoint, params=None, timeout=-1):
+        return self.api_request('GET', endpoint, params=params, timeout=timeout)
+
+    def post_request(self, endpoint, body=None, timeout=-1):
+        return self.api_request('POST', endpoint, body=body, timeout=timeout)
+
+    def put_request(self, endpoint, body=None, timeout=-1):
+        return self.api_request('PUT', endpoint, body=body, timeout=timeout)
+
+    def patch_request(self, endpoint, body=None, timeout=-1):
+        return self.api_request('PATCH', endpoint, body=body, timeout=timeout)
+
+    def delete_request(self, endpoint, timeout=-1):
+        return self.api_request('DELETE', endpoint, timeout=timeout)
+
+    def is_serving(self, ip):
+        """True once the server holding ip has been started for serve_seconds."""
+        with self._lock:
+            for server in self._servers.values():
+                if server['ip'] == ip:
+                    state, since = self._state(server)
+                    return state == 'started' and time.time() - since >= self.serve_seconds
+        return False
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def _route(self, method, parts, body, query=''):
+        resource = parts[0]
+        if method == 'GET' and resource == 'account':
+            return {'account': {'username': 'simulated-user', 'credits': 10000}}
+        if method == 'GET' and resource == 'zone':
+            return {'zones': {'zone': list(FAKE_ZONES)}}
+        if method == 'GET' and resource == 'plan':
+            return {'plans': {'plan': list(FAKE_PLANS)}}
+        if method == 'GET' and resource == 'price':
+            return {'prices': {'zone': [
+                dict({'name': zone['id']}, **{f"server_plan_{plan}": {'amount': 1, 'price': price}
+                                              for plan, price in FAKE_PLAN_PRICES.items()})
+                for zone in FAKE_ZONES
+            ]}}
+        if resource == 'server':
+            return self._route_server(method, parts[1:], body, query)
+        if method == 'GET' and resource == 'ip_address' and len(parts) == 1:
+            return {'ip_addresses': {'ip_address': [
+                self._ip_dict(server) for server in self._servers.values()
+            ]}}
+        if resource == 'storage':
+            return self._route_storage(method, parts[1:], body)
+        if method == 'POST' and resource == 'tag' and len(parts) == 1:
+            name = body['tag']['name']
+            if name in self._tags:
+                raise UpCloudAPIError('TAG_EXISTS', f"The tag {name} already exists.")
+            self._tags.add(name)
+            return {'tag': {'name': name, 'description': body['tag'].get('description'),
+                            'servers': {'server': []}}}
+        raise UpCloudAPIError('NOT_FOUND', f"Simulated API has no {method} /{'/'.join(parts)}")
+
+    def _route_server(self, method, parts, body, query=''):
+        if method == 'GET' and not parts:
+            return {'servers': {'server': [self._server_dict(s) for s in self._servers.values()]}}
+        if method == 'GET' and parts[0] == 'tag':
+            wanted = set(parts[1].replace(':', ',').split(','))
+            return {'servers': {'server': [self._server_dict(s) for s in self._servers.values()
+                                           if wanted & set(s['tags'])]}}
+        if method == 'POST' and not parts:
+            return {'server': self._create(body['server'], full=True)}
+
+        server = self._servers.get(parts[0])
+        if server is None:
+            raise UpCloudAPIError('SERVER_NOT_FOUND', f"The server {parts[0]} does not exist.")
+        state, _ = self._state(server)
+
+        if method == 'GET' and len(parts) == 1:
+            return {'server': self._server_dict(server, full=True)}
+        if method == 'POST' and parts[1:] == ['stop']:
+            if state != 'started':
+                raise UpCloudAPIError('SERVER_STATE_ILLEGAL', f"The server is in {state} state.")
+            now = time.time()
+            server['timeline'] = [(now, 'maintenance'), (now + self.stop_seconds, 'stopped')]
+            return {'server': self._server_dict(server, full=True)}
+        if method == 'POST' and len(parts) == 3 and parts[1] == 'tag':
+            tags = parts[2].split(',')
+            missing = [tag for tag in tags if tag not in self._tags]
+            if missing:
+                raise UpCloudAPIError('TAG_NOT_FOUND', f"The tag {missing[0]} does not exist.")
+            server['tags'] = sorted(set(server['tags']) | set(tags))
+            return {'server': self._server_dict(server, full=True)}
+        if method == 'POST' and parts[1:] == ['start']:
+            now = time.time()
+            server['timeline'] = [(now, 'maintenance'), (now + self.boot_seconds, 'started')]
+            return {'server': self._server_dict(server, full=True)}
+        if method == 'DELETE' and len(parts) == 1:
+            if state != 'stopped':
+                raise UpCloudAPIError('SERVER_STATE_ILLEGAL', f"The server is in {state} state.")
+            del self._servers[server['uuid']]
+            if 'storages=1' not in query.split('&'):
+                self.orphaned_storages.append(server['storage_uuid'])
+            return {}
+        raise UpCloudAPIError('NOT_FOUND', f"Simulated API has no {method} /server/{'/'.join(parts)}")
+
+    def _route_storage(self, method, parts, body):
+        if method == 'GET' and parts == ['template']:
+            return {'storages': {'storage': [
+                {'uuid': '01000000-0000-4000-8000-000030220200', 'title': 'Ubuntu Server 22.04 LTS',
+                 'type': 'template', 'access': 'public', 'state': 'online'},
+            ] + [dict(s) for s in self._storages.values()]}}
+        if method == 'GET' and len(parts) == 1:
+            storage = self._storages.get(parts[0])
+            if storage is None:
+                raise UpCloudAPIError('STORAGE_NOT_FOUND', f"The storage {parts[0]} does not exist.")
+            return {'storage': dict(storage)}
+        if method == 'POST' and parts[1:] == ['templatize']:
+            storage = {'uuid': str(uuid_module.uuid4()), 'title': body['storage']['title'],
+                       'type': 'template', 'access': 'private', 'state': 'online'}
+            self._storages[storage['uuid']] = storage
+            return {'storage': dict(storage)}
+        raise UpCloudAPIError('NOT_FOUND', f"Simulated API has no {method} /storage/{'/'.join(parts)}")
+
+    def _create(self, spec, full=False):
+        now = time.time()
+        self._ip_counter += 1
+        n = self._ip_counter
+        server = {
+            'uuid': str(uuid_module.uuid4()),
+            'title': spec.get('title', spec['hostname']),
+            'hostname': spec['hostname'],
+            'zone': spec['zone'],
+            'plan': spec.get('plan', '1xCPU-1GB'),
+            'created': int(now),
+            'tags': [],
+            'ip': f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}",
+            'storage_uuid': str(uuid_module.uuid4()),
+            'timeline': [(now, 'maintenance'), (now + self.boot_seconds, 'started')],
+        }
+        self._servers[server['uuid']] = server
+        return self._server_dict(server, full=full)
+
+    def _state(self, server):
+        """Current state and the time it was entered."""
+        now = time.time()
+        current = server['timeline'][0]
+        for entry in server['timeline']:
+            if entry[0] <= now:
+                current = entry
+        return current[1], current[0]
+
+    def _ip_dict(self, server):
+        return {'access': 'public', 'address': server['ip'], 'family': 'IPv4',
+                'part_of_plan': 'yes', 'server': server['uuid']}
+
+    def _server_dict(self, server, full=False):
+        data = {
+            'uuid': server['uuid'],
+            'title': server['title'],
+            'hostname': server['hostname'],
+            'zone': server['zone'],
+            'plan': server['plan'],
+            'created': server['created'],
+            'state': self._state(server)[0],
+            'tags': {'tag': list(server['tags'])},
+        }
+        if full:
+            data['ip_addresses'] = {'ip_address': [self._ip_dict(server)]}
+            data['storage_devices'] = {'storage_device': [
+                {'storage': server['storage_uuid'], 'storage_title': f"{server['title']}-disk",
+                 'storage_size': 25, 'type': 'disk', 'address': 'virtio:0'},
+            ]}
+            data['networking'] = {'interfaces': {'interface': [{
+                'index': 1, 'type': 'public',
+                'ip_addresses': {'ip_address': [{'address': server['ip'], 'family': 'IPv4'}]},
+            }]}}
+        return data
+
+
+class AsyncFakeAPI:
+    """The async client interface of async_deployer.AsyncAPI, backed by a FakeUpCloudAPI.
+
+    Latency is simulated with asyncio.sleep, so hundreds of requests can be
+    in flight on one event loop, bounded by `concurrency` like the real client.
+    """
+
+    def __init__(self, fake=None, concurrency=20, **simulation):
+        self.fake = fake or FakeUpCloudAPI(**simulation)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = None
+
+    async def request(self, method, endpoint, body=None):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                if self.fake.api_latency:
+                    await asyncio.sleep(self.fake.api_latency)
+                return self.fake.handle(method, endpoint, body)
+            finally:
+                self.in_flight -= 1
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class LocalSSHPool:
+    """Stand-in for rolling_update.SSHPool that runs scripts locally, one directory per host.
+
+    Each host's filesystem is root/<host>/. nginx and systemctl are stubs;
+    nginx -t fails for hosts in bad_config. Hosts in unreachable behave like
+    a refused SSH connection (exit code 255).
+    """
+
+    def __init__(self, root, bad_config=(), unreachable=()):
+        self.root = root
+        self.bad_config = set(bad_config)
+        self.unreachable = set(unreachable)
+        self.runs = Counter()
+        self._bin = os.path.join(root, '.bin')
+        os.makedirs(self._bin, exist_ok=True)
+        stubs = {'nginx': '[ -z "$NGINX_BROKEN" ]\n', 'systemctl': 'exit 0\n'}
+        for name, body in stubs.items():
+            path = os.path.join(self._bin, name)
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\n' + body)
+            os.chmod(path, 0o755)
+
+    def host_root(self, host):
+        return os.path.join(self.root, host)
+
+    def run(self, host, script, args=(), input=None, timeout=120):
+        self.runs[host] += 1
+        if host in self.unreachable:
+            return 255, '', f"ssh: connect to host {host} port 22: Connection refused"
+        os.makedirs(os.path.join(self.host_root(host), 'var', 'www'), exist_ok=True)
+        env = dict(os.environ, UPDATE_ROOT=self.host_root(host),
+                   PATH=self._bin + os.pathsep + os.environ.get('PATH', ''))
+        if host in self.bad_config:
+            env['NGINX_BROKEN'] = '1'
+        result = subprocess.run(['sh', '-c', script, 'sh', *args], input=input, capture_output=True,
+                                timeout=timeout, env=env)
+        return result.returncode, result.stdout.decode(errors='replace'), result.stderr.decode(errors='replace')
+
+    def is_serving(self, host):
+        return os.path.exists(os.path.join(self.host_root(host), 'var', 'www', 'html', 'index.html'))
+
+    def close(self):
+        pass
+
+
+class FakeCloudManager(CloudManager):
+    """CloudManager talking to a FakeUpCloudAPI instead of api.upcloud.com.
+
+    Keyword arguments configure the simulation, see FakeUpCloudAPI.
+    """
+
+    def __init__(self, **simulation):
+        self.api = FakeUpCloudAPI(**simulation)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+UpCloud Golden Image Baking
+Builds one fully provisioned web server, turns its disk into a private
+template and records it locally, so later deploys can clone a ready-made
+image instead of installing and upgrading packages on every boot.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+GOLDEN_IMAGE_FILE = 'golden_image.json'
+SSH_KEY_FILE = 'upcloud_key'
+
+
+def fingerprint(*parts):
+    """Stable hash of everything that ends up baked into the image."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_golden_image(image_fingerprint, zone, path=GOLDEN_IMAGE_FILE):
+    """Return the recorded golden image for this fingerprint and zone, or None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            images = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable {path}: {e}")
+        return None
+
+    image = images.get(zone)
+    if image and image.get('fingerprint') == image_fingerprint:
+        return image
+    return None
+
+
+def save_golden_image(image, path=GOLDEN_IMAGE_FILE):
+    """Record a golden image; one image is kept per zone."""
+    images = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                images = json.load(f)
+        except (OSError, ValueError):
+            images = {}
+
+    images[image['zone']] = image
+    with open(path, 'w') as f:
+        json.dump(images, f, indent=2)
+
+
+def wait_for_cloud_init(server_ip, timeout=900, key_file=SSH_KEY_FILE):
+    """Block until cloud-init has finished on the server (checked over SSH)."""
+    command = [
+        'ssh', '-i', key_file,
+        '-o', 'StrictHostKeyChecking=no',
+        '-o', 'UserKnownHostsFile=/dev/null',
+        '-o', 'ConnectTimeout=10',
+        '-o', 'BatchMode=yes',
+        f'root@{server_ip}',
+        'cloud-init status --wait',
+    ]
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        try:
+            result = subprocess.run(command, capture_output=True, text=True,
+                                    timeout=timeout - (time.time() - start_time))
+        except subprocess.TimeoutExpired:
+            break
+        if result.returncode == 0:
+            return True
+        if 'status: error' in result.stdout:
+            print(f"❌ cloud-init reported an error: {result.stdout.strip()}")
+            return False
+        # SSH isn't up yet
+        time.sleep(10)
+
+    print(f"⏰ Timeout: cloud-init didn't finish within {timeout / 60:.0f} minutes")
+    return False
+
+
+def wait_for_storage(manager, storage_uuid, timeout=1800):
+    """Wait for a storage (e.g. a new template) to become 'online'."""
+    start_time = time.time()
+    interval = 5
+    while time.time() - start_time < timeout:
+        try:
+            storage = manager.get_storage(storage_uuid)
+            if storage.state == 'online':
+                return True
+            if storage.state == 'error':
+                print(f"❌ Storage {storage_uuid} is in error state")
+                return False
+        except Exception as e:
+            print(f"❌ Error checking storage state: {e}")
+        time.sleep(interval)
+        interval = min(30, interval * 1.5)
+
+    print(f"⏰ Timeout: storage {storage_uuid} wasn't ready within {timeout / 60:.0f} minutes")
+    return False
+
+
+def bake_golden_image(deployer, zone, title="UpCloud-WebServer-Bake"):
+    """Provision one server with the full cloud-init, templatize its disk and record it.
+
+    The bake server is always deleted afterwards (together with its disk).
+    Returns the recorded image dict, or None on failure.
+    """
+    manager = deployer.manager
+    image_fingerprint = deployer.image_fingerprint()
+    print(f"\n🍞 Baking golden image for {zone} (fingerprint {image_fingerprint[:12]})")
+    start_time = time.time()
+
+    server = deployer.create_server(title, zone=zone)
+    if not server:
+        return None
+    server_uuid = server.uuid
+
+    try:
+        server = deployer.wait_for_server(server_uuid, timeout=600)
+        if not server:
+            return None
+
+        server_ip = deployer.get_server_ip(server)
+        if not server_ip:
+            print("❌ Could not find the bake server's IP, so cloud-init can't be checked")
+            return None
+
+        print("⏳ Waiting for cloud-init to install and configure everything...")
+        if not wait_for_cloud_init(server_ip):
+            return None
+        print(f"✅ cloud-init finished ({(time.time() - start_time) / 60:.1f} min)")
+
+        print("⏹️  Stopping bake server...")
+        server.stop()
+        if not deployer.waiter.wait(server_uuid, 'stopped', timeout=300, from_state='started'):
+            print("❌ Bake server didn't stop")
+            return None
+
+        storage_uuid = server.storage_devices[0].uuid
+        print(f"📀 Creating template from disk {storage_uuid}...")
+        template = manager.templatize_storage(storage_uuid, f"{title} {image_fingerprint[:12]}")
+        if not wait_for_storage(manager, template.uuid):
+            return None
+
+        image = {
+            'zone': zone,
+            'template_uuid': template.uuid,
+            'fingerprint': image_fingerprint,
+            'bake_seconds': round(time.time() - start_time, 1),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        save_golden_image(image)
+        print(f"✅ Golden image ready: {template.uuid} ({image['bake_seconds'] / 60:.1f} min)")
+        print(f"   Saved to: {GOLDEN_IMAGE_FILE}")
+        print(f"   Deploy from it with: python deploy_upcloud.py --golden")
+        return image
+
+    except Exception as e:
+        print(f"❌ Failed to bake golden image: {e}")
+        return None
+
+    finally:
+        print("🗑️  Deleting bake server...")
+        try:
+            current = manager.get_server(server_uuid)
+            if current.state == 'started':
+                current.stop()
+                deployer.waiter.wait(server_uuid, 'stopped', timeout=300, from_state='started')
+            manager.delete_server(server_uuid, delete_storages=True)
+            if deployer.inventory:
+                deployer.inventory.mark_deleted(server_uuid)
+        except Exception as e:
+            print(f"⚠️  Could not delete bake server {server_uuid}: {e}")
+            print(f"   Please delete it from the UpCloud control panel")
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+UpCloud Server Inventory
+A local SQLite record of every server these scripts create, indexed by
+UUID, title, zone, creation time and tag. Cleanup and status look servers
+up here and then ask the API about just those servers (one get_server()
+call each, or one listing plus one GET /ip_address for larger sets),
+instead of listing the whole account and matching titles.
+
+Rows are kept after deletion (with a `deleted` time) so past timings stay
+queryable; lookups skip them unless asked.
+
+The deploys table is a write-ahead journal of deployments, keyed by an
+idempotency key (title + hostname). Each step is written before the
+script moves on, so a rerun can pick up a server an interrupted run
+left behind instead of creating a duplicate.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+INVENTORY_FILE = 'upcloud_inventory.db'
+
+# Older single-server/fleet records, imported into a new inventory
+LEGACY_FILES = ('deployed_server.json', 'deployed_fleet.json')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    uuid TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    zone TEXT,
+    plan TEXT,
+    ip TEXT,
+    ipv6 TEXT,
+    template TEXT,
+    page_version TEXT,
+    state TEXT,
+    created REAL NOT NULL,
+    deleted REAL,
+    checked REAL,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS servers_title ON servers (title);
+CREATE INDEX IF NOT EXISTS servers_zone ON servers (zone, created);
+CREATE INDEX IF NOT EXISTS servers_created ON servers (created);
+CREATE TABLE IF NOT EXISTS tags (
+    uuid TEXT NOT NULL REFERENCES servers (uuid) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tag, uuid)
+);
+CREATE TABLE IF NOT EXISTS deploys (
+    key TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    zone TEXT,
+    plan TEXT,
+    uuid TEXT,
+    ip TEXT,
+    step TEXT NOT NULL,
+    requested REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deploys_step ON deploys (step);
+"""
+
+# Columns added since the first version, added to older inventories when they're opened
+ADDED_COLUMNS = {'servers': {'ipv6': 'TEXT', 'page_version': 'TEXT'}}
+
+# Columns callers may set through add()/update()
+FIELDS = ('title', 'zone', 'plan', 'ip', 'ipv6', 'template', 'page_version', 'state', 'created', 'deleted',
+          'checked', 'timings')
+
+# reconcile() switches from one get_server() per record to two account-wide calls above this
+BATCH_RECONCILE = 20
+
+# Deploy journal steps, in order; 'ready' and 'failed' are final
+DEPLOY_STEPS = ('requested', 'created', 'started', 'ip', 'ready', 'failed')
+FINAL_STEPS = ('ready', 'failed')
+JOURNAL_FIELDS = ('title', 'hostname', 'zone', 'plan', 'uuid', 'ip')
+
+
+class Inventory:
+    """Thread-safe SQLite store of the servers we've created."""
+
+    def __init__(self, path=INVENTORY_FILE):
+        self.path = path
+        is_new = path == ':memory:' or not os.path.exists(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute("PRAGMA foreign_keys = ON")
+            self._db.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row['name'] for row in self._db.execute(f"PRAGMA table_info({table})")}
+                for name, column_type in columns.items():
+                    if name not in existing:
+                        self._db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+        if is_new:
+            self.import_legacy()
+
+    def close(self):
+        self._db.close()
+
+    def add(self, uuid, title, zone=None, plan=None, tags=(), **fields):
+        """Record a server (or update the one already recorded under this UUID)."""
+        fields.update(title=title, zone=zone, plan=plan)
+        fields = {k: v for k, v in self._encode(fields).items() if v is not None}
+        # Re-recording a server keeps its original creation time unless one is given
+        updates = ', '.join(f"{name} = excluded.{name}" for name in fields)
+        fields.setdefault('created', time.time())
+        columns = ', '.join(fields)
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT INTO servers (uuid, {columns}) VALUES (?{', ?' * len(fields)}) "
+                f"ON CONFLICT (uuid) DO UPDATE SET {updates}",
+                [uuid, *fields.values()])
+            self._db.executemany("INSERT OR IGNORE INTO tags (uuid, tag) VALUES (?, ?)",
+                                 [(uuid, tag) for tag in tags])
+
+    def update(self, uuid, **fields):
+        """Change some fields of a recorded server."""
+        fields = self._encode(fields)
+        if not fields:
+            return
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE servers SET {assignments} WHERE uuid = ?",
+                             [*fields.values(), uuid])
+
+    def mark_deleted(self, uuid):
+        self.update(uuid, state='deleted', deleted=time.time())
+
+    def get(self, uuid):
+        """The recorded server as a dict, or None."""
+        rows = self._query("SELECT * FROM servers WHERE uuid = ?", [uuid])
+        return rows[0] if rows else None
+
+    def find(self, title=None, zone=None, tag=None, older_than=None, newer_than=None,
+             include_deleted=False):
+        """Recorded servers matching every given filter, oldest first.
+
+        title is a glob ('UpCloud-WebServer*'); with a literal prefix it's an
+        index range scan. older_than and newer_than are ages in seconds.
+        """
+        clauses, params = [], []
+        if not include_deleted:
+            clauses.append("s.deleted IS NULL")
+        if title:
+            clauses.append("s.title GLOB ?")
+            params.append(title)
+        if zone:
+            clauses.append("s.zone = ?")
+            params.append(zone)
+        if older_than is not None:
+            clauses.append("s.created <= ?")
+            params.append(time.time() - older_than)
+        if newer_than is not None:
+            clauses.append("s.created >= ?")
+            params.append(time.time() - newer_than)
+        sql = "SELECT s.* FROM servers s"
+        if tag:
+            sql += " JOIN tags t ON t.uuid = s.uuid AND t.tag = ?"
+            params.insert(0, tag)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._query(sql + " ORDER BY s.created", params)
+
+    def tags(self, uuid):
+        return [row['tag'] for row in self._query("SELECT tag FROM tags WHERE uuid = ?", [uuid])]
+
+    def retag(self, uuid, remove=(), add=()):
+        """Remove and add local tags on a recorded server."""
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM tags WHERE uuid = ? AND tag = ?",
+                                 [(uuid, tag) for tag in remove])
+            self._db.executemany("INSERT OR IGNORE INTO tags (uuid, tag) VALUES (?, ?)",
+                                 [(uuid, tag) for tag in add])
+
+    def claim(self, tag, new_tag):
+        """Atomically move the oldest live server tagged `tag` to `new_tag`.
+
+        Safe across processes (the write lock is taken before looking), so two
+        callers never claim the same server. Returns its record, or None.
+        """
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                row = self._db.execute(
+                    "SELECT s.uuid FROM servers s JOIN tags t ON t.uuid = s.uuid AND t.tag = ? "
+                    "WHERE s.deleted IS NULL ORDER BY s.created LIMIT 1", [tag]).fetchone()
+                if row is not None:
+                    self._db.execute("DELETE FROM tags WHERE uuid = ? AND tag = ?", [row['uuid'], tag])
+                    self._db.execute("INSERT OR IGNORE INTO tags (uuid, tag) VALUES (?, ?)",
+                                     [row['uuid'], new_tag])
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return self.get(row['uuid']) if row is not None else None
+
+    def journal(self, key):
+        """The deploy journal entry for this idempotency key, or None."""
+        rows = self._query("SELECT * FROM deploys WHERE key = ?", [key])
+        return rows[0] if rows else None
+
+    def journal_write(self, key, step, **fields):
+        """Record that the deploy with this key reached `step` (committed before returning).
+
+        Writing 'requested' starts the entry over, forgetting any server an
+        earlier attempt had; later steps keep the fields already recorded.
+        """
+        if step not in DEPLOY_STEPS:
+            raise ValueError(f"Unknown deploy step: {step}")
+        unknown = set(fields) - set(JOURNAL_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown journal fields: {', '.join(sorted(unknown))}")
+        now = time.time()
+        with self._lock, self._db:
+            if step == 'requested':
+                fields = {name: fields.get(name) for name in JOURNAL_FIELDS}
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO deploys (key, step, requested, updated, "
+                    f"{', '.join(fields)}) VALUES (?, ?, ?, ?{', ?' * len(fields)})",
+                    [key, step, now, now, *fields.values()])
+            else:
+                assignments = ''.join(f", {name} = ?" for name in fields)
+                self._db.execute(f"UPDATE deploys SET step = ?, updated = ?{assignments} WHERE key = ?",
+                                 [step, now, *fields.values(), key])
+
+    def in_flight(self):
+        """Journal entries of deploys that never reached 'ready' or 'failed', oldest first."""
+        return self._query(f"SELECT * FROM deploys WHERE step NOT IN ({', '.join('?' * len(FINAL_STEPS))}) "
+                           "ORDER BY requested", list(FINAL_STEPS))
+
+    def reconcile(self, manager, records, max_age=0, workers=10, batch=BATCH_RECONCILE):
+        """Refresh the given records from the API and drop the ones that no longer exist.
+
+        Up to `batch` stale records cost one get_server() call each, made
+        concurrently, so the cost follows the number of matches rather than
+        the size of the account. Beyond that, one account listing and one
+        GET /ip_address cover them all. Records checked less than max_age
+        seconds ago are trusted as they are and not fetched. Servers the
+        API no longer knows are marked deleted. Returns (servers, fresh):
+        live Server objects for the records that were fetched, and the
+        records that were recent enough to skip.
+        """
+        now = time.time()
+        stale, fresh = [], []
+        for record in records:
+            if record['checked'] and now - record['checked'] < max_age:
+                fresh.append(record)
+            else:
+                stale.append(record)
+        if not stale:
+            return [], fresh
+        # Imported here so the status fast path doesn't pay for them
+        from servers import IPResolver, ServerInfo
+
+        def refresh(record, server, addresses=None):
+            info = ServerInfo.from_api(server)
+            ipv4, ipv6 = addresses or (info.ipv4, info.ipv6)
+            self.update(record['uuid'], state=info.state, checked=time.time(),
+                        ip=ipv4 or record['ip'], ipv6=ipv6 or record['ipv6'])
+            return server
+
+        if len(stale) > batch:
+            listed = {server.uuid: server for server in manager.get_servers()}
+            alive = [r['uuid'] for r in stale if r['uuid'] in listed]
+            addresses = IPResolver(manager).resolve(alive) if alive else {}
+            servers = []
+            for record in stale:
+                if record['uuid'] in listed:
+                    servers.append(refresh(record, listed[record['uuid']], addresses.get(record['uuid'])))
+                else:
+                    self.mark_deleted(record['uuid'])
+            return servers, fresh
+
+        def fetch(record):
+            try:
+                server = manager.get_server(record['uuid'])
+            except Exception as e:
+                if 'NOT_FOUND' not in str(getattr(e, 'error_code', '')):
+                    raise
+                self.mark_deleted(record['uuid'])
+                return None
+            return refresh(record, server)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(workers, len(stale))) as pool:
+            servers = [s for s in pool.map(fetch, stale) if s is not None]
+        return servers, fresh
+
+    def adopt(self, servers):
+        """Record servers found by an account listing (e.g. ones created elsewhere)."""
+        for server in servers:
+            created = getattr(server, 'created', None)
+            self.add(server.uuid, server.title, zone=getattr(server, 'zone', None),
+                     plan=getattr(server, 'plan', None), state=getattr(server, 'state', None),
+                     created=float(created) if created else None,
+                     tags=getattr(server, 'tags', None) or (), checked=time.time())
+
+    def import_legacy(self):
+        """Import deployed_server.json / deployed_fleet.json from older versions."""
+        for path in LEGACY_FILES:
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for record in data.get('servers', [data]):
+                if not record.get('uuid'):
+                    continue
+                created = record.get('created') or data.get('created')
+                try:
+                    created = time.mktime(time.strptime(created, '%Y-%m-%d %H:%M:%S'))
+                except (TypeError, ValueError):
+                    created = None
+                timings = record.get('timings') or {k: v for k, v in record.items() if k.endswith('_seconds')}
+                self.add(record['uuid'], record['title'], zone=record.get('zone'),
+                         plan=record.get('plan'), ip=record.get('ip'), created=created,
+                         timings=timings or None)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [self._decode(row) for row in rows]
+
+    @staticmethod
+    def _encode(fields):
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown inventory fields: {', '.join(sorted(unknown))}")
+        if isinstance(fields.get('timings'), dict):
+            fields['timings'] = json.dumps(fields['timings'])
+        return fields
+
+    @staticmethod
+    def _decode(row):
+        record = dict(row)
+        if record.get('timings'):
+            record['timings'] = json.loads(record['timings'])
+        return record
+
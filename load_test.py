@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+UpCloud Load Test
+A small asyncio HTTP/1.1 load generator. `connections` keep-alive
+connections send requests back to back for `duration` seconds, and the
+latency of every response is recorded. Reports requests per second and
+latency percentiles (p50/p90/p99).
+
+    python load_test.py http://SERVER_IP/ --connections 50 --duration 10
+    python load_test.py --local     # against a local stand-in serving web_page/
+
+Only the standard library is used, so it runs wherever Python does.
+"""
+
+import argparse
+import asyncio
+import functools
+import http.server
+import threading
+import time
+from urllib.parse import urlsplit
+
+from cloud_init import PAGE_DIR
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+async def read_response(reader):
+    """Read one response; returns (status, body bytes, keep_alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            body += await reader.readexactly(size)
+            await reader.readline()
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+        return status, body, False
+    return status, bytes(body), headers.get('connection', '').lower() != 'close'
+
+
+async def _connection(url, deadline, results, timeout):
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    request = (f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+               f"Accept-Encoding: gzip\r\nConnection: keep-alive\r\n\r\n").encode('latin-1')
+
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+            start = time.perf_counter()
+            writer.write(request)
+            status, body, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            results['latencies'].append(time.perf_counter() - start)
+            results['statuses'][status] = results['statuses'].get(status, 0) + 1
+            results['bytes'] += len(body)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+            results['errors'] += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+            # Don't spin on a refused connection
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(url, connections=50, duration=10.0, timeout=10.0):
+    """Load url for duration seconds; returns a summary dict."""
+    results = {'latencies': [], 'statuses': {}, 'errors': 0, 'bytes': 0}
+    start_time = time.perf_counter()
+    deadline = start_time + duration
+    await asyncio.gather(*(_connection(url, deadline, results, timeout) for _ in range(connections)))
+    elapsed = time.perf_counter() - start_time
+
+    latencies = sorted(results['latencies'])
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        'url': url,
+        'connections': connections,
+        'seconds': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': results['errors'],
+        'statuses': results['statuses'],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p90_ms': ms(percentile(latencies, 0.90)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+        'mean_body_bytes': round(results['bytes'] / len(latencies)) if latencies else None,
+    }
+
+
+def serve_local(directory=PAGE_DIR):
+    """A local stand-in node serving directory over HTTP/1.1 keep-alive; returns (server, url)."""
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                             functools.partial(Handler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def print_report(report):
+    print(f"\n📊 Load test: {report['url']}")
+    print(f"   {report['connections']} connections for {report['seconds']}s")
+    print(f"   Requests: {report['requests']} ({report['errors']} errors, statuses {report['statuses']})")
+    print(f"   Throughput: {report['requests_per_second']} req/s")
+    if not report['requests']:
+        return
+    print(f"   Latency: p50 {report['p50_ms']} ms, p90 {report['p90_ms']} ms, "
+          f"p99 {report['p99_ms']} ms, max {report['max_ms']} ms")
+    print(f"   Response body: {report['mean_body_bytes']} bytes on average")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure req/s and p99 latency of a web server")
+    parser.add_argument('url', nargs='?', help="URL to load, e.g. http://SERVER_IP/")
+    parser.add_argument('--local', action='store_true',
+                        help="start a local stand-in serving web_page/ and load that instead")
+    parser.add_argument('--connections', type=int, default=50, help="concurrent connections (default 50)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to run (default 10)")
+    parser.add_argument('--timeout', type=float, default=10, help="per-request timeout in seconds")
+    args = parser.parse_args(argv)
+    if not args.url and not args.local:
+        parser.error("give a URL or --local")
+
+    server = None
+    url = args.url
+    if args.local:
+        server, url = serve_local()
+        print(f"🖥️  Local stand-in serving {PAGE_DIR}/ at {url}")
+    try:
+        report = asyncio.run(run_load(url, args.connections, args.duration, args.timeout))
+    finally:
+        if server is not None:
+            server.shutdown()
+    print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
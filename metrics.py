@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+UpCloud Deployment Metrics
+Times every API call and every deployment phase (credential check, create,
+boot, IP discovery, readiness, teardown) and saves them as JSON, optionally
+also as a Prometheus textfile for node_exporter's textfile collector.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# CloudManager methods whose calls are timed
+TIMED_CALLS = ('get_account', 'get_zones', 'create_server', 'get_server', 'get_servers',
+               'delete_server', 'get_ips', 'get_storage', 'templatize_storage')
+
+
+class Metrics:
+    """Thread-safe collector of API call and phase durations for one run."""
+
+    def __init__(self, script):
+        self.script = script
+        self.started = time.time()
+        self.phases = {}
+        self.calls = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a deployment phase: `with metrics.phase('boot'): ...`"""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self._add(self.phases, name, time.time() - start_time)
+
+    def record_phase(self, name, seconds):
+        """Record a phase that was timed elsewhere (e.g. across callbacks)."""
+        self._add(self.phases, name, seconds)
+
+    def record_call(self, name, seconds, ok=True):
+        self._add(self.calls, name, seconds)
+        if not ok:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def timed(self, name, fn):
+        """Wrap fn so every call is recorded under name."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start_time = time.time()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self.record_call(name, time.time() - start_time, ok)
+        return wrapper
+
+    def instrument(self, manager):
+        """Return manager wrapped so its API calls (and server.stop) are timed."""
+        return InstrumentedManager(manager, self)
+
+    def has_data(self):
+        return bool(self.phases or self.calls)
+
+    def summary(self):
+        """Per-phase and per-call count/total/min/max/mean in seconds."""
+        with self._lock:
+            return {
+                'script': self.script,
+                'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+                'wall_seconds': round(time.time() - self.started, 3),
+                'phases': {name: _stats(samples) for name, samples in self.phases.items()},
+                'api_calls': {name: _stats(samples) for name, samples in self.calls.items()},
+                'api_errors': dict(self.errors),
+            }
+
+    def save(self, path, prometheus_path=None):
+        """Write the summary as JSON, and as a Prometheus textfile if asked."""
+        summary = self.summary()
+        try:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f"📈 Timing metrics saved to: {path}")
+            if prometheus_path:
+                _write_atomic(prometheus_path, self.prometheus_text(summary))
+                print(f"📈 Prometheus metrics saved to: {prometheus_path}")
+        except OSError as e:
+            print(f"⚠️  Could not save metrics: {e}")
+        return summary
+
+    def prometheus_text(self, summary=None):
+        """Render the summary in the Prometheus text exposition format."""
+        summary = summary or self.summary()
+        script = summary['script']
+        lines = [
+            '# HELP upcloud_phase_duration_seconds Duration of deployment phases.',
+            '# TYPE upcloud_phase_duration_seconds summary',
+        ]
+        for name, stats in summary['phases'].items():
+            labels = f'script="{script}",phase="{name}"'
+            lines.append(f'upcloud_phase_duration_seconds_sum{{{labels}}} {stats["total"]}')
+            lines.append(f'upcloud_phase_duration_seconds_count{{{labels}}} {stats["count"]}')
+        lines += [
+            '# HELP upcloud_api_call_duration_seconds Duration of UpCloud API calls.',
+            '# TYPE upcloud_api_call_duration_seconds summary',
+        ]
+        for name, stats in summary['api_calls'].items():
+            labels = f'script="{script}",call="{name}"'
+            lines.append(f'upcloud_api_call_duration_seconds_sum{{{labels}}} {stats["total"]}')
+            lines.append(f'upcloud_api_call_duration_seconds_count{{{labels}}} {stats["count"]}')
+        lines += [
+            '# HELP upcloud_api_call_errors_total Failed UpCloud API calls.',
+            '# TYPE upcloud_api_call_errors_total counter',
+        ]
+        for name, count in summary['api_errors'].items():
+            lines.append(f'upcloud_api_call_errors_total{{script="{script}",call="{name}"}} {count}')
+        lines += [
+            '# HELP upcloud_run_wall_seconds Wall-clock duration of the last run.',
+            '# TYPE upcloud_run_wall_seconds gauge',
+            f'upcloud_run_wall_seconds{{script="{script}"}} {summary["wall_seconds"]}',
+            '# HELP upcloud_run_timestamp_seconds Start time of the last run.',
+            '# TYPE upcloud_run_timestamp_seconds gauge',
+            f'upcloud_run_timestamp_seconds{{script="{script}"}} {self.started:.0f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, table, name, seconds):
+        with self._lock:
+            table.setdefault(name, []).append(seconds)
+
+
+class InstrumentedManager:
+    """CloudManager proxy that records the duration of every call in TIMED_CALLS.
+
+    Servers it returns get a timed stop() as well.
+    """
+
+    def __init__(self, manager, metrics):
+        self.manager = manager
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.manager, name)
+        if name not in TIMED_CALLS or not callable(attr):
+            return attr
+        timed = self.metrics.timed(name, attr)
+        if name in ('create_server', 'get_server', 'get_servers'):
+            return functools.wraps(attr)(lambda *args, **kwargs: self._wrap_servers(timed(*args, **kwargs)))
+        return timed
+
+    def _wrap_servers(self, result):
+        servers = result if isinstance(result, list) else [result]
+        for server in servers:
+            if hasattr(server, 'stop'):
+                # Server objects refuse normal attribute writes, so go around __setattr__
+                object.__setattr__(server, 'stop', self.metrics.timed('server.stop', server.stop))
+        return result
+
+
+def phase_method(name):
+    """Decorator timing a method as a phase on its instance's `metrics`."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _stats(samples):
+    return {
+        'count': len(samples),
+        'total': round(sum(samples), 3),
+        'min': round(min(samples), 3),
+        'max': round(max(samples), 3),
+        'mean': round(sum(samples) / len(samples), 3),
+    }
+
+
+def _write_atomic(path, text):
+    # The textfile collector may read at any moment, so never expose a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
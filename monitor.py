@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+UpCloud Fleet Health Monitor
+Keeps watching the servers in the inventory after they've been deployed.
+Every `interval` seconds each server is probed over HTTP (GET /, timed)
+and the API state of the whole fleet is read with one server list call.
+Probes run concurrently on one event loop, at most `concurrency` at a
+time, so a few thousand servers fit in one process.
+
+Results go into FleetSeries, a ring buffer of the last `window` rounds
+for every server, kept in flat preallocated arrays (4 bytes of latency
+and 1 byte of state per server per round), so memory stays fixed however
+long the monitor runs. Reports give p50/p95 latency and availability per
+server and for the whole fleet.
+
+    python monitor.py                       # probe every 30s until Ctrl+C
+    python monitor.py --once                # one round and a report
+    python monitor.py --simulate 3000       # benchmark against local stand-ins
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+import tracemalloc
+from array import array
+
+from load_test import percentile, read_response
+
+# Rounds kept per server: 2 hours at the default 30 s interval
+DEFAULT_WINDOW = 240
+DEFAULT_INTERVAL = 30
+DEFAULT_CONCURRENCY = 256
+
+# API states as stored in the state buffer; 0 means not probed
+STATES = (None, 'started', 'stopped', 'maintenance', 'error', 'missing')
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+
+NAN = float('nan')
+
+
+class FleetSeries:
+    """The last `window` probe rounds of every server, in flat arrays.
+
+    Each server owns a fixed slot: `window` latencies (float32 ms, NaN when
+    the probe failed or didn't run) and `window` state codes. Round n is
+    written at position n % window, so old rounds are overwritten in place.
+    Slots of servers that are dropped are reused by new ones.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.rounds = 0
+        self.times = array('d', [0.0]) * window
+        self.latency = array('f')
+        self.state = array('B')
+        self.slots = {}
+        self._first_round = {}
+        self._free = []
+
+    def add(self, uuid):
+        """Give a server a slot (a no-op if it has one)."""
+        if uuid in self.slots:
+            return
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self.latency) // self.window
+            self.latency.extend(array('f', [NAN]) * self.window)
+            self.state.extend(array('B', [0]) * self.window)
+        self.slots[uuid] = slot
+        self._first_round[uuid] = self.rounds
+
+    def drop(self, uuid):
+        """Forget a server; its slot is cleared and reused."""
+        slot = self.slots.pop(uuid, None)
+        if slot is not None:
+            # Free slots stay NaN, so fleet() can scan the whole buffer
+            start = slot * self.window
+            self.latency[start:start + self.window] = array('f', [NAN]) * self.window
+            self.state[start:start + self.window] = array('B', [0]) * self.window
+            self._free.append(slot)
+            del self._first_round[uuid]
+
+    def record(self, when, latencies, states):
+        """Store one round: {uuid: seconds or None} and {uuid: API state}."""
+        position = self.rounds % self.window
+        self.times[position] = when
+        for uuid, slot in self.slots.items():
+            seconds = latencies.get(uuid)
+            index = slot * self.window + position
+            self.latency[index] = NAN if seconds is None else seconds * 1000
+            self.state[index] = STATE_CODES.get(states.get(uuid), 0)
+        self.rounds += 1
+
+    def samples(self, uuid):
+        """Rounds recorded for this server that are still in the window."""
+        return min(self.rounds - self._first_round[uuid], self.window)
+
+    def node(self, uuid):
+        """p50/p95 latency, availability and last API state of one server."""
+        start = self.slots[uuid] * self.window
+        row = self.latency[start:start + self.window]
+        samples = self.samples(uuid)
+        answered = sorted(ms for ms in row if not math.isnan(ms))
+        last = self.state[start + (self.rounds - 1) % self.window] if samples else 0
+        return _summary(answered, samples, STATES[last])
+
+    def fleet(self):
+        """The same summary over every sample of every live server in the window."""
+        samples = sum(self.samples(uuid) for uuid in self.slots)
+        answered = sorted(ms for ms in self.latency if not math.isnan(ms))
+        return _summary(answered, samples, None)
+
+    def nbytes(self):
+        """Memory held by the sample buffers."""
+        return sum(a.buffer_info()[1] * a.itemsize for a in (self.times, self.latency, self.state))
+
+
+def _summary(answered, samples, state):
+    return {
+        'samples': samples,
+        'availability': round(len(answered) / samples, 4) if samples else None,
+        'p50_ms': round(percentile(answered, 0.50), 2) if answered else None,
+        'p95_ms': round(percentile(answered, 0.95), 2) if answered else None,
+        'state': state,
+    }
+
+
+async def probe_http(host, port=80, path='/', timeout=5.0):
+    """Seconds until a complete 200 response to GET path, or None if it failed."""
+    start = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+        status, _, _ = await asyncio.wait_for(read_response(reader), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+    return time.perf_counter() - start if status == 200 else None
+
+
+class FleetMonitor:
+    """Probes the inventoried servers on a schedule and keeps their history in a FleetSeries.
+
+    The server list is re-read from the inventory every round, so servers
+    deployed or deleted while the monitor runs are picked up. find holds
+    the Inventory.find() filters. Without a manager only HTTP is probed.
+    """
+
+    def __init__(self, inventory, manager=None, interval=DEFAULT_INTERVAL, window=DEFAULT_WINDOW,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=5.0, path='/', find=None):
+        self.inventory = inventory
+        self.manager = manager
+        self.interval = interval
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.path = path
+        self.find = find or {}
+        self.series = FleetSeries(window)
+        self.records = {}
+
+    def target(self, record):
+        """(host, port) to probe for a server."""
+        return record['ip'], 80
+
+    def api_states(self):
+        """{uuid: state} for every server in the account, from one list call."""
+        return {server.uuid: server.state for server in self.manager.get_servers()}
+
+    async def probe_round(self):
+        """Probe every server once and record the round; returns its wall-clock seconds."""
+        start = time.perf_counter()
+        records = {r['uuid']: r for r in self.inventory.find(**self.find) if r['ip']}
+        for uuid in self.records.keys() - records.keys():
+            self.series.drop(uuid)
+        for uuid in records:
+            self.series.add(uuid)
+        self.records = records
+
+        states = {}
+        if self.manager is not None:
+            listed = await asyncio.to_thread(self.api_states)
+            states = {uuid: listed.get(uuid, 'missing') for uuid in records}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def probe(record):
+            async with semaphore:
+                host, port = self.target(record)
+                return record['uuid'], await probe_http(host, port, self.path, self.timeout)
+
+        latencies = dict(await asyncio.gather(*(probe(r) for r in records.values())))
+        self.series.record(time.time(), latencies, states)
+        return time.perf_counter() - start
+
+    def report(self):
+        """{'fleet': summary, 'nodes': {uuid: summary with title and ip}}."""
+        nodes = {}
+        for uuid, record in self.records.items():
+            nodes[uuid] = dict(self.series.node(uuid), title=record['title'], ip=record['ip'])
+        return {'time': time.time(), 'rounds': self.series.rounds,
+                'fleet': self.series.fleet(), 'nodes': nodes}
+
+    async def run(self, rounds=None, report_every=1, on_report=None):
+        """Probe every interval seconds (forever, or for `rounds` rounds), reporting every report_every rounds."""
+        done = 0
+        while rounds is None or done < rounds:
+            started = time.monotonic()
+            await self.probe_round()
+            done += 1
+            if on_report and done % report_every == 0:
+                on_report(self.report())
+            if rounds is None or done < rounds:
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+def print_report(report, worst=5):
+    fleet = report['fleet']
+    print(f"\n🩺 Fleet health: {len(report['nodes'])} servers, {report['rounds']} rounds")
+    if not fleet['samples']:
+        return
+    print(f"   Availability: {fleet['availability']:.2%}")
+    if fleet['p50_ms'] is not None:
+        print(f"   Latency: p50 {fleet['p50_ms']} ms, p95 {fleet['p95_ms']} ms")
+    unhealthy = sorted((n for n in report['nodes'].values() if n['samples']),
+                       key=lambda n: (n['availability'], -(n['p95_ms'] or 0)))[:worst]
+    for node in unhealthy:
+        if node['availability'] == 1 and node['state'] in ('started', None):
+            break
+        latency = f"p95 {node['p95_ms']} ms" if node['p95_ms'] is not None else "no answers"
+        print(f"   ⚠️  {node['title']} ({node['ip']}) - {node['availability']:.0%} available, "
+              f"{latency}, API state {node['state']}")
+
+
+class SimulatedMonitor(FleetMonitor):
+    """FleetMonitor whose servers are all answered by one local stand-in."""
+
+    def __init__(self, inventory, port, **kwargs):
+        super().__init__(inventory, **kwargs)
+        self.port = port
+
+    def target(self, record):
+        return '127.0.0.1', self.port
+
+
+async def _stand_in(body):
+    """A minimal local HTTP server answering every request with body."""
+    response = (b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nConnection: close\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(body)) + body
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(response)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0, backlog=4096)
+
+
+async def simulate(count, rounds=5, window=DEFAULT_WINDOW, concurrency=DEFAULT_CONCURRENCY):
+    """Monitor `count` simulated servers for `rounds` back-to-back rounds; returns the measurements."""
+    import tempfile
+    from cloud_init import PAGE_DIR
+    from fake_upcloud import FakeCloudManager
+    from inventory import Inventory
+
+    manager = FakeCloudManager(boot_seconds=0, api_latency=0)
+    inventory = Inventory(os.path.join(tempfile.mkdtemp(prefix='upcloud-monitor-'), 'inventory.db'))
+    for n in range(count):
+        title = f"Monitor-{n}"
+        server = manager.api.handle('POST', '/server', {'server': {
+            'title': title, 'hostname': f"{title.lower()}.example.com", 'zone': 'fi-hel1'}})['server']
+        ip = server['ip_addresses']['ip_address'][0]['address']
+        inventory.add(server['uuid'], title, zone='fi-hel1', ip=ip, state='started')
+
+    with open(os.path.join(PAGE_DIR, 'index.html'), 'rb') as f:
+        server = await _stand_in(f.read())
+    port = server.sockets[0].getsockname()[1]
+    monitor = SimulatedMonitor(inventory, port, manager=manager, interval=0, window=window,
+                               concurrency=concurrency)
+
+    cpu_start = time.process_time()
+    wall = [await monitor.probe_round() for _ in range(rounds)]
+    cpu = time.process_time() - cpu_start
+    # Memory is traced in a separate round, tracing slows everything down
+    tracemalloc.start()
+    await monitor.probe_round()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report_start = time.perf_counter()
+    report = monitor.report()
+    report_seconds = time.perf_counter() - report_start
+    server.close()
+    await server.wait_closed()
+
+    probes = count * rounds
+    return {
+        'servers': count,
+        'rounds': rounds,
+        'round_seconds': round(sum(wall) / rounds, 3),
+        'cpu_us_per_probe': round(cpu / probes * 1e6, 1),
+        'peak_kib': round(peak / 1024),
+        'series_kib': round(monitor.series.nbytes() / 1024),
+        'report_seconds': round(report_seconds, 3),
+        'availability': report['fleet']['availability'],
+        'list_calls_per_round': manager.api.calls['GET /server'] / (rounds + 1),
+    }
+
+
+def _live_monitor(args):
+    """A FleetMonitor over the real inventory and API (HTTP only without credentials)."""
+    from dotenv import load_dotenv
+    from inventory import Inventory, INVENTORY_FILE
+    load_dotenv()
+    manager = None
+    if os.getenv('UPCLOUD_USERNAME') and os.getenv('UPCLOUD_PASSWORD'):
+        from transport import create_cloud_manager
+        manager = create_cloud_manager(os.getenv('UPCLOUD_USERNAME'), os.getenv('UPCLOUD_PASSWORD'))
+    else:
+        print("⚠️  No UpCloud credentials in .env; probing HTTP only")
+    return FleetMonitor(Inventory(INVENTORY_FILE), manager=manager, interval=args.interval,
+                        window=args.window, concurrency=args.concurrency, timeout=args.timeout,
+                        find=dict(title=args.title, zone=args.zone, tag=args.tag))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe deployed servers and report latency and availability")
+    parser.add_argument('--title', help="title glob, e.g. 'UpCloud-WebServer*'")
+    parser.add_argument('--zone', help="only servers in this zone")
+    parser.add_argument('--tag', help="only servers with this tag")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f"seconds between probe rounds (default {DEFAULT_INTERVAL})")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help=f"rounds of history kept per server (default {DEFAULT_WINDOW})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"probes in flight at once (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--timeout', type=float, default=5, help="per-probe timeout in seconds")
+    parser.add_argument('--report-every', type=int, default=10, help="print a report every N rounds")
+    parser.add_argument('--once', action='store_true', help="probe once, report and exit")
+    parser.add_argument('--json', metavar='PATH', help="also write each report to this JSON file")
+    parser.add_argument('--simulate', type=str, metavar='SIZES',
+                        help="benchmark against local stand-ins for these fleet sizes, e.g. 500,3000")
+    args = parser.parse_args(argv)
+
+    if args.simulate:
+        print("⏱️  Fleet Monitor Benchmark (local stand-in, simulated API)")
+        print("=" * 50)
+        print(f"   Window: {args.window} rounds, concurrency {args.concurrency}; "
+              f"the stand-in runs in the same process, so CPU includes serving")
+        print(f"\n servers  round s  cpu µs/probe  round peak KiB  series KiB  report s  list calls/round")
+        for count in (int(size) for size in args.simulate.split(',')):
+            result = asyncio.run(simulate(count, window=args.window, concurrency=args.concurrency))
+            print(f" {result['servers']:>7}  {result['round_seconds']:>7}  {result['cpu_us_per_probe']:>12}  "
+                  f"{result['peak_kib']:>14}  {result['series_kib']:>10}  {result['report_seconds']:>8}  "
+                  f"{result['list_calls_per_round']:>16g}")
+        return
+
+    monitor = _live_monitor(args)
+
+    def on_report(report):
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.once:
+        asyncio.run(monitor.run(rounds=1, report_every=1, on_report=on_report))
+        return
+    print(f"🩺 Probing every {args.interval:g}s (Ctrl+C to stop)")
+    try:
+        asyncio.run(monitor.run(report_every=args.report_every, on_report=on_report))
+    except KeyboardInterrupt:
+        print_report(monitor.report())
+
+
+if __name__ == "__main__":
+    main()
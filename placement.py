@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+UpCloud Zone Placement
+Spreads a fleet across several zones. Each candidate zone is scored on:
+
+- network round-trip time, measured with TCP connects to the zone's
+  public speedtest host (readiness probes, SSH and HTTP all cross it)
+- how long servers recently took to become ready there, taken from the
+  deploy timings stored in the inventory
+
+Servers are then handed out one at a time to the zone where the next one
+is expected to be ready soonest. A zone's expected time grows with every
+server already placed there (contention), and no zone may take more than
+max_share of the fleet.
+"""
+
+import heapq
+import math
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# UpCloud runs a speedtest server in every public zone
+SPEEDTEST_HOST = '{zone}.speedtest.upcloud.com'
+
+# Assumed time-to-ready for a zone with no deploy history yet
+DEFAULT_READY_SECONDS = 180.0
+
+# Only deploys from the last week count as recent
+HISTORY_WINDOW = 7 * 86400
+
+# Readiness polls, SSH and HTTP requests a deploy makes to the zone
+ROUND_TRIPS_PER_DEPLOY = 50
+
+# Each extra server in the same zone adds this fraction to its ready time
+CONTENTION = 0.05
+
+
+def probe_zone_latency(zone, samples=3, timeout=2.0, port=80):
+    """Best TCP connect time to the zone's speedtest host in seconds, or None if unreachable."""
+    host = SPEEDTEST_HOST.format(zone=zone)
+    best = None
+    for _ in range(samples):
+        start_time = time.perf_counter()
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                pass
+        except OSError:
+            continue
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def zone_history(inventory, zones, window=HISTORY_WINDOW):
+    """Recent time-to-ready samples per zone from the inventory's deploy timings."""
+    history = {}
+    for zone in zones:
+        samples = []
+        for record in inventory.find(zone=zone, newer_than=window, include_deleted=True):
+            timings = record['timings'] or {}
+            seconds = timings.get('http_200_seconds') or timings.get('api_started_seconds')
+            if seconds:
+                samples.append(seconds)
+        history[zone] = samples
+    return history
+
+
+def estimate_zones(zones, probe=probe_zone_latency, history=None, workers=8):
+    """Probe every zone concurrently and combine with history into per-zone estimates.
+
+    Returns {zone: {'latency', 'ready_seconds', 'samples'}} for the reachable
+    zones. Zones without history get the median of the others, or
+    DEFAULT_READY_SECONDS if there is no history at all.
+    """
+    history = history or {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(zones)))) as pool:
+        latencies = dict(zip(zones, pool.map(probe, zones)))
+
+    medians = {zone: statistics.median(history[zone]) for zone in zones if history.get(zone)}
+    fallback = statistics.median(medians.values()) if medians else DEFAULT_READY_SECONDS
+
+    estimates = {}
+    for zone in zones:
+        if latencies[zone] is None:
+            print(f"⚠️  Zone {zone} is unreachable, skipping it")
+            continue
+        estimates[zone] = {
+            'latency': latencies[zone],
+            'ready_seconds': medians.get(zone, fallback),
+            'samples': len(history.get(zone, [])),
+        }
+    return estimates
+
+
+def expected_ready(estimate, position, contention=CONTENTION):
+    """Expected time-to-ready of the server placed `position`-th (from 0) in a zone."""
+    return (estimate['ready_seconds'] * (1 + contention * position)
+            + ROUND_TRIPS_PER_DEPLOY * estimate['latency'])
+
+
+def place(count, estimates, max_share=0.5, capacity=None, contention=CONTENTION):
+    """Split `count` servers across the estimated zones.
+
+    Minimises the summed expected time-to-ready. Each step is greedy, which
+    is optimal here because a zone's cost only grows as it fills. No zone
+    gets more than max_share of the fleet (relaxed to an even split if
+    there are too few zones), nor more than its capacity, if one is given.
+    Returns (assignment {zone: servers}, predicted {'total_seconds', 'slowest_seconds'}).
+    """
+    if not estimates:
+        raise ValueError("No reachable zones to place servers in")
+    capacity = capacity or {}
+    share_cap = max(math.ceil(count * max_share), math.ceil(count / len(estimates)))
+    limits = {zone: min(share_cap, capacity.get(zone, count)) for zone in estimates}
+    if sum(limits.values()) < count:
+        raise ValueError(f"Only {sum(limits.values())} of {count} servers fit within the "
+                         f"zone capacities and the {max_share:.0%} balance limit")
+
+    assignment = {zone: 0 for zone in estimates}
+    heap = [(expected_ready(estimates[zone], 0, contention), zone) for zone in estimates]
+    heapq.heapify(heap)
+    total = slowest = 0.0
+    for _ in range(count):
+        cost, zone = heapq.heappop(heap)
+        assignment[zone] += 1
+        total += cost
+        slowest = max(slowest, cost)
+        if assignment[zone] < limits[zone]:
+            heapq.heappush(heap, (expected_ready(estimates[zone], assignment[zone], contention), zone))
+
+    assignment = {zone: n for zone, n in assignment.items() if n}
+    return assignment, {'total_seconds': round(total, 1), 'slowest_seconds': round(slowest, 1)}
+
+
+def assign_zones(specs, assignment):
+    """Fill in the zone of every spec that doesn't name one, interleaving zones.
+
+    Specs are launched in order, so interleaving keeps every zone busy from
+    the start instead of filling them one after another.
+    """
+    queue = []
+    remaining = dict(assignment)
+    while any(remaining.values()):
+        for zone in assignment:
+            if remaining[zone]:
+                queue.append(zone)
+                remaining[zone] -= 1
+    for spec in specs:
+        if not spec.get('zone') and queue:
+            spec['zone'] = queue.pop(0)
+    return specs
+
+
+def plan_fleet(specs, zones, inventory=None, probe=probe_zone_latency, history=None,
+               max_share=0.5, capacity=None):
+    """Estimate the zones, place the specs that have no zone and print the plan.
+
+    Returns the predicted timings, or None if nothing could be placed.
+    """
+    if history is None and inventory is not None:
+        history = zone_history(inventory, zones)
+    estimates = estimate_zones(zones, probe=probe, history=history)
+    unplaced = [spec for spec in specs if not spec.get('zone')]
+    try:
+        assignment, predicted = place(len(unplaced), estimates, max_share=max_share, capacity=capacity)
+    except ValueError as e:
+        print(f"❌ Placement failed: {e}")
+        return None
+    assign_zones(unplaced, assignment)
+
+    print(f"\n🗺️  Zone placement for {len(unplaced)} servers:")
+    for zone, estimate in sorted(estimates.items(), key=lambda item: -assignment.get(item[0], 0)):
+        print(f"   • {zone}: {assignment.get(zone, 0):>3} servers "
+              f"(RTT {estimate['latency'] * 1000:.0f} ms, ready ~{estimate['ready_seconds']:.0f}s "
+              f"from {estimate['samples']} recent deploys)")
+    print(f"   Predicted: slowest server ready in ~{predicted['slowest_seconds']:.0f}s")
+    return predicted
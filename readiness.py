@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+UpCloud Server Readiness Probe
+A server being 'started' in the API doesn't mean it serves the page yet:
+cloud-init still has to install and start nginx. This probes SSH and HTTP
+concurrently and records when each one actually came up.
+
+The *_async variants do the same on an asyncio event loop, for
+async_deployer.py.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def probe_http(url, timeout=5):
+    """True if url answers with HTTP 200."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+def fetch_text(url, timeout=5):
+    """Body of url as text if it answers with HTTP 200, else None."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            if response.status == 200:
+                return response.read().decode('utf-8', errors='replace')
+    except (urllib.error.URLError, OSError, ValueError):
+        pass
+    return None
+
+
+def probe_tcp(host, port, timeout=3):
+    """True if a TCP connection to host:port can be opened."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _poll_until(probe, deadline, interval, stop=None):
+    """Call probe until it succeeds, the deadline passes or stop is set.
+
+    Returns the time of the first success, or None.
+    """
+    while True:
+        if probe():
+            return time.time()
+        if time.time() + interval > deadline:
+            return None
+        if stop is not None and stop.wait(interval):
+            # One last try now that we're being told to give up
+            return time.time() if probe() else None
+        elif stop is None:
+            time.sleep(interval)
+
+
+def wait_until_ready(host, timeout=300, http_port=80, path='/', check_ssh=True, ssh_port=22,
+                     interval=2, start_time=None):
+    """Probe HTTP (and optionally SSH) concurrently until they respond or timeout passes.
+
+    Timings are in seconds since start_time (defaults to now), so passing the
+    time the deploy started gives a time-to-serve figure. The server is
+    'ready' once HTTP returns 200; SSH is informational and isn't waited on
+    any further once HTTP is up.
+    """
+    start_time = start_time or time.time()
+    deadline = time.time() + timeout
+    url = f"http://{host}:{http_port}{path}"
+
+    http_done = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        http_future = pool.submit(_poll_until, lambda: probe_http(url), deadline, interval)
+        ssh_future = None
+        if check_ssh:
+            ssh_future = pool.submit(_poll_until, lambda: probe_tcp(host, ssh_port),
+                                     deadline, interval, http_done)
+        http_at = http_future.result()
+        http_done.set()
+        ssh_at = ssh_future.result() if ssh_future else None
+
+    return {
+        'ready': http_at is not None,
+        'http_200_seconds': round(http_at - start_time, 2) if http_at else None,
+        'ssh_up_seconds': round(ssh_at - start_time, 2) if ssh_at else None,
+    }
+
+
+async def probe_http_async(host, port=80, path='/', timeout=5):
+    """True if http://host:port/path answers with HTTP 200 (asyncio streams, no client library)."""
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode('ascii'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        return status_line.split()[1:2] == [b'200']
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def fetch_text_async(host, port=80, path='/', timeout=5):
+    """Async fetch_text(): body of http://host:port/path if it answers with HTTP 200, else None."""
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode('ascii'))
+        await writer.drain()
+        # HTTP/1.0: the server closes the connection after the body
+        response = await asyncio.wait_for(reader.read(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    if head.split()[1:2] != [b'200']:
+        return None
+    return body.decode('utf-8', errors='replace')
+
+
+async def probe_tcp_async(host, port, timeout=3):
+    """True if a TCP connection to host:port can be opened."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def _poll_until_async(probe, deadline, interval):
+    """Await probe() until it succeeds or the deadline passes; return the success time or None."""
+    while True:
+        if await probe():
+            return time.time()
+        if time.time() + interval > deadline:
+            return None
+        await asyncio.sleep(interval)
+
+
+async def wait_until_ready_async(host, timeout=300, http_port=80, path='/', check_ssh=True,
+                                 ssh_port=22, interval=2, start_time=None):
+    """Async wait_until_ready(): same probes, same result dict, no threads."""
+    start_time = start_time or time.time()
+    deadline = time.time() + timeout
+
+    http_task = asyncio.ensure_future(_poll_until_async(
+        lambda: probe_http_async(host, http_port, path), deadline, interval))
+    ssh_task = None
+    if check_ssh:
+        ssh_task = asyncio.ensure_future(_poll_until_async(
+            lambda: probe_tcp_async(host, ssh_port), deadline, interval))
+    http_at = await http_task
+    ssh_at = None
+    if ssh_task:
+        # SSH is informational: once HTTP is up, take one last look and stop
+        if not ssh_task.done():
+            ssh_task.cancel()
+            ssh_at = time.time() if http_at and await probe_tcp_async(host, ssh_port) else None
+        else:
+            ssh_at = ssh_task.result()
+
+    return {
+        'ready': http_at is not None,
+        'http_200_seconds': round(http_at - start_time, 2) if http_at else None,
+        'ssh_up_seconds': round(ssh_at - start_time, 2) if ssh_at else None,
+    }
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+UpCloud Rolling Content Update
+Pushes the current web_page/ (and optionally a new nginx site config) to
+servers that are already running, instead of deploying new ones.
+
+Servers are updated in batches of batch_size, at most `workers` at a
+time, over SSH with upcloud_key. Connections are pooled with OpenSSH
+connection sharing (ControlMaster), so retries and reruns reuse the
+connection instead of doing a new handshake. Every batch has to pass an
+HTTP health check before the next one starts; if a server in a batch
+fails, the rollout stops there and the rest of the fleet keeps the old
+content.
+
+On each server the files are unpacked into a staging directory and moved
+into place one rename at a time, and nginx is reloaded (not restarted)
+after `nginx -t` passes, so the page is served throughout. Servers that
+already have this exact content are left alone.
+"""
+
+import gzip
+import hashlib
+import io
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cloud_init import CloudInitRenderer, TEXT_SUFFIXES
+from golden_image import SSH_KEY_FILE
+from readiness import wait_until_ready
+
+NGINX_SITE = '/etc/nginx/sites-available/default'
+
+# Runs on the server with the bundle on stdin: sh -c REMOTE_INSTALL sh <version>.
+# The installed version is kept in /var/www/.content-version.
+# UPDATE_ROOT is only set by local stand-ins, to install under a directory.
+REMOTE_INSTALL = r'''
+set -e
+root="${UPDATE_ROOT:-}"
+if [ "$(cat "$root/var/www/.content-version" 2>/dev/null)" = "$1" ]; then
+    cat > /dev/null
+    echo unchanged
+    exit 0
+fi
+stage=$(mktemp -d "$root/var/www/.update-XXXXXX")
+trap 'rm -rf "$stage"' EXIT
+tar -xzf - -C "$stage"
+
+site=etc/nginx/sites-available/default
+reload=
+if [ -f "$stage/$site" ]; then
+    cp -p "$root/$site" "$stage/site.bak" 2>/dev/null || true
+    mkdir -p "$root/etc/nginx/sites-available"
+    mv -f "$stage/$site" "$root/$site"
+    if ! nginx -t >/dev/null 2>&1; then
+        if [ -f "$stage/site.bak" ]; then
+            mv -f "$stage/site.bak" "$root/$site"
+            echo "nginx -t rejected the new config, kept the old one" >&2
+        else
+            rm -f "$root/$site"
+            echo "nginx -t rejected the new config, removed it (there was none before)" >&2
+        fi
+        exit 1
+    fi
+    reload=1
+fi
+
+if [ -d "$stage/var" ]; then
+    (cd "$stage" && find var -type f) | while read -r path; do
+        mkdir -p "$root/$(dirname "$path")"
+        mv -f "$stage/$path" "$root/$path"
+    done
+fi
+echo "$1" > "$root/var/www/.content-version"
+if [ -n "$reload" ]; then
+    systemctl reload nginx
+fi
+echo updated
+'''
+
+
+class SSHPool:
+    """Runs commands over SSH with one shared connection per host (OpenSSH ControlMaster)."""
+
+    def __init__(self, key_file=SSH_KEY_FILE, user='root', port=22, persist=120, connect_timeout=10):
+        self.key_file = key_file
+        self.user = user
+        self.port = port
+        self.persist = persist
+        self.connect_timeout = connect_timeout
+        self.control_dir = tempfile.mkdtemp(prefix='upcloud-ssh-')
+        self._hosts = set()
+        self._lock = threading.Lock()
+
+    def command(self, host, remote_command):
+        return [
+            'ssh', '-i', self.key_file, '-p', str(self.port),
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'LogLevel=ERROR',
+            '-o', f'ConnectTimeout={self.connect_timeout}',
+            '-o', 'BatchMode=yes',
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={self.control_dir}/%C',
+            '-o', f'ControlPersist={self.persist}',
+            f'{self.user}@{host}',
+            remote_command,
+        ]
+
+    def run(self, host, script, args=(), input=None, timeout=120):
+        """Run a shell script on host; returns (exit code, stdout, stderr). 255 means SSH itself failed."""
+        with self._lock:
+            self._hosts.add(host)
+        remote = ' '.join(['sh', '-c', shlex.quote(script), 'sh', *map(shlex.quote, args)])
+        try:
+            result = subprocess.run(self.command(host, remote), input=input, capture_output=True,
+                                    timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return 255, '', f"timed out after {timeout}s"
+        return result.returncode, result.stdout.decode(errors='replace'), result.stderr.decode(errors='replace')
+
+    def close(self):
+        """Close the shared connections."""
+        for host in self._hosts:
+            subprocess.run(['ssh', '-o', f'ControlPath={self.control_dir}/%C', '-p', str(self.port),
+                            '-O', 'exit', f'{self.user}@{host}'], capture_output=True)
+        self._hosts.clear()
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_bundle(files):
+    """A reproducible .tar.gz of [(absolute path, content)] and its version hash."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for path, content in sorted(files):
+            info = tarfile.TarInfo(path.lstrip('/'))
+            info.size = len(content)
+            info.mode = 0o644
+            if path.startswith('/var/www/'):
+                info.uid = info.gid = 33
+                info.uname = info.gname = 'www-data'
+            tar.addfile(info, io.BytesIO(content))
+    version = hashlib.sha256(b''.join(hashlib.sha256(p.encode() + b'\0' + c).digest()
+                                      for p, c in sorted(files))).hexdigest()
+    # mtime=0 so the same files always compress to the same bytes
+    return gzip.compress(buffer.getvalue(), mtime=0), version
+
+
+def server_files(record, renderer, nginx_config=None):
+    """Everything pushed to one server: its rendered page, pre-compressed, and the nginx config if given."""
+    title = record['title']
+    files = renderer.files(title=title, hostname=f"{title.lower()}.example.com",
+                           zone=record['zone'] or '', plan=record['plan'] or '')
+    # Fresh .gz copies, so gzip_static (performance profile) never serves the old page
+    files += [(path + '.gz', gzip.compress(content, 9, mtime=0))
+              for path, content in files if path.lower().endswith(TEXT_SUFFIXES)]
+    if nginx_config is not None:
+        files.append((NGINX_SITE, nginx_config))
+    return files
+
+
+def update_server(pool, record, bundle, version, timeout=120):
+    """Push one bundle to one server; returns 'updated', 'unchanged' or 'failed'."""
+    for _ in range(2):
+        code, out, err = pool.run(record['ip'], REMOTE_INSTALL, args=(version,), input=bundle,
+                                  timeout=timeout)
+        if code != 255:
+            break
+        # SSH itself failed (connection refused/reset); one retry
+    if code == 0 and out.strip().endswith(('updated', 'unchanged')):
+        return out.strip().split()[-1]
+    print(f"   ❌ {record['title']} ({record['ip']}): {err.strip() or out.strip() or f'exit {code}'}")
+    return 'failed'
+
+
+def rolling_update(records, pool, renderer=None, nginx_config=None, batch_size=5, workers=5,
+                   health_timeout=60, probe=None):
+    """Update the servers batch by batch, stopping at the first batch that fails its health check.
+
+    probe(ip) returns True if the server serves the page; the default
+    polls HTTP for up to health_timeout seconds. Returns a summary dict.
+    """
+    renderer = renderer or CloudInitRenderer()
+    probe = probe or (lambda ip: wait_until_ready(ip, timeout=health_timeout, check_ssh=False)['ready'])
+    start_time = time.time()
+    summary = {'updated': 0, 'unchanged': 0, 'failed': 0, 'skipped': 0}
+
+    targets = [r for r in records if r['ip']]
+    summary['skipped'] = len(records) - len(targets)
+    if summary['skipped']:
+        print(f"⚠️  Skipping {summary['skipped']} servers with no known IP")
+    batches = [targets[i:i + batch_size] for i in range(0, len(targets), batch_size)]
+    print(f"\n🔄 Updating {len(targets)} servers in {len(batches)} batches of up to {batch_size} "
+          f"({min(workers, batch_size)} at a time)...")
+
+    def update(record):
+        bundle, version = build_bundle(server_files(record, renderer, nginx_config))
+        outcome = update_server(pool, record, bundle, version)
+        if outcome == 'updated' and not probe(record['ip']):
+            print(f"   ❌ {record['title']} ({record['ip']}) isn't serving after the update")
+            return 'failed'
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, batch_size))) as executor:
+        for n, batch in enumerate(batches, 1):
+            outcomes = list(executor.map(update, batch))
+            for outcome in outcomes:
+                summary[outcome] += 1
+            print(f"   Batch {n}/{len(batches)}: {outcomes.count('updated')} updated, "
+                  f"{outcomes.count('unchanged')} unchanged, {outcomes.count('failed')} failed")
+            if 'failed' in outcomes:
+                remaining = sum(len(b) for b in batches[n:])
+                summary['skipped'] += remaining
+                print(f"🛑 Stopping the rollout; {remaining} servers were not touched")
+                break
+
+    summary['seconds'] = round(time.time() - start_time, 1)
+    print(f"\n📊 Update summary: {summary['updated']} updated, {summary['unchanged']} already current, "
+          f"{summary['failed']} failed, {summary['skipped']} skipped in {summary['seconds']}s")
+    return summary
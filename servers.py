@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+UpCloud Server Model
+One typed, normalised view of a server, built once from whatever the API
+or the upcloud_api library handed us: a Server object, a raw /server
+payload, a populated /server/{uuid} payload or a create response. Every
+field is resolved there, so the rest of the code never has to probe
+object and dict shapes again.
+
+Public addresses for many servers are resolved in bulk: one
+GET /ip_address lists every address in the account together with its
+server, so the IPs of a whole fleet cost one call instead of one
+get_server() per server. Resolved addresses are cached in memory and in
+the inventory.
+"""
+
+import threading
+from dataclasses import dataclass
+
+
+@dataclass
+class Address:
+    """One IP address of a server."""
+    __slots__ = ('address', 'family', 'access')
+    address: str
+    family: str
+    access: str
+
+
+@dataclass
+class ServerInfo:
+    """A server, normalised. Addresses are empty if the payload didn't include them."""
+    __slots__ = ('uuid', 'title', 'hostname', 'zone', 'plan', 'state', 'created', 'tags', 'addresses')
+    uuid: str
+    title: str
+    hostname: str
+    zone: str
+    plan: str
+    state: str
+    created: float
+    tags: tuple
+    addresses: tuple
+
+    @classmethod
+    def from_api(cls, source):
+        """Build from a upcloud_api Server object or an API server dict."""
+        get = source.get if isinstance(source, dict) else lambda name: getattr(source, name, None)
+        tags = get('tags') or ()
+        if isinstance(tags, dict):
+            tags = tags.get('tag') or ()
+        created = get('created')
+        return cls(
+            uuid=get('uuid'),
+            title=get('title'),
+            hostname=get('hostname'),
+            zone=get('zone'),
+            plan=get('plan'),
+            state=get('state'),
+            created=float(created) if created else None,
+            tags=tuple(tags),
+            addresses=tuple(_addresses(source, get)),
+        )
+
+    @property
+    def ipv4(self):
+        """First public IPv4 address, or None."""
+        return self._public('IPv4')
+
+    @property
+    def ipv6(self):
+        """First public IPv6 address, or None."""
+        return self._public('IPv6')
+
+    def _public(self, family):
+        for address in self.addresses:
+            if address.access == 'public' and address.family == family:
+                return address.address
+        return None
+
+
+def _addresses(source, get):
+    """Address entries from ip_addresses (list or {'ip_address': [...]}) or networking interfaces."""
+    entries = []
+    ip_addresses = get('ip_addresses')
+    if isinstance(ip_addresses, dict):
+        ip_addresses = ip_addresses.get('ip_address')
+    for ip in ip_addresses or ():
+        entries.append(_address(ip, None))
+
+    networking = get('networking')
+    interfaces = networking.get('interfaces') if isinstance(networking, dict) else getattr(networking, 'interfaces', None)
+    if isinstance(interfaces, dict):
+        interfaces = interfaces.get('interface')
+    for interface in interfaces or ():
+        access = interface.get('type') if isinstance(interface, dict) else getattr(interface, 'type', None)
+        ips = interface.get('ip_addresses') if isinstance(interface, dict) else getattr(interface, 'ip_addresses', None)
+        if isinstance(ips, dict):
+            ips = ips.get('ip_address')
+        for ip in ips or ():
+            entries.append(_address(ip, access))
+
+    seen, unique = set(), []
+    for entry in entries:
+        if entry.address and entry.address not in seen:
+            seen.add(entry.address)
+            unique.append(entry)
+    return unique
+
+
+def _address(ip, access):
+    get = ip.get if isinstance(ip, dict) else lambda name: getattr(ip, name, None)
+    address = get('address') or ''
+    # upcloud_api defaults family to IPv4 when the payload leaves it out, so trust the address
+    family = 'IPv6' if ':' in address else 'IPv4'
+    return Address(address=address, family=family, access=get('access') or access)
+
+
+class IPResolver:
+    """Public IPv4/IPv6 of many servers from as few GET /ip_address calls as possible.
+
+    Addresses are looked up in memory, then in the inventory, and only then
+    fetched. A fetch lists every address in the account in one call and
+    caches all of them; concurrent lookups share the fetch that's already
+    running instead of starting their own.
+    """
+
+    def __init__(self, manager, inventory=None):
+        self.manager = manager
+        self.inventory = inventory
+        self.fetches = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._fetching = None
+
+    def remember(self, info):
+        """Cache the addresses of a ServerInfo that already has them (e.g. a create response)."""
+        if info.ipv4 or info.ipv6:
+            with self._lock:
+                self._cache[info.uuid] = (info.ipv4, info.ipv6)
+
+    def resolve(self, uuids):
+        """{uuid: (ipv4, ipv6)} for the given servers; servers with no public address are left out."""
+        found = {}
+        missing = self._lookup(uuids, found)
+        # A fetch already in flight may have started before these servers existed; allow one more
+        for _ in range(2):
+            if not missing:
+                break
+            self._fetch()
+            missing = self._lookup(missing, found)
+        return found
+
+    def ipv4(self, uuid):
+        return self.resolve([uuid]).get(uuid, (None, None))[0]
+
+    def _lookup(self, uuids, found):
+        missing = []
+        for uuid in uuids:
+            with self._lock:
+                addresses = self._cache.get(uuid)
+            if addresses is None and self.inventory is not None:
+                record = self.inventory.get(uuid)
+                if record and (record['ip'] or record['ipv6']):
+                    addresses = (record['ip'], record['ipv6'])
+                    with self._lock:
+                        self._cache[uuid] = addresses
+            if addresses is None:
+                missing.append(uuid)
+            else:
+                found[uuid] = addresses
+        return missing
+
+    def _fetch(self):
+        with self._lock:
+            running = self._fetching
+            if running is None:
+                self._fetching = done = threading.Event()
+        if running is not None:
+            running.wait()
+            return
+
+        try:
+            self.fetches += 1
+            by_server = {}
+            for ip in self.manager.get_ips(ignore_ips_without_server=True):
+                server_uuid = getattr(ip, 'server', None)
+                if server_uuid and ip.access == 'public':
+                    by_server.setdefault(server_uuid, []).append(_address(ip, 'public'))
+            resolved = {}
+            for server_uuid, addresses in by_server.items():
+                info = ServerInfo(server_uuid, None, None, None, None, None, None, (), tuple(addresses))
+                resolved[server_uuid] = (info.ipv4, info.ipv6)
+            with self._lock:
+                self._cache.update(resolved)
+            if self.inventory is not None:
+                for server_uuid, (ipv4, ipv6) in resolved.items():
+                    known = {'ip': ipv4, 'ipv6': ipv6}
+                    self.inventory.update(server_uuid, **{k: v for k, v in known.items() if v})
+        finally:
+            with self._lock:
+                self._fetching = None
+            done.set()
+
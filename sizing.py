@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+UpCloud Plan Sizing
+Finds the cheapest plan for a given load. One server per candidate plan
+is deployed, each is load-tested in turn with load_test.py's async load
+generator, and the servers are deleted again. The report gives each
+plan's throughput, p99 latency and cost per 1,000 requests (from the
+hourly price in GET /price), and recommends the plan whose fleet serves
+the target requests/second at the lowest hourly cost.
+
+    python sizing.py --plans 1xCPU-1GB,2xCPU-4GB --target-rps 2000
+    python sizing.py --local --target-rps 2000    # local stand-ins and simulated prices
+
+The load comes from this machine, so test from somewhere close to the
+zone (another UpCloud server is best); otherwise the network, not the
+plan, sets the numbers. With --local each plan is a local stand-in that
+serves web_page/ with one simulated worker per CPU of the plan, which
+exercises the whole pipeline without spending anything.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import time
+
+from cloud_init import PAGE_DIR, nginx_tuning
+from load_test import run_load
+
+DEFAULT_PLANS = ('1xCPU-1GB', '1xCPU-2GB', '2xCPU-4GB', '4xCPU-8GB')
+SIZING_TAG = 'sizing'
+SIZING_TITLE = 'UpCloud-Sizing'
+
+# Stand-in CPU time per request, in milliseconds
+STAND_IN_SERVICE_MS = 4.0
+
+
+def hourly_price(prices, zone, plan):
+    """Euros per hour for a plan in a zone, from a GET /price response (prices are in cents); None if unlisted."""
+    for entry in prices.get('prices', {}).get('zone', []):
+        if entry.get('name') == zone:
+            price = entry.get(f"server_plan_{plan}")
+            return price['price'] / 100 if price else None
+    return None
+
+
+def plan_row(plan, report, hourly, target_rps, utilisation):
+    """One line of the sizing report: a load test result costed for the target load."""
+    rps = report['requests_per_second']
+    servers = math.ceil(target_rps / (rps * utilisation)) if rps else None
+    return {
+        'plan': plan,
+        'requests_per_second': rps,
+        'p99_ms': report['p99_ms'],
+        'errors': report['errors'],
+        'hourly_eur': hourly,
+        'eur_per_1k_requests': round(hourly / (rps * 3.6), 6) if hourly is not None and rps else None,
+        'servers_for_target': servers,
+        'fleet_hourly_eur': round(servers * hourly, 4) if servers and hourly is not None else None,
+    }
+
+
+def recommend(rows, max_p99_ms):
+    """The plan whose fleet for the target costs least per hour, among plans within max_p99_ms."""
+    usable = [r for r in rows if r['fleet_hourly_eur'] is not None
+              and r['p99_ms'] is not None and r['p99_ms'] <= max_p99_ms]
+    if not usable:
+        return None
+    return min(usable, key=lambda r: (r['fleet_hourly_eur'], r['servers_for_target']))
+
+
+class PlanStandIn:
+    """A local HTTP/1.1 keep-alive server standing in for a plan: one worker per CPU.
+
+    Every request holds a worker for service_ms, so throughput tops out
+    around cpus * 1000 / service_ms requests per second, as on a real
+    server that's CPU-bound.
+    """
+
+    def __init__(self, plan, service_ms=STAND_IN_SERVICE_MS, directory=PAGE_DIR):
+        self.plan = plan
+        self.cpus = nginx_tuning(plan)['cpus']
+        self.service_ms = service_ms
+        with open(os.path.join(directory, 'index.html'), 'rb') as f:
+            body = f.read()
+        self.response = (b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body)) + body
+        self.server = None
+
+    async def start(self):
+        """Start serving; returns the URL."""
+        workers = asyncio.Semaphore(self.cpus)
+
+        async def handle(reader, writer):
+            try:
+                while True:
+                    await reader.readuntil(b'\r\n\r\n')
+                    async with workers:
+                        await asyncio.sleep(self.service_ms / 1000)
+                    writer.write(self.response)
+                    await writer.drain()
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                pass
+            finally:
+                writer.close()
+
+        self.server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def measure_local(plans, connections, duration):
+    """{plan: load test report} against a PlanStandIn per plan, one plan at a time."""
+    reports = {}
+    for plan in plans:
+        stand_in = PlanStandIn(plan)
+        url = await stand_in.start()
+        print(f"   🖥️  {plan}: stand-in with {stand_in.cpus} CPU at {url}")
+        try:
+            reports[plan] = await run_load(url, connections, duration)
+        finally:
+            await stand_in.stop()
+    return reports
+
+
+def measure_servers(deployer, plans, zone, connections, duration):
+    """{plan: load test report} against one freshly deployed server per plan; the servers are deleted after."""
+    from cleanup_server import bulk_cleanup
+    stamp = int(time.time())
+    specs = [{'title': f"{SIZING_TITLE}-{plan}-{stamp}", 'zone': zone, 'plan': plan, 'tags': [SIZING_TAG]}
+             for plan in plans]
+    results, _ = deployer.deploy_fleet(specs)
+    reports = {}
+    try:
+        for spec, result in zip(specs, results):
+            if result['state'] != 'ready':
+                print(f"⚠️  {spec['plan']} didn't come up; skipping it")
+                continue
+            print(f"   🔥 Loading {spec['plan']} at http://{result['ip']}/ for {duration:g}s...")
+            reports[spec['plan']] = asyncio.run(run_load(f"http://{result['ip']}/", connections, duration))
+    finally:
+        records = [deployer.inventory.get(r['uuid']) for r in results if r['uuid']]
+        servers, _ = deployer.inventory.reconcile(deployer.manager, records)
+        if servers:
+            print(f"\n🧹 Deleting the {len(servers)} sizing servers...")
+            bulk_cleanup(deployer.manager, deployer.waiter, servers, metrics=deployer.metrics,
+                         inventory=deployer.inventory)
+    return reports
+
+
+def print_sizing(rows, best, target_rps, max_p99_ms):
+    print(f"\n📐 Plan sizing for {target_rps:g} requests/second (p99 limit {max_p99_ms:g} ms)")
+    print(f"\n {'plan':<11} {'req/s':>8} {'p99 ms':>8} {'€/hour':>8} {'€/1k req':>10} "
+          f"{'servers':>8} {'fleet €/h':>10}")
+    for row in rows:
+        money = lambda value, digits: f"{value:.{digits}f}" if value is not None else '-'
+        print(f" {row['plan']:<11} {row['requests_per_second']:>8} {money(row['p99_ms'], 1):>8} "
+              f"{money(row['hourly_eur'], 4):>8} {money(row['eur_per_1k_requests'], 6):>10} "
+              f"{row['servers_for_target'] or '-':>8} {money(row['fleet_hourly_eur'], 4):>10}")
+    if best is None:
+        print(f"\n❌ No plan stayed within a p99 of {max_p99_ms:g} ms")
+        return
+    print(f"\n✅ Recommended: {best['servers_for_target']} × {best['plan']} "
+          f"at €{best['fleet_hourly_eur']:.4f}/hour")
+    print(f"   SERVER_PLAN={best['plan']}; autoscale with --rps-per-server "
+          f"{best['requests_per_second']:.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test candidate plans and recommend one for a target load")
+    parser.add_argument('--plans', default=','.join(DEFAULT_PLANS),
+                        help=f"comma-separated candidate plans (default {','.join(DEFAULT_PLANS)})")
+    parser.add_argument('--target-rps', type=float, required=True, help="requests/second the fleet must serve")
+    parser.add_argument('--utilisation', type=float, default=0.6,
+                        help="fraction of measured throughput to plan for (default 0.6)")
+    parser.add_argument('--max-p99', type=float, default=200, help="disqualify plans with a p99 above this (ms)")
+    parser.add_argument('--zone', default=None, help="zone to test and price in (default SERVER_ZONE)")
+    parser.add_argument('--connections', type=int, default=50, help="concurrent connections (default 50)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of load per plan (default 10)")
+    parser.add_argument('--local', action='store_true',
+                        help="test local stand-ins with simulated prices instead of real servers")
+    args = parser.parse_args(argv)
+    plans = [plan.strip() for plan in args.plans.split(',') if plan.strip()]
+
+    if args.local:
+        from fake_upcloud import FakeCloudManager
+        zone = args.zone or 'fi-hel1'
+        prices = FakeCloudManager().get_prices()
+        print(f"⏱️  Sizing {len(plans)} plans against local stand-ins (simulated prices)...")
+        reports = asyncio.run(measure_local(plans, args.connections, args.duration))
+    else:
+        from deploy_upcloud import UpCloudDeployer, SERVER_ZONE
+        zone = args.zone or SERVER_ZONE
+        deployer = UpCloudDeployer()
+        prices = deployer.manager.get_prices()
+        print(f"⏱️  Sizing {len(plans)} plans in {zone}: one server each, deleted afterwards")
+        reports = measure_servers(deployer, plans, zone, args.connections, args.duration)
+
+    rows = [plan_row(plan, reports[plan], hourly_price(prices, zone, plan), args.target_rps, args.utilisation)
+            for plan in plans if plan in reports]
+    best = recommend(rows, args.max_p99)
+    print_sizing(rows, best, args.target_rps, args.max_p99)
+    return rows, best
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+UpCloud Warm Standby Pool
+Keeps K servers started and verified serving, so a burst can be answered
+in milliseconds instead of the minutes a fresh deploy takes.
+
+Pool membership lives in the inventory as local tags: 'standby-warming'
+while a server is being deployed, 'standby' once it serves the page.
+Handing one out atomically moves it off 'standby', tags it in UpCloud,
+and records whether it was a pool hit and how long it took to serve. On
+a miss (empty pool) a server is deployed on the spot. Standby servers idle
+longer than the TTL are torn down with cleanup_server.bulk_cleanup(), as
+are servers left in 'standby-warming' by a run that died mid-deploy.
+"""
+
+import statistics
+import threading
+import time
+
+from cleanup_server import bulk_cleanup
+from readiness import probe_http
+
+STANDBY_TAG = 'standby'
+WARMING_TAG = 'standby-warming'
+STANDBY_TITLE = 'UpCloud-Standby'
+DEFAULT_SIZE = 3
+DEFAULT_TTL = 2 * 3600
+REPLENISH_INTERVAL = 60
+DEPLOY_TIMEOUT = 600
+# A server still warming after this long was left behind by a run that died
+WARMING_TIMEOUT = 2 * DEPLOY_TIMEOUT
+
+
+class StandbyPool:
+    """A pool of `size` ready servers, replenished in the background."""
+
+    def __init__(self, deployer, size=DEFAULT_SIZE, ttl=DEFAULT_TTL, workers=10, probe=None):
+        if deployer.inventory is None:
+            raise ValueError("The standby pool needs a deployer with an inventory")
+        self.deployer = deployer
+        self.manager = deployer.manager
+        self.inventory = deployer.inventory
+        self.size = size
+        self.ttl = ttl
+        self.workers = workers
+        self.probe = probe or (lambda ip: probe_http(f"http://{ip}/", timeout=2))
+        self._fill_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def acquire(self, tag='in-use', title=None):
+        """Hand out a ready server, tagged `tag`; returns its inventory record or None.
+
+        Takes a standby server if there is one (a hit), otherwise deploys one
+        now (a miss). Either way the pool is topped up in the background.
+        """
+        start_time = time.time()
+        record = None
+        while record is None:
+            record = self.inventory.claim(STANDBY_TAG, tag)
+            if record is None:
+                break
+            if not record['ip'] or not self.probe(record['ip']):
+                # Went bad while idle; don't hand it out
+                print(f"⚠️  Standby server {record['title']} isn't serving, discarding it")
+                self._teardown([record])
+                record = None
+
+        hit = record is not None
+        if not hit:
+            print("⚠️  Standby pool is empty, deploying a server now...")
+            result = self.deployer.deploy_one(
+                {'title': title or f"{STANDBY_TITLE}-{int(start_time * 1000)}"}, timeout=DEPLOY_TIMEOUT)
+            if result['state'] != 'ready':
+                print(f"❌ Could not deploy a server: {result['state']}")
+                failed = self.inventory.get(result['uuid']) if result['uuid'] else None
+                if failed:
+                    self._teardown([failed])
+                return None
+            self.inventory.retag(result['uuid'], add=[tag])
+            record = self.inventory.get(result['uuid'])
+
+        self._tag_in_upcloud(record['uuid'], tag)
+        timings = dict(record['timings'] or {})
+        timings['time_to_serve_seconds'] = round(time.time() - start_time, 3)
+        timings['pool_hit'] = hit
+        self.inventory.update(record['uuid'], timings=timings)
+        self.deployer.metrics.record_phase('handout_hit' if hit else 'handout_miss',
+                                           time.time() - start_time)
+        self._wakeup.set()
+        return self.inventory.get(record['uuid'])
+
+    def fill(self):
+        """Reap idle servers past the TTL, then deploy enough to get back to `size`."""
+        with self._fill_lock:
+            self.reap()
+            members = self._members(STANDBY_TAG) + self._members(WARMING_TAG)
+            needed = self.size - len(members)
+            if needed <= 0:
+                return 0
+
+            stamp = int(time.time())
+            specs = [{'title': f"{STANDBY_TITLE}-{stamp}-{i:02d}", 'tags': [WARMING_TAG]}
+                     for i in range(1, needed + 1)]
+            print(f"\n🔥 Warming {needed} standby servers...")
+            results, _ = self.deployer.deploy_fleet(specs, max_workers=self.workers, timeout=DEPLOY_TIMEOUT)
+            ready, failed = 0, []
+            for result in results:
+                if not result['uuid']:
+                    continue
+                if result['state'] == 'ready':
+                    self.inventory.retag(result['uuid'], remove=[WARMING_TAG], add=[STANDBY_TAG])
+                    ready += 1
+                else:
+                    failed.append(self.inventory.get(result['uuid']))
+            if failed:
+                self._teardown(failed)
+            return ready
+
+    def reap(self):
+        """Tear down standby servers idle longer than the TTL, and warming ones left by a dead run."""
+        idle = self.inventory.find(tag=STANDBY_TAG, older_than=self.ttl)
+        if idle:
+            print(f"\n⏰ {len(idle)} standby servers idle for over {self.ttl / 3600:.1f}h")
+        stale = self.inventory.find(tag=WARMING_TAG, older_than=WARMING_TIMEOUT)
+        if stale:
+            print(f"\n⏰ {len(stale)} standby servers stuck warming for over {WARMING_TIMEOUT / 60:.0f} min")
+        if idle or stale:
+            self._teardown(idle + stale)
+        return len(idle) + len(stale)
+
+    def start(self, interval=REPLENISH_INTERVAL):
+        """Keep the pool topped up from a background thread."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return pool_stats(self.inventory)
+
+    def _members(self, tag):
+        """Pool members with this tag that still exist (see Inventory.reconcile for the API cost)."""
+        records = self.inventory.find(tag=tag)
+        servers, _ = self.inventory.reconcile(self.manager, records, workers=self.workers)
+        return servers
+
+    def _teardown(self, records):
+        """Stop and delete servers the same way cleanup_server.py --bulk does."""
+        for record in records:
+            self.inventory.retag(record['uuid'], remove=[STANDBY_TAG, WARMING_TAG])
+        servers, _ = self.inventory.reconcile(self.manager, records, workers=self.workers)
+        if servers:
+            bulk_cleanup(self.manager, self.deployer.waiter, servers, workers=self.workers,
+                         metrics=self.deployer.metrics, inventory=self.inventory)
+
+    def _tag_in_upcloud(self, uuid, tag):
+        """Tag the server in UpCloud too, creating the tag the first time."""
+        try:
+            self.manager.assign_tags(uuid, [tag])
+        except Exception:
+            try:
+                self.manager.create_tag(tag)
+                self.manager.assign_tags(uuid, [tag])
+            except Exception as e:
+                print(f"⚠️  Could not tag server {uuid} as {tag} in UpCloud: {e}")
+
+    def _run(self, interval):
+        while not self._stopping.is_set():
+            try:
+                self.fill()
+            except Exception as e:
+                print(f"⚠️  Standby pool replenish failed: {e}")
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+
+
+def pool_stats(inventory):
+    """Pool size, hit rate and time-to-serve over every hand-out recorded in the inventory."""
+    hits, misses = [], []
+    for record in inventory.find(include_deleted=True):
+        timings = record['timings'] or {}
+        if 'pool_hit' in timings:
+            (hits if timings['pool_hit'] else misses).append(timings['time_to_serve_seconds'])
+    total = len(hits) + len(misses)
+    return {
+        'standby': len(inventory.find(tag=STANDBY_TAG)),
+        'warming': len(inventory.find(tag=WARMING_TAG)),
+        'handouts': total,
+        'hits': len(hits),
+        'misses': len(misses),
+        'hit_rate': round(len(hits) / total, 3) if total else None,
+        'hit_serve_seconds': _median(hits),
+        'miss_serve_seconds': _median(misses),
+        'mean_serve_seconds': round(statistics.mean(hits + misses), 3) if total else None,
+    }
+
+
+def _median(samples):
+    return round(statistics.median(samples), 3) if samples else None
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+UpCloud Server State Waiter
+Waits for many servers to reach a target state (e.g. 'started' or 'stopped')
+using one shared poller: every poll is a single get_servers() call whose
+result is fanned out to all waiting servers.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+# Starting guesses (seconds) for how long a transition takes, refined as we observe real ones
+DEFAULT_TRANSITION_SECONDS = {
+    ('maintenance', 'started'): 60.0,
+    ('started', 'stopped'): 15.0,
+    ('maintenance', 'stopped'): 10.0,
+}
+
+
+class WaitHandle:
+    """One server waiting for one of its target states."""
+
+    def __init__(self, uuid, targets, timeout, on_poll=None):
+        self.uuid = uuid
+        self.targets = set(targets)
+        self.start_time = time.time()
+        self.deadline = self.start_time + timeout
+        self.on_poll = on_poll
+        self.state = None
+        self.state_since = self.start_time
+        self.server = None
+        self.outcome = None  # 'reached', 'error', 'missing' or 'timeout'
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self):
+        """Block until the target is reached or given up on; return the server or None."""
+        self._done.wait()
+        return self.server if self.outcome == 'reached' else None
+
+    def add_done_callback(self, fn):
+        """Call fn(handle) once the wait is over (immediately if it already is)."""
+        with self._callback_lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self, outcome, server=None):
+        with self._callback_lock:
+            self.outcome = outcome
+            self.server = server
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                print(f"⚠️  State callback failed: {e}")
+
+
+class StateWaiter:
+    """Shared, adaptive poller for server state transitions.
+
+    The poll interval is derived from the learned duration of the transitions
+    being waited on (an exponential moving average per from/to state pair),
+    backs off while nothing changes, and is jittered so that many processes
+    don't hit the API in lockstep.
+    """
+
+    def __init__(self, manager, min_interval=2.0, max_interval=15.0, jitter=0.2,
+                 timings_file=None):
+        self.manager = manager
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.timings_file = timings_file
+        self.transition_seconds = dict(DEFAULT_TRANSITION_SECONDS)
+        self.polls = 0
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._next_poll_at = 0.0
+        self._backoff = min_interval
+        self._load_timings()
+
+    def watch(self, uuid, targets, timeout=300, from_state=None, on_poll=None):
+        """Start waiting for uuid to reach one of targets; returns a WaitHandle.
+
+        from_state is the state the server is known to be in right now (e.g.
+        'maintenance' just after creation) and lets the first poll be scheduled
+        for when the transition is expected to finish. on_poll(handle, state) is
+        called after every poll that saw the server.
+        """
+        if isinstance(targets, str):
+            targets = (targets,)
+        handle = WaitHandle(uuid, targets, timeout, on_poll)
+        handle.state = from_state
+
+        delay = self.expected_seconds(from_state, handle.targets) or self.min_interval
+        poll_at = time.time() + max(self.min_interval, min(self.max_interval, delay))
+
+        with self._lock:
+            self._handles.setdefault(uuid, []).append(handle)
+            if self._thread is None:
+                self._next_poll_at = poll_at
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            elif poll_at < self._next_poll_at:
+                self._next_poll_at = poll_at
+                self._wakeup.set()
+        return handle
+
+    def wait(self, uuid, targets, timeout=300, from_state=None, on_poll=None):
+        """Block until uuid reaches one of targets; returns the server or None."""
+        return self.watch(uuid, targets, timeout, from_state, on_poll).wait()
+
+    def wait_all(self, uuids, targets, timeout=300, from_state=None):
+        """Wait for many servers at once; returns {uuid: server or None}."""
+        handles = [self.watch(uuid, targets, timeout, from_state) for uuid in uuids]
+        return {h.uuid: h.wait() for h in handles}
+
+    def expected_seconds(self, from_state, to_states):
+        """Learned duration of a transition, or None if we've never seen it."""
+        known = [self.transition_seconds[(from_state, t)] for t in to_states
+                 if (from_state, t) in self.transition_seconds]
+        return min(known) if known else None
+
+    def record_transition(self, from_state, to_state, seconds, weight=0.3):
+        """Fold an observed transition duration into the moving average."""
+        key = (from_state, to_state)
+        with self._lock:
+            previous = self.transition_seconds.get(key)
+            if previous is None:
+                self.transition_seconds[key] = seconds
+            else:
+                self.transition_seconds[key] = previous + weight * (seconds - previous)
+
+    def save_timings(self):
+        """Persist learned transition times so the next run starts tuned."""
+        if not self.timings_file:
+            return
+        data = {f"{a}->{b}": round(s, 2) for (a, b), s in self.transition_seconds.items()}
+        try:
+            with open(self.timings_file, 'w') as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            print(f"⚠️  Could not save state timings: {e}")
+
+    def _load_timings(self):
+        if not self.timings_file or not os.path.exists(self.timings_file):
+            return
+        try:
+            with open(self.timings_file, 'r') as f:
+                data = json.load(f)
+            for key, seconds in data.items():
+                from_state, to_state = key.split('->')
+                self.transition_seconds[(from_state, to_state)] = float(seconds)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable state timings file: {e}")
+
+    def _next_interval(self, pending):
+        """Sleep until the soonest expected transition, or back off once overdue."""
+        now = time.time()
+        soonest = None
+        for handle in pending:
+            expected = self.expected_seconds(handle.state, handle.targets)
+            if expected is None:
+                # Unknown transition: nothing to predict, just back off
+                remaining = self._backoff
+            else:
+                remaining = handle.state_since + expected - now
+            remaining = min(remaining, handle.deadline - now)
+            soonest = remaining if soonest is None else min(soonest, remaining)
+
+        if soonest is not None and soonest > self._backoff:
+            interval = soonest
+        else:
+            interval = self._backoff
+        interval = max(self.min_interval, min(self.max_interval, interval))
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _poll(self, pending):
+        """One get_servers() call, fanned out to every pending handle."""
+        self.polls += 1
+        try:
+            servers = {s.uuid: s for s in self.manager.get_servers()}
+        except Exception as e:
+            print(f"❌ Error checking server states: {e}")
+            return False
+
+        changed = False
+        now = time.time()
+        for handle in pending:
+            server = servers.get(handle.uuid)
+            if server is None:
+                handle._finish('missing')
+                continue
+
+            state = server.state
+            if state != handle.state:
+                if handle.state is not None:
+                    self.record_transition(handle.state, state, now - handle.state_since)
+                handle.state = state
+                handle.state_since = now
+                changed = True
+
+            if handle.on_poll:
+                try:
+                    handle.on_poll(handle, state)
+                except Exception as e:
+                    print(f"⚠️  State callback failed: {e}")
+
+            if state in handle.targets:
+                handle._finish('reached', server)
+            elif state == 'error':
+                handle._finish('error', server)
+        return changed
+
+    def _run(self):
+        while True:
+            with self._lock:
+                for uuid in list(self._handles):
+                    self._handles[uuid] = [h for h in self._handles[uuid] if not h.done()]
+                    if not self._handles[uuid]:
+                        del self._handles[uuid]
+                pending = [h for handles in self._handles.values() for h in handles]
+                if not pending:
+                    self._thread = None
+                    break
+                self._wakeup.clear()
+                sleep_for = self._next_poll_at - time.time()
+
+            now = time.time()
+            for handle in pending:
+                if now >= handle.deadline:
+                    handle._finish('timeout')
+            pending = [h for h in pending if not h.done()]
+            if not pending:
+                continue
+
+            # Sleep until the scheduled poll; a new, more urgent watcher wakes us early
+            if sleep_for > 0:
+                self._wakeup.wait(min(sleep_for, min(h.deadline for h in pending) - now))
+                continue
+
+            if self._poll(pending):
+                self._backoff = self.min_interval
+            else:
+                self._backoff = min(self.max_interval, self._backoff * 1.5)
+
+            pending = [h for h in pending if not h.done()]
+            with self._lock:
+                self._next_poll_at = time.time() + self._next_interval(pending)
+
+        self.save_timings()
@@ -0,0 +1,46 @@
+"""Tests for api_cache.py with a metrics-instrumented simulated manager."""
+
+import os
+
+from api_cache import ApiCache, CachedCloudManager
+from fake_upcloud import FakeCloudManager
+from metrics import Metrics
+
+
+def cached_manager(tmp_path, refresh=False):
+    metrics = Metrics('test')
+    fake = FakeCloudManager()
+    cache = ApiCache(os.path.join(tmp_path, 'cache.json'))
+    return CachedCloudManager(metrics.instrument(fake), cache, refresh=refresh), metrics, fake
+
+
+def test_only_misses_are_api_calls(tmp_path):
+    manager, metrics, fake = cached_manager(tmp_path)
+    for _ in range(3):
+        assert manager.get_zones() == fake.get_zones()
+    assert manager.cache.stats() == {'hits': 2, 'misses': 1}
+    assert metrics.summary()['api_calls']['get_zones']['count'] == 1
+
+
+def test_warm_start_makes_no_calls(tmp_path):
+    cached_manager(tmp_path)[0].get_account()
+    manager, metrics, fake = cached_manager(tmp_path)
+    fake.api.calls.clear()
+    manager.get_account()
+    assert sum(fake.api.calls.values()) == 0
+    assert 'get_account' not in metrics.summary()['api_calls']
+
+
+def test_refresh_always_calls(tmp_path):
+    cached_manager(tmp_path)[0].get_account()
+    manager, metrics, _ = cached_manager(tmp_path, refresh=True)
+    manager.get_account()
+    manager.get_account()
+    assert metrics.summary()['api_calls']['get_account']['count'] == 2
+    assert manager.cache.stats() == {'hits': 0, 'misses': 2}
+
+
+def test_other_calls_are_still_timed(tmp_path):
+    manager, metrics, _ = cached_manager(tmp_path)
+    manager.get_servers()
+    assert metrics.summary()['api_calls']['get_servers']['count'] == 1
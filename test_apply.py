@@ -0,0 +1,91 @@
+"""Tests for apply.py: the plan step, and creates against the simulated API."""
+
+import os
+
+import pytest
+
+import apply
+from benchmark import SimulatedDeployer
+from fake_upcloud import FakeCloudManager
+from inventory import Inventory
+
+SCALE = 0.01
+
+
+def want(title, zone='fi-hel1', plan='1xCPU-1GB', page_version='v1'):
+    return {'title': title, 'zone': zone, 'plan': plan, 'page_version': page_version}
+
+
+def have(uuid, title, managed=True, zone='fi-hel1', plan='1xCPU-1GB', page_version='v1'):
+    return {'uuid': uuid, 'title': title, 'zone': zone, 'plan': plan, 'state': 'started',
+            'managed': managed, 'page_version': page_version if managed else None, 'server': None}
+
+
+def kinds(actions):
+    return sorted((action['kind'], action['title'], action.get('uuid')) for action in actions)
+
+
+def test_unchanged_state_plans_nothing():
+    desired = {'web-1': want('web-1'), 'web-2': want('web-2')}
+    actions, conflicts = apply.plan(desired, [have('a', 'web-1'), have('b', 'web-2')])
+    assert actions == [] and conflicts == []
+
+
+def test_managed_changes_are_planned():
+    desired = {'web-1': want('web-1', page_version='v2'), 'web-2': want('web-2', plan='2xCPU-4GB'),
+               'web-3': want('web-3')}
+    current = [have('a', 'web-1'), have('b', 'web-2'), have('c', 'web-4'), have('d', 'web-1', page_version='v0')]
+    actions, conflicts = apply.plan(desired, current)
+    assert conflicts == []
+    assert kinds(actions) == [('create', 'web-2', None), ('create', 'web-3', None),
+                              ('delete', 'web-1', 'd'), ('delete', 'web-2', 'b'), ('delete', 'web-4', 'c'),
+                              ('update', 'web-1', 'a')]
+    by_kind = {(a['kind'], a['title']): a for a in actions}
+    # The replacement waits for its delete; the undeclared server waits for every create
+    assert by_kind[('create', 'web-2')]['after'] == [by_kind[('delete', 'web-2')]['id']]
+    assert sorted(by_kind[('delete', 'web-4')]['after']) == sorted(
+        [by_kind[('create', 'web-2')]['id'], by_kind[('create', 'web-3')]['id']])
+
+
+def test_unmanaged_servers_are_never_touched():
+    desired = {'web-1': want('web-1'), 'web-2': want('web-2', zone='de-fra1')}
+    current = [have('x', 'web-1', managed=False), have('y', 'web-2', managed=False),
+               have('z', 'other', managed=False), have('a', 'web-2', zone='fi-hel1')]
+    actions, conflicts = apply.plan(desired, current)
+    assert sorted((c['title'], c['uuid']) for c in conflicts) == [('web-1', 'x'), ('web-2', 'y')]
+    # A conflicting title is left alone entirely: a create would duplicate it
+    assert actions == []
+
+
+class NeverServing(SimulatedDeployer):
+    def wait_until_serving(self, server_ip, start_time, timeout=300, verbose=True):
+        return {'ready': False, 'http_200_seconds': None, 'ssh_up_seconds': None}
+
+
+@pytest.fixture
+def manager():
+    return FakeCloudManager(boot_seconds=60 * SCALE, stop_seconds=15 * SCALE, serve_seconds=30 * SCALE)
+
+
+def test_apply_creates_and_then_does_nothing(manager, tmp_path):
+    inventory = Inventory(os.path.join(tmp_path, 'inventory.db'))
+    deployer = SimulatedDeployer(manager, SCALE, inventory=inventory)
+    tag, desired = apply.parse_desired({'page_version': 'v1', 'servers': [{'title': 'web', 'count': 2}]})
+    actions, outcomes, conflicts = apply.apply(deployer, tag, desired)
+    assert set(outcomes.values()) == {'done'} and len(actions) == 2
+    assert sorted(r['page_version'] for r in inventory.find(tag=tag)) == ['v1', 'v1']
+
+    manager.api.calls.clear()
+    actions, outcomes, conflicts = apply.apply(deployer, tag, desired)
+    assert actions == [] and conflicts == []
+    assert sum(manager.api.calls.values()) == 1
+
+
+def test_failed_create_is_torn_down(manager, tmp_path):
+    inventory = Inventory(os.path.join(tmp_path, 'inventory.db'))
+    deployer = NeverServing(manager, SCALE, inventory=inventory)
+    tag, desired = apply.parse_desired({'page_version': 'v1', 'servers': ['web-1']})
+    actions, outcomes, conflicts = apply.apply(deployer, tag, desired)
+    assert list(outcomes.values()) == ['failed']
+    assert manager.get_servers() == []
+    assert inventory.find(tag=tag) == []
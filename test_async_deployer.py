@@ -0,0 +1,180 @@
+"""Tests for async_deployer.py: the deploy journal and sync parity against the simulated API,
+and AsyncAPI against a local HTTP stub."""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from upcloud_api.errors import UpCloudAPIError
+
+from async_deployer import AsyncAPI
+from benchmark import SimulatedDeployer, simulated_async_deployer
+from deploy_upcloud import deploy_key, server_hostname
+from fake_upcloud import FakeCloudManager
+from inventory import Inventory
+
+SCALE = 0.01
+
+
+@pytest.fixture
+def manager():
+    return FakeCloudManager(boot_seconds=60 * SCALE, stop_seconds=15 * SCALE, serve_seconds=30 * SCALE)
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    return Inventory(os.path.join(tmp_path, 'inventory.db'))
+
+
+def deploy(manager, inventory, specs):
+    async def run():
+        deployer = simulated_async_deployer(manager, SCALE, 10, inventory=inventory)
+        return await deployer.deploy_fleet(specs)
+    return asyncio.run(run())[0]
+
+
+def step(inventory, title):
+    return inventory.journal(deploy_key(title, server_hostname(title)))['step']
+
+
+def test_fleet_deploy_is_journaled(manager, inventory):
+    results = deploy(manager, inventory, [{'title': 'web-1', 'tags': ['web']}, {'title': 'web-2'}])
+    assert [r['state'] for r in results] == ['ready', 'ready']
+    assert step(inventory, 'web-1') == step(inventory, 'web-2') == 'ready'
+    assert [r['uuid'] for r in inventory.find(tag='web')] == [results[0]['uuid']]
+    assert inventory.in_flight() == []
+
+    # Finished deploys aren't resumed: a second run creates new servers
+    again = deploy(manager, inventory, [{'title': 'web-1'}])
+    assert not again[0]['resumed'] and again[0]['uuid'] != results[0]['uuid']
+
+
+def test_resumes_a_deploy_the_sync_deployer_left_in_flight(manager, inventory):
+    server, _ = SimulatedDeployer(manager, SCALE, inventory=inventory).start_deploy('web-1', verbose=False)
+    [result] = deploy(manager, inventory, [{'title': 'web-1'}])
+    assert result['resumed'] and result['uuid'] == server.uuid and result['state'] == 'ready'
+    assert len(manager.get_servers()) == 1
+    assert step(inventory, 'web-1') == 'ready'
+
+
+def test_finds_a_server_created_before_its_uuid_was_journaled(manager, inventory):
+    inventory.journal_write(deploy_key('web-1', server_hostname('web-1')), 'requested',
+                            title='web-1', hostname=server_hostname('web-1'))
+    uuid = manager.api.handle('POST', '/server', {'server': {
+        'title': 'web-1', 'hostname': server_hostname('web-1'), 'zone': 'fi-hel1'}})['server']['uuid']
+    [result] = deploy(manager, inventory, [{'title': 'web-1'}])
+    assert result['resumed'] and result['uuid'] == uuid
+    assert inventory.get(uuid)['title'] == 'web-1'
+    assert manager.api.calls['GET /server'] >= 1 and len(manager.get_servers()) == 1
+
+
+def test_async_fleet_matches_the_sync_fleet(tmp_path):
+    specs = [{'title': 'web-1', 'tags': ['web']}, {'title': 'web-2', 'zone': 'de-fra1', 'plan': '2xCPU-4GB'}]
+    sync_inventory = Inventory(os.path.join(tmp_path, 'sync.db'))
+    sync_manager = FakeCloudManager(boot_seconds=60 * SCALE, stop_seconds=15 * SCALE, serve_seconds=30 * SCALE)
+    sync_results, _ = SimulatedDeployer(sync_manager, SCALE, inventory=sync_inventory).deploy_fleet(specs)
+    async_inventory = Inventory(os.path.join(tmp_path, 'async.db'))
+    async_manager = FakeCloudManager(boot_seconds=60 * SCALE, stop_seconds=15 * SCALE, serve_seconds=30 * SCALE)
+    async_results = deploy(async_manager, async_inventory, specs)
+
+    assert [sorted(r) for r in sync_results] == [sorted(r) for r in async_results]
+    assert [r['state'] for r in sync_results] == [r['state'] for r in async_results] == ['ready', 'ready']
+
+    def records(inventory):
+        # Everything but the server's identity, its address and the clock; creates race, so sort by title
+        return sorted(({k: (sorted(v) if k == 'timings' else v) for k, v in r.items()
+                        if k not in ('uuid', 'ip', 'created', 'checked')} for r in inventory.find()),
+                      key=lambda r: r['title'])
+    assert records(sync_inventory) == records(async_inventory)
+    assert all(r['ip'] for r in sync_inventory.find() + async_inventory.find())
+    assert ([r['title'] for r in sync_inventory.find(tag='web')] ==
+            [r['title'] for r in async_inventory.find(tag='web')] == ['web-1'])
+    assert [step(sync_inventory, s['title']) for s in specs] == [step(async_inventory, s['title']) for s in specs]
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers with the next status in server.script (200 once it runs out), after server.delay seconds."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self):
+        with self.server.lock:
+            self.server.requests.append(self.command)
+            status = self.server.script.pop(0) if self.server.script else 200
+            self.server.active += 1
+            self.server.peak = max(self.server.peak, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+        body = json.dumps({'servers': {'server': []}} if status == 200 else
+                          {'error': {'error_code': 'ERROR', 'error_message': 'scripted'}}).encode()
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.script = []
+    server.delay = 0
+    server.active = server.peak = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/1.3"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def requests(api, calls, concurrent=False):
+    async def send(method, body):
+        try:
+            return await api.request(method, '/server', body)
+        except UpCloudAPIError as e:
+            return e
+
+    async def run():
+        async with api:
+            if concurrent:
+                return await asyncio.gather(*(send(method, body) for method, body in calls))
+            return [await send(method, body) for method, body in calls]
+    return asyncio.run(run())
+
+
+def test_async_api_retries_429_and_idempotent_5xx(stub):
+    stub.script = [429, 503, 200, 429, 200, 503]
+    api = AsyncAPI('user', 'password', rate_limit=0, max_retries=4, backoff=0.001,
+                   api_root=stub.url)
+    get, post, failed = requests(api, [('GET', None), ('POST', {}), ('POST', {})])
+    assert get == post == {'servers': {'server': []}}
+    # A POST is only retried on 429: a 5xx may have been applied
+    assert isinstance(failed, UpCloudAPIError) and failed.error_code == 'ERROR'
+    assert stub.requests == ['GET', 'GET', 'GET', 'POST', 'POST', 'POST']
+    assert api.retries == 3
+
+
+def test_async_api_bounds_requests_in_flight(stub):
+    stub.delay = 0.1
+    api = AsyncAPI('user', 'password', concurrency=3, rate_limit=0, api_root=stub.url)
+    results = requests(api, [('GET', None)] * 9, concurrent=True)
+    assert all(r == {'servers': {'server': []}} for r in results)
+    assert len(stub.requests) == 9 and stub.peak == 3
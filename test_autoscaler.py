@@ -0,0 +1,75 @@
+"""Tests for autoscaler.py: the decision engine, and a short replay against the simulated API."""
+
+from autoscaler import Autoscaler, simulate, synthetic_trace
+
+
+def scaler(**overrides):
+    # 100 rps per server at 50% target utilisation: needed(rps) == ceil(rps / 50)
+    settings = dict(min_size=1, max_size=10, rps_per_server=100, target_utilisation=0.5,
+                    up_cooldown=180, down_cooldown=600, down_stabilization=300)
+    settings.update(overrides)
+    return Autoscaler(**settings)
+
+
+COLD = {'rps': 50, 'p95_ms': 40}
+
+
+def test_scale_up_on_utilisation_is_capped_by_the_step():
+    target, reason = scaler().decide(0, 2, {'rps': 900})
+    # needed(900) is 18, but one step adds at most max_step_up servers
+    assert target == 6 and 'utilisation' in reason
+
+
+def test_scale_up_on_latency_is_capped_by_max_size():
+    assert scaler().decide(0, 3, {'rps': 100, 'p95_ms': 400})[0] == 4
+    assert scaler(max_size=5).decide(0, 3, {'rps': 1000})[0] == 5
+    assert scaler(max_size=5).decide(0, 5, {'rps': 1000}) == (5, "at max_size")
+
+
+def test_no_scale_down_until_low_load_has_held():
+    autoscaler = scaler()
+    assert autoscaler.decide(0, 5, COLD) == (5, "waiting for load to stay low")
+    assert autoscaler.decide(299, 5, COLD) == (5, "waiting for load to stay low")
+    # A single busy reading restarts the window
+    assert autoscaler.decide(300, 5, {'rps': 300, 'p95_ms': 40})[1] == "steady"
+    assert autoscaler.decide(310, 5, COLD)[1] == "waiting for load to stay low"
+    assert autoscaler.decide(610, 5, COLD)[0] == 4
+
+
+def test_scale_down_goes_to_the_largest_target_in_the_window():
+    autoscaler = scaler(max_step_down=10)
+    autoscaler.decide(0, 8, {'rps': 300})
+    autoscaler.decide(100, 8, {'rps': 100})
+    # needed() is 6, 2 and 1 across the window; the shrink stops at 6
+    assert autoscaler.decide(300, 8, {'rps': 50})[0] == 6
+
+
+def test_up_cooldown_follows_any_change():
+    autoscaler = scaler()
+    assert autoscaler.decide(0, 2, {'rps': 300})[0] == 6
+    assert autoscaler.decide(100, 6, {'rps': 1000}) == (6, "scale-up cooldown")
+    assert autoscaler.decide(180, 6, {'rps': 1000})[0] == 10
+
+
+def test_down_cooldown_follows_any_change():
+    autoscaler = scaler()
+    assert autoscaler.decide(0, 2, {'rps': 300})[0] == 6
+    autoscaler.decide(10, 6, COLD)
+    # Stabilization has held, but the scale-up was less than down_cooldown ago
+    assert autoscaler.decide(400, 6, COLD) == (6, "scale-down cooldown")
+    assert autoscaler.decide(600, 6, COLD)[0] == 5
+
+
+def test_sizes_outside_the_limits_are_clamped():
+    autoscaler = scaler(min_size=2, max_size=4)
+    assert autoscaler.decide(0, 7, COLD) == (4, "outside the size limits")
+    assert autoscaler.decide(0, 0, {'rps': 1000}) == (2, "outside the size limits")
+
+
+def test_simulated_fleet_follows_the_trace():
+    autoscaler = Autoscaler(min_size=1, max_size=6, up_cooldown=60, down_cooldown=120, down_stabilization=120)
+    summary, timeline = simulate(synthetic_trace(hours=1), autoscaler, time_scale=0.001)
+    sizes = [row['servers'] for row in timeline]
+    assert all(1 <= size <= 6 for size in sizes)
+    assert summary['peak_servers'] > 1 and summary['scale_ups'] >= 1
+    assert summary['scale_downs'] >= 1 and sizes[-1] < summary['peak_servers']
@@ -0,0 +1,36 @@
+"""Tests for bench_startup.py: the CLI's quick commands stay off the heavy imports."""
+
+import pytest
+
+import bench_startup
+from bench_startup import CLI, heavy_modules, measure
+
+
+@pytest.fixture(autouse=True)
+def no_credentials(monkeypatch):
+    # Blank, not unset: load_dotenv() never overrides a variable that's already set
+    monkeypatch.setenv('UPCLOUD_USERNAME', '')
+    monkeypatch.setenv('UPCLOUD_PASSWORD', '')
+
+
+def test_status_passes_the_guard(capsys):
+    assert bench_startup.main(['status', '--runs', '1', '--budget-ms', '0']) == 0
+    assert 'Fast path' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('command', [['list'], ['cleanup', '--bulk', '--dry-run']], ids=['list', 'cleanup'])
+def test_api_commands_load_the_client_only_with_credentials(command):
+    # Reading .env is how these find out there are no credentials; the API client waits for them
+    _, modules = measure([CLI] + command, 1)
+    assert [name for name in heavy_modules(modules) if not name.startswith('dotenv')] == []
+
+
+def test_command_options_pass_through():
+    args = bench_startup.parse_args(['cleanup', '--dry-run', '--runs', '2'])
+    assert args.command == ['cleanup', '--dry-run'] and args.runs == 2
+    assert bench_startup.parse_args([]).command == ['status']
+
+
+def test_heavy_modules_include_submodules():
+    modules = [('json', 1, 1), ('upcloud_api', 1, 2), ('upcloud_api.errors', 1, 1), ('requestsx', 1, 1)]
+    assert heavy_modules(modules) == ['upcloud_api', 'upcloud_api.errors']
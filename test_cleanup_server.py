@@ -0,0 +1,60 @@
+"""Tests for cleanup_server.bulk_cleanup() against the simulated API."""
+
+import time
+
+from benchmark import scaled_waiter, STOP_SECONDS
+from cleanup_server import bulk_cleanup
+from fake_upcloud import FakeCloudManager
+
+SCALE = 0.01
+
+
+def started_servers(count):
+    manager = FakeCloudManager(boot_seconds=0, stop_seconds=STOP_SECONDS * SCALE)
+    for n in range(count):
+        manager.api.handle('POST', '/server', {'server': {
+            'title': f"web-{n}", 'hostname': f"web-{n}.example.com", 'zone': 'fi-hel1'}})
+    return manager, manager.get_servers()
+
+
+def timed_cleanup(count):
+    manager, servers = started_servers(count)
+    waiter = scaled_waiter(manager, SCALE)
+    start = time.perf_counter()
+    summary = bulk_cleanup(manager, waiter, servers, workers=10)
+    seconds = time.perf_counter() - start
+    return manager, summary, seconds
+
+
+def test_bulk_cleanup_deletes_servers_and_their_disks():
+    manager, summary, _ = timed_cleanup(5)
+    assert summary['deleted'] == 5 and summary['failed'] == 0
+    assert manager.get_servers() == []
+    assert manager.api.orphaned_storages == []
+
+
+def test_bulk_cleanup_scales_sub_linearly():
+    _, small, small_seconds = timed_cleanup(5)
+    manager, large, large_seconds = timed_cleanup(40)
+    assert large['deleted'] == 40
+    # Stops overlap and share state polls, so 8x the servers is far less than 8x the time
+    assert large_seconds < 4 * small_seconds
+    assert large['state_polls'] < 3 * small['state_polls'] + 5
+    assert manager.api.calls['GET /server/{id}'] == 0
+
+
+class BrokenServer:
+    uuid = '00000000-0000-4000-8000-00000000dead'
+    title = 'broken'
+
+    @property
+    def state(self):
+        raise RuntimeError("lost the connection")
+
+
+def test_a_failing_server_does_not_hang_the_cleanup():
+    manager, servers = started_servers(2)
+    waiter = scaled_waiter(manager, SCALE)
+    summary = bulk_cleanup(manager, waiter, servers + [BrokenServer()])
+    assert summary['deleted'] == 2 and summary['failed'] == 1
+    assert 'lost the connection' in summary['failures'][0]['error']
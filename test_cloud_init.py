@@ -0,0 +1,63 @@
+"""Tests for cloud_init.py's page rendering and boot stage parsing."""
+
+import base64
+import gzip
+import re
+
+from cloud_init import CloudInitRenderer, boot_stage_seconds, parse_boot_stages
+
+PAGE = """<h1>{{ title }} in {{zone}}</h1>
+<div id="app">{{ message }} {{#each items}}{{this}}{{/each}}</div>
+"""
+
+
+def renderer(tmp_path):
+    (tmp_path / 'index.html').write_text(PAGE)
+    return CloudInitRenderer(page_dir=str(tmp_path))
+
+
+def test_known_variables_are_filled_in(tmp_path):
+    [(path, content)] = renderer(tmp_path).files(title='web-1', zone='fi-hel1')
+    assert path.endswith('/index.html')
+    assert content.decode().startswith('<h1>web-1 in fi-hel1</h1>')
+
+
+def test_unknown_placeholders_are_kept(tmp_path):
+    [(_, content)] = renderer(tmp_path).files(title='web-1', zone='fi-hel1')
+    assert '{{ message }}' in content.decode()
+    assert '{{this}}' in content.decode()
+    assert '{{#each items}}' in content.decode()
+
+
+def test_user_data_keeps_unknown_placeholders(tmp_path):
+    document = renderer(tmp_path).render(title='web-1', zone='fi-hel1', plan='1xCPU-1GB')
+    blob = re.search(r'content: (\S+)', document).group(1)
+    page = gzip.decompress(base64.b64decode(blob)).decode()
+    assert page == PAGE.replace('{{ title }}', 'web-1').replace('{{zone}}', 'fi-hel1')
+
+
+# A boot-stages.txt read while cloud-init was still writing it: 'firewall' runs in the
+# background and hasn't finished, and the last line is cut off mid-write
+STAGES = """kernel 1700000000
+cloud_init 1700000004.25
+runcmd 1700000005.5
+apt_update 1700000011.75
+nginx_installed 1700000019.0
+serving 1700000019.5
+upgrade_sta"""
+
+
+def test_boot_stages_skip_truncated_and_garbled_lines():
+    stages = parse_boot_stages(STAGES + "\nfirewall not-a-time\n\n")
+    assert stages == {'kernel': 1700000000.0, 'cloud_init': 1700000004.25, 'runcmd': 1700000005.5,
+                      'apt_update': 1700000011.75, 'nginx_installed': 1700000019.0, 'serving': 1700000019.5}
+    assert parse_boot_stages('') == {}
+
+
+def test_boot_stage_seconds_are_relative_and_in_stage_order():
+    timings = boot_stage_seconds(STAGES, 1699999990.0)
+    assert list(timings) == ['boot_kernel_seconds', 'boot_cloud_init_seconds', 'boot_runcmd_seconds',
+                             'boot_apt_update_seconds', 'boot_nginx_installed_seconds', 'boot_serving_seconds']
+    assert timings['boot_serving_seconds'] == 29.5
+    assert 'boot_firewall_seconds' not in timings
+    assert boot_stage_seconds('', 0) == {}
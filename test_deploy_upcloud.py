@@ -0,0 +1,98 @@
+"""Tests for fleet deploys and the deploy journal in deploy_upcloud.py, against the simulated API."""
+
+import json
+import os
+
+import pytest
+from upcloud_api.errors import UpCloudAPIError
+
+from benchmark import SimulatedDeployer
+from deploy_upcloud import deploy_key, load_fleet_specs, server_hostname, SERVER_PLAN, SERVER_ZONE
+from fake_upcloud import FakeCloudManager
+from inventory import Inventory
+
+SCALE = 0.01
+
+
+@pytest.fixture
+def deployer(tmp_path):
+    manager = FakeCloudManager(boot_seconds=60 * SCALE, stop_seconds=15 * SCALE, serve_seconds=30 * SCALE)
+    return SimulatedDeployer(manager, SCALE, inventory=Inventory(os.path.join(tmp_path, 'inventory.db')))
+
+
+def test_deploy_one_records_a_ready_server(deployer):
+    result = deployer.deploy_one({'title': 'web-1'})
+    assert result['state'] == 'ready' and not result['resumed']
+    record = deployer.inventory.get(result['uuid'])
+    assert record['state'] == 'started' and record['ip'] == result['ip']
+    assert deployer.inventory.journal(deploy_key('web-1', server_hostname('web-1')))['step'] == 'ready'
+
+
+def test_in_flight_deploy_is_resumed(deployer):
+    server, _ = deployer.start_deploy('web-1', verbose=False)
+    # The run died after the create call was journaled
+    assert deployer.inventory.in_flight()[0]['step'] == 'created'
+    result = deployer.deploy_one({'title': 'web-1'})
+    assert result['resumed'] and result['uuid'] == server.uuid
+    assert len(deployer.manager.get_servers()) == 1
+
+
+@pytest.mark.parametrize('step', ['ready', 'failed'])
+def test_finished_deploy_is_not_resumed(deployer, step):
+    server, _ = deployer.start_deploy('web-1', verbose=False)
+    deployer.journal('web-1', step)
+    again, resumed = deployer.start_deploy('web-1', verbose=False)
+    assert resumed is None and again.uuid != server.uuid
+    assert len(deployer.manager.get_servers()) == 2
+
+
+class FailingCreates(FakeCloudManager):
+    """Rejects the create call for the titles in fail_titles."""
+
+    def __init__(self, fail_titles=(), **simulation):
+        super().__init__(**simulation)
+        self.fail_titles = set(fail_titles)
+
+    def create_server(self, server):
+        title = server['title'] if isinstance(server, dict) else server.title
+        if title in self.fail_titles:
+            raise UpCloudAPIError('SERVER_CREATE_FAILED', f"Simulated failure creating {title}")
+        return super().create_server(server)
+
+
+def fleet_deployer(tmp_path, fail_titles=()):
+    manager = FailingCreates(fail_titles, boot_seconds=60 * SCALE, stop_seconds=15 * SCALE,
+                             serve_seconds=30 * SCALE)
+    return SimulatedDeployer(manager, SCALE, inventory=Inventory(os.path.join(tmp_path, 'inventory.db')))
+
+
+def test_fleet_from_a_count_deploys_concurrently(tmp_path):
+    deployer = fleet_deployer(tmp_path)
+    specs = load_fleet_specs(count=10, title='web')
+    results, total_seconds = deployer.deploy_fleet(specs, max_workers=10)
+    assert [r['title'] for r in results] == [f"web-{n:02d}" for n in range(1, 11)]
+    assert all(r['state'] == 'ready' for r in results)
+    for result in results:
+        # Per-server timings are rounded to 0.01 s; total_seconds isn't
+        assert 0 < result['api_started_seconds'] <= result['http_200_seconds'] <= total_seconds + 0.01
+        assert result['create_seconds'] >= 0 and result['total_seconds'] >= result['http_200_seconds']
+    # Ten boots of 0.6 s each, overlapped: far less than 10 x 0.6 s
+    assert total_seconds < 3 * 60 * SCALE
+
+
+def test_fleet_from_a_manifest_keeps_spec_order(tmp_path):
+    manifest = tmp_path / 'fleet.json'
+    manifest.write_text(json.dumps(['web-b', {'title': 'web-a', 'zone': 'de-fra1', 'plan': '2xCPU-4GB'}]))
+    specs = load_fleet_specs(manifest=str(manifest))
+    results, _ = fleet_deployer(tmp_path).deploy_fleet(specs)
+    assert [(r['title'], r['zone'], r['plan']) for r in results] == [
+        ('web-b', SERVER_ZONE, SERVER_PLAN), ('web-a', 'de-fra1', '2xCPU-4GB')]
+    assert [r['state'] for r in results] == ['ready', 'ready']
+
+
+def test_failed_create_does_not_stop_the_fleet(tmp_path):
+    deployer = fleet_deployer(tmp_path, fail_titles={'web-02'})
+    results, _ = deployer.deploy_fleet(load_fleet_specs(count=3, title='web'))
+    assert [r['state'] for r in results] == ['ready', 'failed', 'ready']
+    assert results[1]['uuid'] is None
+    assert sorted(s.title for s in deployer.manager.get_servers()) == ['web-01', 'web-03']
@@ -0,0 +1,52 @@
+"""Tests for golden_image.py's fingerprints and the local record of baked images."""
+
+from cloud_init import CloudInitRenderer
+from golden_image import fingerprint, load_golden_image, save_golden_image
+
+
+def image(zone, image_fingerprint, template_uuid='tmpl-1'):
+    return {'zone': zone, 'fingerprint': image_fingerprint, 'template_uuid': template_uuid,
+            'created': '2026-01-01 00:00:00'}
+
+
+def test_fingerprint_is_stable_and_separates_parts():
+    assert fingerprint('a', 'b') == fingerprint('a', 'b')
+    assert fingerprint('a', 'b') != fingerprint('b', 'a')
+    # Parts are delimited, so moving a character between them changes the hash
+    assert fingerprint('ab', 'c') != fingerprint('a', 'bc')
+
+
+def test_saved_image_is_loaded_per_zone(tmp_path):
+    path = str(tmp_path / 'golden_image.json')
+    assert load_golden_image('f1', 'fi-hel1', path=path) is None
+    save_golden_image(image('fi-hel1', 'f1'), path=path)
+    save_golden_image(image('de-fra1', 'f1', 'tmpl-2'), path=path)
+    save_golden_image(image('fi-hel1', 'f1', 'tmpl-3'), path=path)
+    assert load_golden_image('f1', 'fi-hel1', path=path)['template_uuid'] == 'tmpl-3'
+    assert load_golden_image('f1', 'de-fra1', path=path)['template_uuid'] == 'tmpl-2'
+    assert load_golden_image('f1', 'uk-lon1', path=path) is None
+
+
+def test_a_changed_page_makes_the_saved_image_stale(tmp_path):
+    page_dir = tmp_path / 'web_page'
+    page_dir.mkdir()
+    (page_dir / 'index.html').write_text("<h1>v1</h1>")
+    path = str(tmp_path / 'golden_image.json')
+    baked = fingerprint('template', CloudInitRenderer(page_dir=str(page_dir)).fingerprint('full'))
+    save_golden_image(image('fi-hel1', baked), path=path)
+    assert load_golden_image(baked, 'fi-hel1', path=path) is not None
+
+    (page_dir / 'index.html').write_text("<h1>v2</h1>")
+    current = fingerprint('template', CloudInitRenderer(page_dir=str(page_dir)).fingerprint('full'))
+    assert current != baked
+    assert load_golden_image(current, 'fi-hel1', path=path) is None
+
+
+def test_unreadable_record_is_ignored(tmp_path, capsys):
+    path = tmp_path / 'golden_image.json'
+    path.write_text("{not json")
+    assert load_golden_image('f1', 'fi-hel1', path=str(path)) is None
+    assert 'Ignoring' in capsys.readouterr().out
+    # Saving replaces it
+    save_golden_image(image('fi-hel1', 'f1'), path=str(path))
+    assert load_golden_image('f1', 'fi-hel1', path=str(path))['template_uuid'] == 'tmpl-1'
@@ -0,0 +1,63 @@
+"""Tests for load_test.py: percentiles, response parsing, and a short run against serve_local()."""
+
+import asyncio
+
+import pytest
+
+from load_test import percentile, read_response, run_load, serve_local
+
+
+def test_percentile_edge_cases():
+    assert percentile([], 0.99) is None
+    assert percentile([7], 0.0) == percentile([7], 0.5) == percentile([7], 1.0) == 7
+    samples = list(range(1, 101))
+    assert percentile(samples, 0.50) == 50
+    assert percentile(samples, 0.99) == 99
+    assert percentile(samples, 1.0) == 100
+    # Nearest rank never falls off either end
+    assert percentile(samples, 0.0) == 1
+    assert percentile([1, 2], 0.99) == 2
+
+
+def parse(data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_response(reader)
+    return asyncio.run(run())
+
+
+def test_chunked_response():
+    status, body, keep_alive = parse(
+        b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+        b"5\r\nHello\r\n7;ext=1\r\n, world\r\n0\r\n\r\n")
+    assert (status, body, keep_alive) == (200, b"Hello, world", True)
+
+
+def test_content_length_and_connection_close():
+    status, body, keep_alive = parse(b"HTTP/1.1 404 Not Found\r\nContent-Length: 3\r\n"
+                                     b"Connection: close\r\n\r\nnopeEXTRA")
+    assert (status, body, keep_alive) == (404, b"nop", False)
+
+
+def test_body_until_close_without_a_length():
+    assert parse(b"HTTP/1.0 200 OK\r\n\r\nall of it") == (200, b"all of it", False)
+
+
+def test_truncated_chunk_raises():
+    with pytest.raises(asyncio.IncompleteReadError):
+        parse(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\na\r\nshort")
+
+
+def test_short_run_against_the_local_stand_in():
+    server, url = serve_local()
+    try:
+        report = asyncio.run(run_load(url, connections=4, duration=0.5))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert report['requests'] > 0 and report['errors'] == 0
+    assert report['statuses'] == {200: report['requests']}
+    assert 0 < report['p50_ms'] <= report['p99_ms'] <= report['max_ms']
+    assert report['mean_body_bytes'] > 0
@@ -0,0 +1,81 @@
+"""Tests for metrics.py: phase and call timings, the saved summary and the Prometheus textfile."""
+
+import json
+import time
+
+import pytest
+from upcloud_api.errors import UpCloudAPIError
+
+from fake_upcloud import FakeCloudManager
+from metrics import Metrics, phase_method
+
+
+def test_phases_are_timed_and_summarised():
+    metrics = Metrics('deploy')
+    for _ in range(2):
+        with metrics.phase('boot'):
+            time.sleep(0.02)
+    metrics.record_phase('readiness', 1.5)
+    with pytest.raises(RuntimeError):
+        with metrics.phase('teardown'):
+            raise RuntimeError("still counted")
+
+    phases = metrics.summary()['phases']
+    assert phases['boot']['count'] == 2 and 0.04 <= phases['boot']['total'] < 1
+    assert phases['boot']['min'] <= phases['boot']['mean'] <= phases['boot']['max']
+    assert phases['readiness'] == {'count': 1, 'total': 1.5, 'min': 1.5, 'max': 1.5, 'mean': 1.5}
+    assert phases['teardown']['count'] == 1
+
+
+def test_phase_method_times_on_the_instance():
+    class Deployer:
+        def __init__(self):
+            self.metrics = Metrics('deploy')
+
+        @phase_method('create')
+        def create(self, value):
+            return value * 2
+
+    deployer = Deployer()
+    assert deployer.create(21) == 42
+    assert deployer.metrics.summary()['phases']['create']['count'] == 1
+
+
+def test_instrumented_calls_and_errors():
+    metrics = Metrics('cleanup')
+    manager = metrics.instrument(FakeCloudManager())
+    manager.get_servers()
+    with pytest.raises(UpCloudAPIError):
+        manager.get_server('no-such-server')
+    summary = metrics.summary()
+    assert summary['api_calls']['get_servers']['count'] == 1
+    assert summary['api_calls']['get_server']['count'] == 1
+    assert summary['api_errors'] == {'get_server': 1}
+
+
+def test_saved_json_and_prometheus_textfile(tmp_path):
+    metrics = Metrics('deploy')
+    metrics.record_phase('boot', 2.0)
+    metrics.record_phase('boot', 4.0)
+    metrics.record_call('create_server', 0.25)
+    metrics.record_call('get_server', 0.5, ok=False)
+    json_path, prom_path = tmp_path / 'deploy_metrics.json', tmp_path / 'deploy.prom'
+    metrics.save(str(json_path), prometheus_path=str(prom_path))
+
+    saved = json.loads(json_path.read_text())
+    assert saved['script'] == 'deploy' and saved['phases']['boot']['total'] == 6.0
+    text = prom_path.read_text()
+    assert not (tmp_path / 'deploy.prom.tmp').exists()
+    assert text.endswith('\n')
+    lines = text.splitlines()
+    assert 'upcloud_phase_duration_seconds_sum{script="deploy",phase="boot"} 6.0' in lines
+    assert 'upcloud_phase_duration_seconds_count{script="deploy",phase="boot"} 2' in lines
+    assert 'upcloud_api_call_duration_seconds_sum{script="deploy",call="create_server"} 0.25' in lines
+    assert 'upcloud_api_call_errors_total{script="deploy",call="get_server"} 1' in lines
+    assert any(line.startswith('upcloud_run_wall_seconds{script="deploy"} ') for line in lines)
+    # Every sample has a HELP and TYPE for its metric family
+    families = {line.split()[2] for line in lines if line.startswith('# TYPE')}
+    for line in lines:
+        if not line.startswith('#'):
+            name = line.split('{')[0]
+            assert name in families or name.rsplit('_', 1)[0] in families
@@ -0,0 +1,38 @@
+"""Tests for monitor.py's FleetSeries."""
+
+from monitor import FleetSeries
+
+
+def test_fleet_ignores_dropped_servers():
+    series = FleetSeries(window=4)
+    series.add('a')
+    series.add('b')
+    series.record(0, {'a': 0.010, 'b': 0.900}, {'a': 'started', 'b': 'started'})
+    series.record(1, {'a': 0.010, 'b': 0.900}, {'a': 'started', 'b': 'started'})
+    series.drop('b')
+    series.record(2, {'a': 0.010}, {'a': 'started'})
+    fleet = series.fleet()
+    assert fleet['samples'] == 3
+    assert fleet['availability'] == 1.0
+    assert fleet['p95_ms'] == 10.0
+
+
+def test_reused_slot_starts_empty():
+    series = FleetSeries(window=4)
+    series.add('a')
+    series.record(0, {'a': None}, {'a': 'started'})
+    series.drop('a')
+    series.add('c')
+    series.record(1, {'c': 0.020}, {'c': 'started'})
+    assert series.node('c') == {'samples': 1, 'availability': 1.0, 'p50_ms': 20.0, 'p95_ms': 20.0,
+                                'state': 'started'}
+    assert series.fleet()['samples'] == 1
+
+
+def test_window_wraps():
+    series = FleetSeries(window=2)
+    series.add('a')
+    for n, seconds in enumerate([None, None, 0.005, 0.005]):
+        series.record(n, {'a': seconds}, {'a': 'started'})
+    assert series.node('a')['availability'] == 1.0
+    assert series.node('a')['samples'] == 2
@@ -0,0 +1,71 @@
+"""Tests for placement.py using the simulated zone model."""
+
+import pytest
+
+from fake_upcloud import FakeZoneModel
+from placement import estimate_zones, place, plan_fleet, DEFAULT_READY_SECONDS
+
+ZONES = ['fi-hel1', 'de-fra1', 'us-nyc1']
+
+
+def model(latency, ready_seconds=None):
+    ready_seconds = ready_seconds or {zone: 100.0 for zone in latency}
+    return FakeZoneModel(latency=latency, ready_seconds=ready_seconds, jitter=0)
+
+
+def placement(zone_model, count, zones=ZONES, **kwargs):
+    estimates = estimate_zones(zones, probe=zone_model.probe, history=zone_model.history())
+    return place(count, estimates, **kwargs)[0]
+
+
+def test_single_server_goes_to_the_nearest_zone():
+    near_fra = model({'fi-hel1': 0.040, 'de-fra1': 0.005, 'us-nyc1': 0.120})
+    near_nyc = model({'fi-hel1': 0.040, 'de-fra1': 0.120, 'us-nyc1': 0.005})
+    assert placement(near_fra, 1) == {'de-fra1': 1}
+    assert placement(near_nyc, 1) == {'us-nyc1': 1}
+
+
+def test_fleet_follows_latency_order():
+    zone_model = model({'fi-hel1': 0.020, 'de-fra1': 0.500, 'us-nyc1': 2.000})
+    assignment = placement(zone_model, 10, max_share=0.5)
+    # The nearest zone fills to its share, then the next nearest, and the slowest gets the least
+    assert assignment['fi-hel1'] == 5
+    assert assignment['fi-hel1'] >= assignment['de-fra1'] >= assignment.get('us-nyc1', 0)
+    assert sum(assignment.values()) == 10
+    assert all(zone_model.probes[zone] == 1 for zone in ZONES)
+
+
+def test_slow_provisioning_outweighs_low_latency():
+    zone_model = model({'fi-hel1': 0.005, 'de-fra1': 0.020},
+                       ready_seconds={'fi-hel1': 400.0, 'de-fra1': 100.0})
+    assert placement(zone_model, 1, zones=['fi-hel1', 'de-fra1']) == {'de-fra1': 1}
+
+
+def test_unreachable_zone_falls_back_to_the_next_nearest():
+    zone_model = model({'de-fra1': 0.030, 'us-nyc1': 0.120})
+    assert placement(zone_model, 1) == {'de-fra1': 1}
+    assert placement(zone_model, 4) == {'de-fra1': 2, 'us-nyc1': 2}
+
+
+def test_full_zone_falls_back_in_latency_order():
+    zone_model = model({'fi-hel1': 0.005, 'de-fra1': 0.030, 'us-nyc1': 0.120})
+    assignment = placement(zone_model, 3, max_share=1.0, capacity={'fi-hel1': 1, 'de-fra1': 1})
+    assert assignment == {'fi-hel1': 1, 'de-fra1': 1, 'us-nyc1': 1}
+    with pytest.raises(ValueError):
+        placement(zone_model, 4, max_share=1.0, capacity={'fi-hel1': 1, 'de-fra1': 1, 'us-nyc1': 1})
+
+
+def test_zone_without_history_gets_the_median():
+    zone_model = model({'fi-hel1': 0.005, 'de-fra1': 0.005, 'us-nyc1': 0.005})
+    history = {'fi-hel1': [100.0], 'de-fra1': [300.0]}
+    estimates = estimate_zones(ZONES, probe=zone_model.probe, history=history)
+    assert estimates['us-nyc1']['ready_seconds'] == 200.0
+    assert estimate_zones(['fi-hel1'], probe=zone_model.probe)['fi-hel1']['ready_seconds'] == DEFAULT_READY_SECONDS
+
+
+def test_plan_fleet_fills_in_only_missing_zones():
+    zone_model = model({'fi-hel1': 0.005, 'de-fra1': 0.030})
+    specs = [{'title': 'pinned', 'zone': 'us-nyc1'}] + [{'title': f"web-{n}"} for n in range(4)]
+    assert plan_fleet(specs, ['fi-hel1', 'de-fra1'], probe=zone_model.probe,
+                      history=zone_model.history()) is not None
+    assert [spec['zone'] for spec in specs] == ['us-nyc1', 'fi-hel1', 'de-fra1', 'fi-hel1', 'de-fra1']
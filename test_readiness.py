@@ -0,0 +1,84 @@
+"""Tests for readiness.py against a local HTTP server standing in for a node."""
+
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from readiness import fetch_text_async, wait_until_ready, wait_until_ready_async
+
+
+class NodeHandler(BaseHTTPRequestHandler):
+    """Answers every GET with server.status (503 until cloud-init 'finishes')."""
+
+    def do_GET(self):
+        body = b"<h1>Hello</h1>"
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def node():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), NodeHandler)
+    server.daemon_threads = True
+    server.status = 503
+    server.port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def sync_wait(port, **kwargs):
+    return wait_until_ready('127.0.0.1', http_port=port, **kwargs)
+
+
+def async_wait(port, **kwargs):
+    return asyncio.run(wait_until_ready_async('127.0.0.1', http_port=port, **kwargs))
+
+
+@pytest.fixture(params=[sync_wait, async_wait], ids=['sync', 'async'])
+def wait(request):
+    return request.param
+
+
+def test_ready_once_http_answers_200(node, wait):
+    threading.Timer(0.3, setattr, (node, 'status', 200)).start()
+    result = wait(node.port, timeout=5, interval=0.05, ssh_port=node.port)
+    assert result['ready'] is True
+    assert 0.3 <= result['http_200_seconds'] < 2
+    # The stand-in's port is open from the start, so "SSH" is up before HTTP 200
+    assert result['ssh_up_seconds'] is not None
+    assert result['ssh_up_seconds'] <= result['http_200_seconds']
+
+
+def test_timeout_while_not_serving(node, wait):
+    result = wait(node.port, timeout=0.5, interval=0.1, check_ssh=False)
+    assert result == {'ready': False, 'http_200_seconds': None, 'ssh_up_seconds': None}
+
+
+def test_timeout_when_nothing_listens(wait):
+    port = closed_port()
+    result = wait(port, timeout=0.5, interval=0.1, ssh_port=port)
+    assert result == {'ready': False, 'http_200_seconds': None, 'ssh_up_seconds': None}
+
+
+def test_async_fetch_returns_the_body_only_on_200(node):
+    fetch = lambda port: asyncio.run(fetch_text_async('127.0.0.1', port, path='/boot-stages.txt'))
+    assert fetch(node.port) is None
+    node.status = 200
+    assert fetch(node.port) == "<h1>Hello</h1>"
+    assert fetch(closed_port()) is None
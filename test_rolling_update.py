@@ -0,0 +1,91 @@
+"""Tests for rolling_update.py, with LocalSSHPool standing in for the servers."""
+
+import os
+
+import pytest
+
+from cloud_init import CloudInitRenderer
+from fake_upcloud import LocalSSHPool
+from rolling_update import NGINX_SITE, rolling_update
+
+OLD_CONFIG = b"server { listen 80; }\n"
+NEW_CONFIG = b"server { listen 80 default_server; }\n"
+
+
+def records(count):
+    return [{'uuid': f"uuid-{n}", 'title': f"web-{n}", 'zone': 'fi-hel1', 'plan': '1xCPU-1GB',
+             'ip': f"10.0.0.{n}"} for n in range(1, count + 1)]
+
+
+@pytest.fixture
+def page(tmp_path):
+    page_dir = tmp_path / 'page'
+    page_dir.mkdir()
+    (page_dir / 'index.html').write_text("<h1>{{title}} v1</h1>")
+    return page_dir
+
+
+def read(pool, host, path):
+    with open(os.path.join(pool.host_root(host), path.lstrip('/')), 'rb') as f:
+        return f.read()
+
+
+def write(pool, host, path, content):
+    full = os.path.join(pool.host_root(host), path.lstrip('/'))
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, 'wb') as f:
+        f.write(content)
+
+
+def update(servers, pool, page, **kwargs):
+    return rolling_update(servers, pool, renderer=CloudInitRenderer(page_dir=str(page)),
+                          probe=pool.is_serving, **kwargs)
+
+
+def test_update_then_no_change(tmp_path, page):
+    pool = LocalSSHPool(str(tmp_path / 'hosts'))
+    servers = records(4)
+    summary = update(servers, pool, page, batch_size=2)
+    assert (summary['updated'], summary['failed'], summary['skipped']) == (4, 0, 0)
+    assert read(pool, '10.0.0.3', '/var/www/html/index.html') == b"<h1>web-3 v1</h1>"
+    assert os.path.exists(os.path.join(pool.host_root('10.0.0.3'), 'var/www/html/index.html.gz'))
+
+    # Same content again: every server reports it's already current
+    summary = update(servers, pool, page, batch_size=2)
+    assert (summary['updated'], summary['unchanged']) == (0, 4)
+
+    (page / 'index.html').write_text("<h1>{{title}} v2</h1>")
+    summary = update(servers, pool, page, batch_size=2)
+    assert summary['updated'] == 4
+    assert read(pool, '10.0.0.1', '/var/www/html/index.html') == b"<h1>web-1 v2</h1>"
+
+
+def test_rejected_config_is_rolled_back_and_stops_the_rollout(tmp_path, page):
+    servers = records(3)
+    pool = LocalSSHPool(str(tmp_path / 'hosts'), bad_config={'10.0.0.1'})
+    update(servers, pool, page)
+    for server in servers:
+        write(pool, server['ip'], NGINX_SITE, OLD_CONFIG)
+    (page / 'index.html').write_text("<h1>{{title}} v2</h1>")
+
+    summary = update(servers, pool, page, nginx_config=NEW_CONFIG, batch_size=1)
+    assert (summary['updated'], summary['failed'], summary['skipped']) == (0, 1, 2)
+    # The failed server keeps its old config and page; later batches were never touched
+    assert read(pool, '10.0.0.1', NGINX_SITE) == OLD_CONFIG
+    assert read(pool, '10.0.0.1', '/var/www/html/index.html') == b"<h1>web-1 v1</h1>"
+    assert pool.runs['10.0.0.2'] == 1 and read(pool, '10.0.0.2', NGINX_SITE) == OLD_CONFIG
+
+
+def test_rejected_config_without_a_previous_one_is_removed(tmp_path, page):
+    pool = LocalSSHPool(str(tmp_path / 'hosts'), bad_config={'10.0.0.1'})
+    summary = update(records(1), pool, page, nginx_config=NEW_CONFIG)
+    assert summary['failed'] == 1
+    assert not os.path.exists(os.path.join(pool.host_root('10.0.0.1'), NGINX_SITE.lstrip('/')))
+
+
+def test_unreachable_server_fails(tmp_path, page):
+    pool = LocalSSHPool(str(tmp_path / 'hosts'), unreachable={'10.0.0.2'})
+    summary = update(records(2), pool, page, batch_size=2)
+    assert (summary['updated'], summary['failed']) == (1, 1)
+    # One retry after the refused connection
+    assert pool.runs['10.0.0.2'] == 2
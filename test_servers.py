@@ -0,0 +1,78 @@
+"""Tests for servers.py: ServerInfo parsing, and IPResolver's API calls against the simulated API."""
+
+import os
+
+import pytest
+
+from fake_upcloud import FakeCloudManager
+from inventory import Inventory
+from servers import IPResolver, ServerInfo
+
+
+def create(manager, count):
+    uuids = [manager.api.handle('POST', '/server', {'server': {
+        'title': f"web-{n}", 'hostname': f"web-{n}.example.com", 'zone': 'fi-hel1'}})['server']['uuid']
+        for n in range(count)]
+    manager.api.calls.clear()
+    return uuids
+
+
+@pytest.mark.parametrize('count', [1, 50])
+def test_one_listing_resolves_the_whole_fleet(count):
+    manager = FakeCloudManager()
+    uuids = create(manager, count)
+    resolver = IPResolver(manager)
+    found = resolver.resolve(uuids)
+    assert sorted(found) == sorted(uuids) and all(ipv4 for ipv4, _ in found.values())
+    assert manager.api.calls['GET /ip_address'] == 1
+    assert manager.api.calls['GET /server/{id}'] == 0
+
+    # Cached in memory from then on
+    assert resolver.resolve(uuids) == found
+    assert sum(manager.api.calls.values()) == 1
+
+
+def test_inventory_hits_cost_no_calls(tmp_path):
+    manager = FakeCloudManager()
+    uuids = create(manager, 3)
+    inventory = Inventory(os.path.join(tmp_path, 'inventory.db'))
+    for n, uuid in enumerate(uuids):
+        inventory.add(uuid, f"web-{n}", zone='fi-hel1', plan='1xCPU-1GB')
+    found = IPResolver(manager, inventory=inventory).resolve(uuids)
+    # The fetch saved the addresses, so a fresh resolver (another run) finds them in the inventory
+    assert [inventory.get(uuid)['ip'] for uuid in uuids] == [found[uuid][0] for uuid in uuids]
+    manager.api.calls.clear()
+    resolver = IPResolver(manager, inventory=inventory)
+    assert resolver.resolve(uuids) == found
+    assert sum(manager.api.calls.values()) == 0 and resolver.fetches == 0
+
+
+def test_from_api_reads_the_ip_addresses_dict():
+    info = ServerInfo.from_api({
+        'uuid': 'u-1', 'title': 'web-1', 'zone': 'fi-hel1', 'state': 'started', 'created': '1700000000',
+        'tags': {'tag': ['web']},
+        'ip_addresses': {'ip_address': [
+            {'address': '10.0.0.5', 'family': 'IPv4', 'access': 'utility'},
+            {'address': '94.237.1.2', 'family': 'IPv4', 'access': 'public'},
+            {'address': '2a04:3540::1', 'access': 'public'}]}})
+    assert (info.uuid, info.title, info.state, info.created, info.tags) == (
+        'u-1', 'web-1', 'started', 1700000000.0, ('web',))
+    assert info.ipv4 == '94.237.1.2' and info.ipv6 == '2a04:3540::1'
+
+
+def test_from_api_reads_an_ip_addresses_list():
+    # The shape upcloud_api's Server objects carry, and what some payloads send
+    info = ServerInfo.from_api({'uuid': 'u-2', 'ip_addresses': [
+        {'address': '94.237.1.3', 'family': 'IPv4', 'access': 'public'},
+        {'address': '94.237.1.3', 'family': 'IPv4', 'access': 'public'}]})
+    assert info.ipv4 == '94.237.1.3' and info.ipv6 is None
+    assert len(info.addresses) == 1 and info.tags == () and info.created is None
+
+
+def test_from_api_reads_networking_interfaces():
+    manager = FakeCloudManager()
+    [uuid] = create(manager, 1)
+    payload = manager.api.handle('GET', f'/server/{uuid}')['server']
+    del payload['ip_addresses']
+    assert ServerInfo.from_api(payload).ipv4 == '10.0.0.1'
+    assert ServerInfo.from_api({'uuid': uuid}).addresses == ()
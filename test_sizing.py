@@ -0,0 +1,67 @@
+"""Tests for sizing.py: pricing and costing, and a short --local run against plan stand-ins."""
+
+import pytest
+
+from sizing import hourly_price, main, plan_row, recommend
+
+PRICES = {'prices': {'zone': [
+    {'name': 'fi-hel1', 'server_plan_1xCPU-1GB': {'amount': 1, 'price': 0.744},
+     'server_plan_2xCPU-4GB': {'amount': 1, 'price': 2.976}},
+    {'name': 'de-fra1', 'server_plan_1xCPU-1GB': {'amount': 1, 'price': 0.8}},
+]}}
+
+
+def report(rps, p99_ms=20.0, errors=0):
+    return {'requests_per_second': rps, 'p99_ms': p99_ms, 'errors': errors}
+
+
+def test_hourly_price_converts_cents_to_euros():
+    assert hourly_price(PRICES, 'fi-hel1', '1xCPU-1GB') == pytest.approx(0.00744)
+    assert hourly_price(PRICES, 'fi-hel1', '2xCPU-4GB') == pytest.approx(0.02976)
+    assert hourly_price(PRICES, 'de-fra1', '1xCPU-1GB') == pytest.approx(0.008)
+
+
+def test_unlisted_plans_and_zones_have_no_price():
+    assert hourly_price(PRICES, 'de-fra1', '2xCPU-4GB') is None
+    assert hourly_price(PRICES, 'us-nyc1', '1xCPU-1GB') is None
+    assert hourly_price({}, 'fi-hel1', '1xCPU-1GB') is None
+
+
+def test_plan_row_costs_the_target_load():
+    row = plan_row('1xCPU-1GB', report(500), 0.01, target_rps=2000, utilisation=0.5)
+    assert row['servers_for_target'] == 8
+    assert row['fleet_hourly_eur'] == pytest.approx(0.08)
+    # 500 req/s is 1.8M requests an hour for 0.01 €, rounded to a millionth of a euro
+    assert row['eur_per_1k_requests'] == round(0.01 / 1800, 6)
+
+
+def test_a_plan_that_served_nothing_or_has_no_price_is_never_recommended():
+    idle = plan_row('1xCPU-1GB', report(0), 0.01, target_rps=2000, utilisation=0.6)
+    assert idle['servers_for_target'] is None and idle['eur_per_1k_requests'] is None
+    assert idle['fleet_hourly_eur'] is None
+    unpriced = plan_row('8xCPU-32GB', report(4000), None, target_rps=2000, utilisation=0.6)
+    assert unpriced['servers_for_target'] == 1 and unpriced['fleet_hourly_eur'] is None
+    assert recommend([idle, unpriced], max_p99_ms=1000) is None
+    priced = plan_row('2xCPU-4GB', report(1000), 0.03, target_rps=2000, utilisation=0.6)
+    assert recommend([idle, unpriced, priced], max_p99_ms=1000)['plan'] == '2xCPU-4GB'
+
+
+def test_recommendation_respects_the_p99_limit():
+    cheap_but_slow = plan_row('1xCPU-1GB', report(1000, p99_ms=300), 0.01, target_rps=2000, utilisation=0.6)
+    dearer = plan_row('2xCPU-4GB', report(1000, p99_ms=50), 0.03, target_rps=2000, utilisation=0.6)
+    assert recommend([cheap_but_slow, dearer], max_p99_ms=200)['plan'] == '2xCPU-4GB'
+    assert recommend([cheap_but_slow, dearer], max_p99_ms=500)['plan'] == '1xCPU-1GB'
+    assert recommend([cheap_but_slow, dearer], max_p99_ms=10) is None
+
+
+def test_local_sizing_run(capsys):
+    # 20 connections queue behind one 4 ms worker on 1xCPU (p99 around 80 ms), two on 2xCPU
+    rows, best = main(['--local', '--plans', '1xCPU-1GB,2xCPU-4GB', '--duration', '0.5',
+                       '--connections', '20', '--target-rps', '2000', '--max-p99', '65'])
+    assert [row['plan'] for row in rows] == ['1xCPU-1GB', '2xCPU-4GB']
+    assert all(row['requests_per_second'] > 0 and row['errors'] == 0 for row in rows)
+    assert best is not None and best['p99_ms'] <= 65
+    assert best['plan'] == '2xCPU-4GB'
+    assert 'Recommended' in capsys.readouterr().out
+    # Without the limit, the cheaper fleet of smaller servers wins
+    assert recommend(rows, max_p99_ms=10_000)['plan'] == '1xCPU-1GB'
@@ -0,0 +1,59 @@
+"""Tests for standby_pool.py against the simulated API."""
+
+import os
+import time
+
+import pytest
+
+from benchmark import SimulatedDeployer
+from fake_upcloud import FakeCloudManager
+from inventory import Inventory
+from standby_pool import StandbyPool, STANDBY_TAG, WARMING_TAG, WARMING_TIMEOUT
+
+SCALE = 0.01
+
+
+class NeverServing(SimulatedDeployer):
+    def wait_until_serving(self, server_ip, start_time, timeout=300, verbose=True):
+        return {'ready': False, 'http_200_seconds': None, 'ssh_up_seconds': None}
+
+
+@pytest.fixture
+def manager():
+    return FakeCloudManager(boot_seconds=60 * SCALE, stop_seconds=15 * SCALE, serve_seconds=30 * SCALE)
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    return Inventory(os.path.join(tmp_path, 'inventory.db'))
+
+
+def pool(deployer):
+    return StandbyPool(deployer, size=2, probe=deployer.manager.api.is_serving)
+
+
+def test_hit_after_fill(manager, inventory):
+    standby = pool(SimulatedDeployer(manager, SCALE, inventory=inventory))
+    assert standby.fill() == 2
+    record = standby.acquire(tag='web')
+    assert record['timings']['pool_hit'] is True
+    assert [r['uuid'] for r in inventory.find(tag='web')] == [record['uuid']]
+    assert len(inventory.find(tag=STANDBY_TAG)) == 1
+
+
+def test_failed_miss_is_torn_down(manager, inventory):
+    standby = pool(NeverServing(manager, SCALE, inventory=inventory))
+    assert standby.acquire(tag='web') is None
+    assert manager.get_servers() == []
+    assert inventory.find() == []
+
+
+def test_stale_warming_servers_are_reaped(manager, inventory):
+    standby = pool(SimulatedDeployer(manager, SCALE, inventory=inventory))
+    for title, age in (('stale', WARMING_TIMEOUT + 60), ('warming', 60)):
+        server = manager.api.handle('POST', '/server', {'server': {
+            'title': title, 'hostname': f"{title}.example.com", 'zone': 'fi-hel1', 'plan': '1xCPU-1GB'}})
+        inventory.add(server['server']['uuid'], title, tags=[WARMING_TAG], created=time.time() - age)
+    assert standby.reap() == 1
+    assert [server.title for server in manager.get_servers()] == ['warming']
+    assert [record['title'] for record in inventory.find(tag=WARMING_TAG)] == ['warming']
@@ -0,0 +1,100 @@
+"""Tests for state_waiter.StateWaiter (batched polls, adaptive backoff, deadlines) on the simulated API."""
+
+import time
+
+import pytest
+
+from fake_upcloud import FakeCloudManager
+from state_waiter import StateWaiter
+
+BOOT_SECONDS = 0.3
+
+
+def booting(count):
+    """A simulated account with `count` servers that start BOOT_SECONDS from now."""
+    manager = FakeCloudManager(boot_seconds=BOOT_SECONDS)
+    uuids = [manager.api.handle('POST', '/server', {'server': {
+        'title': f"web-{n}", 'hostname': f"web-{n}.example.com", 'zone': 'fi-hel1'}})['server']['uuid']
+        for n in range(count)]
+    manager.api.calls.clear()
+    return manager, uuids
+
+
+def waiter_for(manager):
+    waiter = StateWaiter(manager, min_interval=0.05, max_interval=0.1, jitter=0)
+    waiter.transition_seconds[('maintenance', 'started')] = BOOT_SECONDS
+    return waiter
+
+
+def test_waiters_share_one_list_call_per_poll():
+    polls = {}
+    for count in (1, 25):
+        manager, uuids = booting(count)
+        waiter = waiter_for(manager)
+        servers = waiter.wait_all(uuids, 'started', timeout=5, from_state='maintenance')
+        assert all(server is not None and server.state == 'started' for server in servers.values())
+        # Every poll is one GET /server, whatever the number of waiters, and nothing else is called
+        assert dict(manager.api.calls) == {'GET /server': waiter.polls}
+        polls[count] = waiter.polls
+    assert polls[25] <= polls[1] + 1
+
+
+def test_first_poll_waits_for_the_expected_transition():
+    manager, uuids = booting(3)
+    waiter = waiter_for(manager)
+    waiter.max_interval = 1.0
+    waiter.wait_all(uuids, 'started', timeout=5, from_state='maintenance')
+    # Scheduled for when the boot should be over, so there are no wasted early polls
+    assert waiter.polls <= 2
+
+
+def test_timeout():
+    manager, uuids = booting(2)
+    waiter = waiter_for(manager)
+    start = time.time()
+    handle = waiter.watch(uuids[0], 'stopped', timeout=0.5, from_state='maintenance')
+    other = waiter.watch(uuids[1], 'started', timeout=5, from_state='maintenance')
+    assert handle.wait() is None
+    assert handle.outcome == 'timeout'
+    assert 0.5 <= time.time() - start < 1.5
+    # The other waiter on the same poller is unaffected
+    assert other.wait() is not None and other.outcome == 'reached'
+
+
+def test_missing_server():
+    manager, _ = booting(1)
+    waiter = waiter_for(manager)
+    handle = waiter.watch('00000000-0000-4000-8000-000000000000', 'started', timeout=5)
+    assert handle.wait() is None
+    assert handle.outcome == 'missing'
+
+
+def test_observed_transitions_tune_the_estimate():
+    manager, uuids = booting(2)
+    waiter = waiter_for(manager)
+    waiter.transition_seconds[('maintenance', 'started')] = 5.0
+    # Started from an unknown state, so the first poll sees 'maintenance' and times the boot from there
+    waiter.wait_all(uuids, 'started', timeout=5)
+    learned = waiter.transition_seconds[('maintenance', 'started')]
+    assert learned < 5.0
+
+
+def test_learned_timings_persist(tmp_path):
+    path = str(tmp_path / 'timings.json')
+    waiter = StateWaiter(FakeCloudManager(), timings_file=path)
+    waiter.record_transition('started', 'stopped', 5.0)
+    waiter.record_transition('started', 'stopped', 5.0)
+    assert waiter.transition_seconds[('started', 'stopped')] < 15.0
+    waiter.save_timings()
+    reloaded = StateWaiter(FakeCloudManager(), timings_file=path)
+    assert reloaded.transition_seconds[('started', 'stopped')] == pytest.approx(
+        waiter.transition_seconds[('started', 'stopped')], abs=0.01)
+
+
+def test_polls_back_off_while_nothing_changes():
+    manager, uuids = booting(1)
+    waiter = StateWaiter(manager, min_interval=0.02, max_interval=0.2, jitter=0)
+    handle = waiter.watch(uuids[0], 'stopped', timeout=1.0)
+    assert handle.wait() is None and handle.outcome == 'timeout'
+    # A fixed 0.02 s poll would make about 50 calls in that second
+    assert waiter.polls < 20
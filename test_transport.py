@@ -0,0 +1,119 @@
+"""Tests for transport.py against a local HTTP stub standing in for the API."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from transport import Transport, create_cloud_manager
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers with the next status in server.script (200 once it runs out)."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def respond(self):
+        with self.server.lock:
+            self.server.requests.append(self.command)
+            status = self.server.script.pop(0) if self.server.script else 200
+        body = json.dumps({'servers': {'server': []}} if status == 200 else
+                          {'error': {'error_code': 'ERROR', 'error_message': 'scripted'}}).encode()
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = []
+    server.script = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/1.3/server"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(stub):
+    t = Transport(pool_size=4, rate_limit=0)
+    for _ in range(20):
+        assert t.request('GET', stub.url).status_code == 200
+    assert len(stub.requests) == 20
+    assert stub.connections == 1
+
+
+def test_rate_limit_spaces_requests(stub):
+    t = Transport(rate_limit=20, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        t.request('GET', stub.url)
+    # The first request uses the burst token; the other five wait 1/20 s each
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+
+
+def test_429_is_retried_for_any_method(stub):
+    stub.script = [429, 429, 200, 429, 200]
+    t = Transport(rate_limit=0, max_retries=4)
+    assert t.request('GET', stub.url).status_code == 200
+    assert t.request('POST', stub.url, data='{}').status_code == 200
+    assert stub.requests == ['GET', 'GET', 'GET', 'POST', 'POST']
+    assert t.retries == 3
+
+
+def test_5xx_is_retried_only_for_idempotent_methods(stub):
+    stub.script = [503, 502, 200, 503]
+    t = Transport(rate_limit=0, max_retries=4, backoff=0.001)
+    assert t.request('GET', stub.url).status_code == 200
+    assert t.request('POST', stub.url, data='{}').status_code == 503
+    assert stub.requests == ['GET', 'GET', 'GET', 'POST']
+
+
+def test_retries_give_up_after_max_retries(stub):
+    stub.script = [503] * 10
+    t = Transport(rate_limit=0, max_retries=2, backoff=0.001)
+    assert t.request('GET', stub.url).status_code == 503
+    assert len(stub.requests) == 3
+
+
+def test_settings_come_from_env_set_after_import(monkeypatch):
+    # The scripts import transport before load_dotenv() runs
+    monkeypatch.setenv('UPCLOUD_MAX_RETRIES', '7')
+    monkeypatch.setenv('UPCLOUD_RATE_LIMIT', '0')
+    t = Transport()
+    assert t.max_retries == 7
+    assert t.limiter is None
+    assert Transport(max_retries=1).max_retries == 1
+
+
+def test_cloud_manager_goes_through_the_transport(stub):
+    stub.script = [429]
+    t = Transport(rate_limit=0)
+    manager = create_cloud_manager('user', 'password', transport=t)
+    manager.api.api_root = stub.url.rsplit('/', 1)[0]
+    assert manager.get_servers() == []
+    assert stub.requests == ['GET', 'GET']
+    assert stub.connections == 1
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+UpCloud API Transport
+One shared HTTP layer for every CloudManager in the process: a pooled
+keep-alive requests.Session (no new TLS handshake per call), a client-side
+token-bucket rate limiter, and retries with jittered exponential backoff
+on 429 and 5xx responses.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from upcloud_api import CloudManager
+from upcloud_api.api import API
+
+# Defaults, overridable from .env. They're read when a client is built rather
+# than at import, since the scripts import this module before loading .env.
+DEFAULTS = {
+    'UPCLOUD_POOL_SIZE': 20,
+    'UPCLOUD_RATE_LIMIT': 10.0,  # requests per second
+    'UPCLOUD_RATE_BURST': 20,
+    'UPCLOUD_MAX_RETRIES': 4,
+}
+
+# Methods that are safe to resend after a 5xx or a dropped connection.
+# POST is only retried on 429, which means the request was never processed.
+IDEMPOTENT_METHODS = {'GET', 'PUT', 'DELETE'}
+
+
+def setting(name, value=None):
+    """value if given, else the environment variable name, else its default."""
+    if value is not None:
+        return value
+    default = DEFAULTS[name]
+    return type(default)(os.getenv(name, default))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a token if one is available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class Transport:
+    """Pooled session, rate limiter and retry policy shared by API clients."""
+
+    def __init__(self, pool_size=None, rate_limit=None, burst=None, max_retries=None,
+                 backoff=0.5, max_backoff=30.0):
+        """Settings left as None come from .env (UPCLOUD_POOL_SIZE etc.) or DEFAULTS."""
+        pool_size = setting('UPCLOUD_POOL_SIZE', pool_size)
+        rate_limit = setting('UPCLOUD_RATE_LIMIT', rate_limit)
+        burst = setting('UPCLOUD_RATE_BURST', burst)
+        max_retries = setting('UPCLOUD_MAX_RETRIES', max_retries)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the pool, retrying 429/5xx with jittered backoff."""
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire()
+            try:
+                res = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                self._sleep(attempt)
+                attempt += 1
+                continue
+
+            retryable = res.status_code == 429 or (
+                res.status_code >= 500 and method in IDEMPOTENT_METHODS)
+            if not retryable or attempt >= self.max_retries:
+                return res
+            self._sleep(attempt, res.headers.get('Retry-After'))
+            attempt += 1
+
+    def _sleep(self, attempt, retry_after=None):
+        self.retries += 1
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            # Full jitter: spreads retries out so clients don't stampede together
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        time.sleep(delay)
+
+
+class PooledAPI(API):
+    """upcloud_api's API class sending everything through a shared Transport."""
+
+    def __init__(self, token, timeout=None, transport=None):
+        super().__init__(token, timeout)
+        self.transport = transport or shared_transport()
+
+    def api_request(self, method, endpoint, body=None, params=None, timeout=-1):
+        if method not in {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}:
+            raise Exception('Invalid/Forbidden HTTP method')
+
+        url = f'{self.api_root}{endpoint}'
+        headers = {'Authorization': self.token, 'User-Agent': self.user_agent}
+
+        if body:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        else:
+            data = None
+
+        call_timeout = timeout if timeout != -1 else self.timeout
+
+        res = self.transport.request(method, url, data=data, params=params, headers=headers,
+                                     timeout=call_timeout)
+
+        res_json = res.json() if res.text else {}
+        # Reuse the library's own error handling (name-mangled private method)
+        return self._API__error_middleware(res, res_json)
+
+
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def shared_transport():
+    """The process-wide Transport, created on first use."""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = Transport()
+        return _shared_transport
+
+
+def create_cloud_manager(username, password, timeout=60, transport=None):
+    """Build a CloudManager whose API calls go through the shared pooled transport."""
+    manager = CloudManager(username, password, timeout=timeout)
+    manager.api = PooledAPI(manager.api.token, timeout, transport)
+    return manager
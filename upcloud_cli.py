@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+UpCloud Command Line
+One entry point for everything in this project:
+
+    python upcloud_cli.py deploy [--count N ...]   create a server or a fleet
+    python upcloud_cli.py cleanup [--bulk ...]     delete servers
+    python upcloud_cli.py status [--live]          show what we've deployed
+    python upcloud_cli.py list [--title GLOB]      list servers in the account
+    python upcloud_cli.py place --count N --zones  plan a multi-zone fleet
+    python upcloud_cli.py pool fill|run|take|stats  warm standby servers
+    python upcloud_cli.py update [--batch-size N]  push web_page/ to running servers
+    python upcloud_cli.py loadtest URL|--local     req/s and p99 of a server
+    python upcloud_cli.py monitor [--once]         probe deployed servers on a schedule
+    python upcloud_cli.py autoscale run|simulate   grow and shrink a fleet with its load
+    python upcloud_cli.py size --target-rps N      recommend a plan from load tests
+    python upcloud_cli.py apply desired.json       make the account match a desired-state file
+    python upcloud_cli.py bench [...]              offline benchmark
+
+Only the standard library is imported up front. The UpCloud client,
+requests and python-dotenv are imported, and .env is read, only by the
+subcommands that talk to the API, so quick commands like `status` stay
+fast enough to run from cron and CI.
+"""
+
+import os
+import sys
+import time
+
+COMMANDS = {
+    'deploy': "create a server, or a fleet with --count/--manifest",
+    'cleanup': "delete servers (interactive, or --bulk)",
+    'status': "show deployed servers from the local inventory",
+    'list': "list the servers in the account",
+    'place': "plan how a fleet would be spread across zones",
+    'pool': "keep warm standby servers and hand them out",
+    'update': "push web_page/ (and an nginx config) to running servers, batch by batch",
+    'loadtest': "measure req/s and latency percentiles of a server",
+    'monitor': "probe deployed servers on a schedule and report latency and availability",
+    'autoscale': "grow and shrink a fleet from measured load, or simulate it against a trace",
+    'size': "load-test candidate plans and recommend the cheapest for a target load",
+    'apply': "create, update and delete servers to match a desired-state file",
+    'bench': "run the offline benchmark against a simulated API",
+}
+
+
+def _load_env():
+    """Read .env into the environment (deferred until a command needs credentials)."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def cmd_deploy(argv):
+    import deploy_upcloud
+    deploy_upcloud.main(argv)
+
+
+def cmd_cleanup(argv):
+    import cleanup_server
+    cleanup_server.main(argv)
+
+
+def cmd_loadtest(argv):
+    import load_test
+    load_test.main(argv)
+
+
+def cmd_monitor(argv):
+    import monitor
+    monitor.main(argv)
+
+
+def cmd_autoscale(argv):
+    import autoscaler
+    autoscaler.main(argv)
+
+
+def cmd_size(argv):
+    import sizing
+    sizing.main(argv)
+
+
+def cmd_apply(argv):
+    import apply
+    apply.main(argv)
+
+
+def cmd_bench(argv):
+    import benchmark
+    benchmark.main(argv)
+
+
+def cmd_status(argv):
+    """Show deployed servers from the inventory; --live also checks them with the API."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='upcloud_cli.py status', description=COMMANDS['status'])
+    parser.add_argument('--title', help="title glob, e.g. 'UpCloud-WebServer*'")
+    parser.add_argument('--zone', help="only servers in this zone")
+    parser.add_argument('--tag', help="only servers with this tag")
+    parser.add_argument('--all', action='store_true', help="include deleted servers")
+    parser.add_argument('--live', action='store_true',
+                        help="fetch the current state of each match from the API")
+    parser.add_argument('--max-age', type=float, default=0,
+                        help="with --live, skip servers checked less than this many seconds ago")
+    args = parser.parse_args(argv)
+
+    from inventory import Inventory, INVENTORY_FILE
+    inventory = Inventory(INVENTORY_FILE)
+    find = dict(title=args.title, zone=args.zone, tag=args.tag, include_deleted=args.all)
+    records = inventory.find(**find)
+
+    if not records:
+        print(f"ℹ️  No deployed servers in {INVENTORY_FILE} (run: python upcloud_cli.py deploy)")
+        return
+
+    if args.live:
+        manager = _manager()
+        if manager is None:
+            return
+        live = [r for r in records if not r['deleted']]
+        servers, fresh = inventory.reconcile(manager, live, max_age=args.max_age)
+        print(f"🔄 Checked {len(live) - len(fresh)} servers with the API, {len(servers)} still exist")
+        records = inventory.find(**find)
+
+    print(f"🖥️  {len(records)} servers:")
+    for record in records:
+        age_hours = (time.time() - record['created']) / 3600
+        ipv6 = f" / {record['ipv6']}" if record['ipv6'] else ''
+        print(f"   • {record['title']} ({record['uuid']}) - {record['ip']}{ipv6} - "
+              f"{record['state']} - {record['zone']} - {age_hours:.1f}h old")
+
+    by_state, by_zone = {}, {}
+    for record in records:
+        by_state[record['state']] = by_state.get(record['state'], 0) + 1
+        by_zone[record['zone']] = by_zone.get(record['zone'], 0) + 1
+    print(f"📊 By state: {', '.join(f'{state} {n}' for state, n in sorted(by_state.items(), key=str))}")
+    print(f"   By zone: {', '.join(f'{zone} {n}' for zone, n in sorted(by_zone.items(), key=str))}")
+
+
+def cmd_list(argv):
+    """List servers in the account, optionally filtered by title glob and zone."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='upcloud_cli.py list', description=COMMANDS['list'])
+    parser.add_argument('--title', help="title glob, e.g. 'UpCloud-WebServer*'")
+    parser.add_argument('--zone', help="only servers in this zone")
+    parser.add_argument('--adopt', action='store_true',
+                        help="record the listed servers in the inventory so cleanup/status find them")
+    args = parser.parse_args(argv)
+
+    manager = _manager()
+    if manager is None:
+        return
+
+    from cleanup_server import select_servers
+    servers = select_servers(manager.get_servers(), title=args.title, zone=args.zone)
+    if not servers:
+        print("   No servers found")
+    for server in servers:
+        print(f"   • {server.title} ({server.uuid}) - {server.state} - {server.zone}")
+
+    if args.adopt and servers:
+        from inventory import Inventory, INVENTORY_FILE
+        Inventory(INVENTORY_FILE).adopt(servers)
+        print(f"📄 Recorded {len(servers)} servers in {INVENTORY_FILE}")
+
+
+def cmd_place(argv):
+    """Show the zone placement for a fleet without deploying anything."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='upcloud_cli.py place', description=COMMANDS['place'])
+    parser.add_argument('--count', type=int, required=True, help="fleet size")
+    parser.add_argument('--zones', required=True, help="comma-separated candidate zones")
+    parser.add_argument('--max-share', type=float, default=0.5,
+                        help="most of the fleet any one zone may take (default 0.5)")
+    parser.add_argument('--simulate', action='store_true',
+                        help="use simulated zone latencies and deploy times instead of probing")
+    args = parser.parse_args(argv)
+
+    from placement import plan_fleet
+    specs = [{'title': f"UpCloud-WebServer-{i:02d}"} for i in range(1, args.count + 1)]
+    zones = args.zones.split(',')
+    if args.simulate:
+        from fake_upcloud import FakeZoneModel
+        model = FakeZoneModel()
+        plan_fleet(specs, zones, probe=model.probe, history=model.history(), max_share=args.max_share)
+    else:
+        from inventory import Inventory, INVENTORY_FILE
+        plan_fleet(specs, zones, inventory=Inventory(INVENTORY_FILE), max_share=args.max_share)
+
+
+def cmd_pool(argv):
+    """Fill the standby pool, keep it filled, take a server from it or show its stats."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='upcloud_cli.py pool', description=COMMANDS['pool'])
+    parser.add_argument('action', choices=['fill', 'run', 'take', 'stats'],
+                        help="fill once, keep filling until Ctrl+C, hand out one server, or report")
+    parser.add_argument('--size', type=int, default=3, help="standby servers to keep (default 3)")
+    parser.add_argument('--ttl', type=float, default=2.0,
+                        help="hours a standby server may sit idle before it's deleted (default 2)")
+    parser.add_argument('--tag', default='in-use', help="tag for the handed-out server (take)")
+    parser.add_argument('--interval', type=float, default=60,
+                        help="seconds between replenish checks (run)")
+    args = parser.parse_args(argv)
+
+    from inventory import Inventory, INVENTORY_FILE
+    from standby_pool import pool_stats
+    if args.action == 'stats':
+        stats = pool_stats(Inventory(INVENTORY_FILE))
+        print(f"🔥 Standby pool: {stats['standby']} ready, {stats['warming']} warming")
+        if stats['handouts']:
+            print(f"   Hand-outs: {stats['handouts']} ({stats['hit_rate']:.0%} from the pool)")
+            if stats['hits']:
+                print(f"   Time to serve from the pool: {stats['hit_serve_seconds']:.3f}s (median)")
+            if stats['misses']:
+                print(f"   Time to serve on a miss: {stats['miss_serve_seconds']:.1f}s (median)")
+        return
+
+    from deploy_upcloud import UpCloudDeployer
+    from standby_pool import StandbyPool
+    pool = StandbyPool(UpCloudDeployer(), size=args.size, ttl=args.ttl * 3600)
+    if args.action == 'fill':
+        print(f"✅ {pool.fill()} standby servers added")
+    elif args.action == 'take':
+        record = pool.acquire(tag=args.tag)
+        if record:
+            source = "pool" if record['timings']['pool_hit'] else "fresh deploy"
+            print(f"✅ {record['title']} ({record['uuid']}) - http://{record['ip']} "
+                  f"from the {source} in {record['timings']['time_to_serve_seconds']:.2f}s")
+            pool.fill()
+    else:
+        pool.start(interval=args.interval)
+        print(f"🔥 Keeping {args.size} standby servers warm (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pool.stop()
+
+
+def cmd_update(argv):
+    """Roll the current web_page/ out to inventoried servers over SSH."""
+    import argparse
+    parser = argparse.ArgumentParser(prog='upcloud_cli.py update', description=COMMANDS['update'])
+    parser.add_argument('--title', help="title glob, e.g. 'UpCloud-WebServer*'")
+    parser.add_argument('--zone', help="only servers in this zone")
+    parser.add_argument('--tag', help="only servers with this tag")
+    parser.add_argument('--nginx-config', metavar='PATH',
+                        help="also install this file as the nginx site config (checked with nginx -t)")
+    parser.add_argument('--batch-size', type=int, default=5,
+                        help="servers per batch; each batch is health-checked before the next (default 5)")
+    parser.add_argument('--workers', type=int, default=5, help="servers updated at a time (default 5)")
+    parser.add_argument('--health-timeout', type=float, default=60,
+                        help="seconds a server has to serve the page after its update (default 60)")
+    args = parser.parse_args(argv)
+
+    from inventory import Inventory, INVENTORY_FILE
+    records = Inventory(INVENTORY_FILE).find(title=args.title, zone=args.zone, tag=args.tag)
+    if not records:
+        print(f"ℹ️  No matching servers in {INVENTORY_FILE}")
+        return
+    nginx_config = None
+    if args.nginx_config:
+        with open(args.nginx_config, 'rb') as f:
+            nginx_config = f.read()
+
+    from rolling_update import SSHPool, rolling_update
+    with SSHPool() as pool:
+        rolling_update(records, pool, nginx_config=nginx_config, batch_size=args.batch_size,
+                       workers=args.workers, health_timeout=args.health_timeout)
+
+
+def _manager():
+    """Build an API client from .env, or print why we can't."""
+    _load_env()
+    username = os.getenv('UPCLOUD_USERNAME')
+    password = os.getenv('UPCLOUD_PASSWORD')
+    if not username or not password:
+        print("❌ Error: UpCloud credentials not found!")
+        print("Please make sure your .env file is configured.")
+        return None
+
+    from transport import create_cloud_manager
+    return create_cloud_manager(username, password)
+
+
+HANDLERS = {
+    'deploy': cmd_deploy,
+    'cleanup': cmd_cleanup,
+    'status': cmd_status,
+    'list': cmd_list,
+    'place': cmd_place,
+    'pool': cmd_pool,
+    'update': cmd_update,
+    'loadtest': cmd_loadtest,
+    'monitor': cmd_monitor,
+    'autoscale': cmd_autoscale,
+    'size': cmd_size,
+    'apply': cmd_apply,
+    'bench': cmd_bench,
+}
+
+
+def usage():
+    lines = ["usage: upcloud_cli.py <command> [options]", "", "commands:"]
+    lines += [f"  {name:<10} {help_text}" for name, help_text in COMMANDS.items()]
+    lines += ["", "Run `upcloud_cli.py <command> --help` for a command's options."]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    if argv[0] not in HANDLERS:
+        print(f"❌ Unknown command: {argv[0]}\n")
+        print(usage())
+        return 2
+
+    HANDLERS[argv[0]](argv[1:])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())